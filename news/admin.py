@@ -1,8 +1,11 @@
 from django.contrib import admin
 from .models import CustomUser, Publisher, Article, Newsletter
+from .models import ApiToken, DeliveryJob
 
 
 admin.site.register(CustomUser)
 admin.site.register(Publisher)
 admin.site.register(Article)
 admin.site.register(Newsletter)
+admin.site.register(DeliveryJob)
+admin.site.register(ApiToken)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class NewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'news'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import checks, signals  # noqa: F401
+        post_migrate.connect(signals.provision_groups_after_migrate,
+                             sender=self)
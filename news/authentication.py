@@ -0,0 +1,127 @@
+"""API authentication that avoids hashing a password on every request.
+
+:class:`TokenAuthentication` accepts ``Authorization: Token <key>`` (or
+``Bearer <key>``) for keys issued with :meth:`ApiToken.issue`. The key's
+SHA-256 digest is looked up through a unique index. The token's user id
+and the user's ``is_active`` and ``role`` are cached, never the user row
+itself, so a warm request runs no query at all; other user fields load
+on first access. Cached entries are dropped when a token is deleted or
+its user saved or deleted; the cache must be shared by all processes for
+that to reach every worker (see :mod:`news.checks`). ``QuerySet.update()``
+sends no signals, so code deactivating users in bulk must call
+:func:`forget_user` for each of them, or they keep API access until
+``NEWS_API_TOKEN_CACHE_TIMEOUT`` runs out.
+
+Each API view takes its authentication classes from
+:func:`api_authentication`, so schemes can be switched per view in
+settings.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.authentication import get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import metrics
+from .models import ApiToken, CustomUser
+
+PREFIX = 'news:token'
+DEFAULT_AUTHENTICATION = (
+    'news.authentication.TokenAuthentication',
+    'rest_framework.authentication.BasicAuthentication',
+)
+
+
+def _cache():
+    return caches[getattr(settings, 'NEWS_API_TOKEN_CACHE_ALIAS',
+                          'default')]
+
+
+def _timeout():
+    return getattr(settings, 'NEWS_API_TOKEN_CACHE_TIMEOUT', 300)
+
+
+def _token_key(key_hash):
+    return f'{PREFIX}:key:{key_hash}'
+
+
+def _user_key(user_id):
+    return f'{PREFIX}:user:{user_id}'
+
+
+def forget_token(key_hash):
+    _cache().delete(_token_key(key_hash))
+
+
+def forget_user(user_id):
+    """Drops the cached state of ``user_id`` after it changed."""
+    _cache().delete(_user_key(user_id))
+
+
+def _cached_user(user_id, state):
+    # A deferred instance, as from .only(): the rest loads when read.
+    is_active, role = state
+    return CustomUser.from_db(None, ['id', 'is_active', 'role'],
+                              [user_id, is_active, role])
+
+
+def api_authentication(view_name):
+    """Returns the authentication classes for API view ``view_name``.
+
+    ``NEWS_API_VIEW_AUTHENTICATION`` maps view names to lists of class
+    paths; other views use ``NEWS_API_AUTHENTICATION``.
+    """
+    per_view = getattr(settings, 'NEWS_API_VIEW_AUTHENTICATION', {})
+    paths = per_view.get(view_name, getattr(
+        settings, 'NEWS_API_AUTHENTICATION', DEFAULT_AUTHENTICATION))
+    return [import_string(path) for path in paths]
+
+
+class TokenAuthentication(BaseAuthentication):
+    """Authenticates requests carrying an :class:`ApiToken` key."""
+    keywords = ('token', 'bearer')
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth:
+            return None
+        try:
+            keyword = auth[0].lower().decode()
+        except UnicodeError:
+            raise AuthenticationFailed("Invalid token header.")
+        if keyword not in self.keywords:
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed("Invalid token header.")
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed("Invalid token header.")
+        return self.authenticate_credentials(key)
+
+    def authenticate_credentials(self, key):
+        key_hash = ApiToken.hash_key(key)
+        cache = _cache()
+        user_id = cache.get(_token_key(key_hash))
+        if user_id is None:
+            user_id = ApiToken.objects.filter(key_hash=key_hash) \
+                .values_list('user_id', flat=True).first()
+            if user_id is None:
+                metrics.incr('api_token_failures')
+                raise AuthenticationFailed("Invalid token.")
+            cache.set(_token_key(key_hash), user_id, _timeout())
+        state = cache.get(_user_key(user_id))
+        if state is None:
+            state = CustomUser.objects.filter(pk=user_id) \
+                .values_list('is_active', 'role').first()
+            if state is None:
+                raise AuthenticationFailed("Invalid token.")
+            cache.set(_user_key(user_id), state, _timeout())
+        user = _cached_user(user_id, state)
+        if not user.is_active:
+            raise AuthenticationFailed("User inactive or deleted.")
+        return user, key_hash
+
+    def authenticate_header(self, request):
+        return 'Token'
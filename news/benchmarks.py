@@ -0,0 +1,138 @@
+"""Micro-benchmarks run with ``manage.py benchmark``.
+
+A suite is a function taking a row count and returning
+``[(label, seconds), ...]``; the first entry is the baseline the others
+are compared against. Suites seed their own data inside a transaction
+that is always rolled back, so they can run against a development
+database.
+"""
+import base64
+import time
+
+from django.db import transaction
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from rest_framework_xml.renderers import XMLRenderer
+from .authentication import TokenAuthentication
+from .models import ApiToken, Article, CustomUser, Publisher
+from .renderers import FastJSONRenderer, FastXMLRenderer
+from .renderers import StreamingJSONRenderer, StreamingXMLRenderer
+from .serializers import ArticleSerializer, RowSerializer
+
+SUITES = {}
+
+
+def suite(name):
+    """Registers a benchmark suite under ``name``."""
+    def register(func):
+        SUITES[name] = func
+        return func
+    return register
+
+
+def timed(func, repeat=3):
+    """Returns the best wall-clock time of ``repeat`` calls to ``func``."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(name, rows):
+    """Runs suite ``name`` on ``rows`` rows and rolls its data back."""
+    with transaction.atomic():
+        try:
+            return SUITES[name](rows)
+        finally:
+            transaction.set_rollback(True)
+
+
+def seed_articles(rows):
+    """Creates ``rows`` approved articles with a typical body length."""
+    publisher = Publisher.objects.create(name='Benchmark Publisher')
+    journalist = CustomUser.objects.create(
+        username='benchmark-journalist', role='journalist')
+    Article.objects.bulk_create(
+        [Article(title=f'Article {i}', content='Lorem ipsum dolor. ' * 100,
+                 publisher=publisher,
+                 journalist=journalist if i % 2 else None, approved=True)
+         for i in range(rows)],
+        batch_size=1000)
+    return Article.objects.filter(publisher=publisher).order_by('-id')
+
+
+@suite('serializers')
+def serializers_suite(rows):
+    articles = seed_articles(rows)
+    fast = RowSerializer(ArticleSerializer())
+
+    def model_serializer():
+        return ArticleSerializer(articles.all(), many=True).data
+
+    def row_serializer():
+        return [fast.to_representation(row)
+                for row in fast.rows(articles.all())]
+
+    return [
+        ('ArticleSerializer', timed(model_serializer)),
+        ('RowSerializer', timed(row_serializer)),
+    ]
+
+
+def _listing(rows):
+    fast = RowSerializer(ArticleSerializer())
+    return [fast.to_representation(row)
+            for row in fast.rows(seed_articles(rows))]
+
+
+@suite('json')
+def json_suite(rows):
+    data = _listing(rows)
+    stream = StreamingJSONRenderer()
+    return [
+        ('JSONRenderer', timed(lambda: JSONRenderer().render(data))),
+        ('FastJSONRenderer', timed(lambda: FastJSONRenderer().render(data))),
+        ('StreamingJSONRenderer',
+         timed(lambda: b''.join(stream.stream(None, iter(data))))),
+    ]
+
+
+@suite('xml')
+def xml_suite(rows):
+    data = _listing(rows)
+    stream = StreamingXMLRenderer()
+    return [
+        ('XMLRenderer', timed(lambda: XMLRenderer().render(data))),
+        ('FastXMLRenderer', timed(lambda: FastXMLRenderer().render(data))),
+        ('StreamingXMLRenderer',
+         timed(lambda: b''.join(stream.stream(None, iter(data))))),
+    ]
+
+
+@suite('auth')
+def auth_suite(rows):
+    """Authenticates ``rows`` requests, capped at 100 as Basic is slow."""
+    count = min(rows, 100)
+    CustomUser.objects.create_user(username='benchmark-reader',
+                                   password='benchmark-pass', role='reader')
+    _, key = ApiToken.issue(CustomUser.objects.get(
+        username='benchmark-reader'))
+    credentials = base64.b64encode(b'benchmark-reader:benchmark-pass')
+    factory = APIRequestFactory()
+    basic = factory.get('/', HTTP_AUTHORIZATION=b'Basic ' + credentials)
+    token = factory.get('/', HTTP_AUTHORIZATION=f'Token {key}')
+
+    def authenticate(backend, request):
+        for _ in range(count):
+            backend.authenticate(request)
+
+    return [
+        (f'BasicAuthentication x{count}',
+         timed(lambda: authenticate(BasicAuthentication(), basic), 1)),
+        (f'TokenAuthentication x{count}',
+         timed(lambda: authenticate(TokenAuthentication(), token), 1)),
+    ]
@@ -0,0 +1,54 @@
+"""System checks for the news app's deployment settings."""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+FILE_CACHE = 'django.core.cache.backends.filebased.FileBasedCache'
+
+
+def _process_local(alias):
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    return backend in PROCESS_LOCAL_CACHES
+
+
+def _unsized_file_cache(alias):
+    config = settings.CACHES.get(alias, {})
+    return config.get('BACKEND') == FILE_CACHE \
+        and 'MAX_ENTRIES' not in config.get('OPTIONS', {})
+
+
+SHARED_CACHE_SETTINGS = (
+    ('NEWS_FEED_CACHE_ALIAS', 'news.W001',
+     "Feed versions bumped by one process (such as the delivery worker) "
+     "are invisible to the others, so ETags go stale."),
+    ('NEWS_API_TOKEN_CACHE_ALIAS', 'news.W002',
+     "Revoked tokens and deactivated users stay valid in other worker "
+     "processes until their cache entries expire."),
+)
+
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    """Warns when cache invalidation cannot reach other processes."""
+    warnings = []
+    for name, check_id, problem in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name, 'default')
+        if _process_local(alias):
+            warnings.append(Warning(
+                f"{name} ({alias!r}) uses a process-local cache.",
+                hint=f"{problem} Use Redis or Memcached.",
+                id=check_id))
+    aliases = {getattr(settings, name, 'default')
+               for name, _, _ in SHARED_CACHE_SETTINGS}
+    for alias in sorted(filter(_unsized_file_cache, aliases)):
+        warnings.append(Warning(
+            f"Cache {alias!r} is a file cache limited to the default 300 "
+            "entries.",
+            hint="The news app keeps a version key per reader, publisher, "
+                 "journalist, article and newsletter, so the cache keeps "
+                 "culling them and feeds miss. Use Redis or Memcached, or "
+                 "set OPTIONS['MAX_ENTRIES'] above that key count.",
+            id='news.W003'))
+    return warnings
@@ -0,0 +1,44 @@
+"""Conditional GET (ETag / Last-Modified) for the API's feed listings.
+
+Validators are derived from the cache versions kept by
+:mod:`news.feed_cache`, so an unchanged feed is answered with a 304
+before any query or serialization runs.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from . import metrics
+
+
+def validators(request, state):
+    """Returns ``(etag, last_modified)`` for a listing with ``state``.
+
+    ``state`` is a ``(fingerprint, last_modified)`` pair from
+    :mod:`news.feed_cache`. The ETag also covers the query string and the
+    negotiated format, so each page and representation has its own.
+    """
+    fingerprint, last_modified = state
+    raw = '|'.join((fingerprint, request.accepted_renderer.format,
+                    request.META.get('QUERY_STRING', '')))
+    etag = quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+    return etag, int(last_modified)
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept', 'Authorization'))
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """Returns a 304 if the client's copy is current, otherwise None."""
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        return None
+    metrics.incr('api_not_modified')
+    return add_validators(response, etag, last_modified)
@@ -0,0 +1,97 @@
+"""Lightweight, paginated sections for the editor dashboard.
+
+Every section selects only ``id``, ``title`` and ``date`` and is paged
+with LIMIT/OFFSET, and all four section counts come from one grouped
+``UNION ALL`` query. Unapproved sections list the oldest items first so
+they work as an approval queue.
+"""
+from django.conf import settings
+from django.db.models import Count, Value, CharField
+
+from .models import Article, Newsletter
+
+SECTIONS = {
+    'unapproved_articles': (Article, False, 'Unapproved Articles'),
+    'approved_articles': (Article, True, 'Approved Articles'),
+    'unapproved_newsletters': (Newsletter, False, 'Unapproved Newsletters'),
+    'approved_newsletters': (Newsletter, True, 'Approved Newsletters'),
+}
+
+
+def page_size():
+    return getattr(settings, 'NEWS_DASHBOARD_PAGE_SIZE', 25)
+
+
+def section_counts():
+    """Returns ``{section: count}`` for all sections in one query."""
+    def grouped(model):
+        return (model.objects.order_by()
+                .annotate(kind=Value(model._meta.model_name,
+                                     output_field=CharField()))
+                .values('kind', 'approved').annotate(total=Count('id')))
+
+    counts = {key: 0 for key in SECTIONS}
+    for row in grouped(Article).union(grouped(Newsletter), all=True):
+        state = 'approved' if row['approved'] else 'unapproved'
+        counts[f"{state}_{row['kind']}s"] = row['total']
+    return counts
+
+
+def _page_number(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def load_section(key, page, total):
+    """Returns the template context for one page of section ``key``."""
+    model, approved, label = SECTIONS[key]
+    size = page_size()
+    page = _page_number(page)
+    ordering = ('-date', '-id') if approved else ('date', 'id')
+    offset = (page - 1) * size
+    items = list(model.objects.filter(approved=approved)
+                 .order_by(*ordering)
+                 .values('id', 'title', 'date')[offset:offset + size])
+    kind = model._meta.model_name
+    return {
+        'key': key,
+        'label': label,
+        'kind': kind,
+        'approved': approved,
+        'items': items,
+        'total': total,
+        'page': page,
+        'num_pages': max((total + size - 1) // size, 1),
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if offset + size < total else None,
+        'approve_url': f'approve_{kind}',
+        'edit_url': f'edit_{kind}',
+        'delete_url': f'delete_{kind}',
+    }
+
+
+def approval_queue(page):
+    """Returns one page of unapproved articles and newsletters, oldest first.
+
+    Items are dicts with ``id``, ``title``, ``date`` and ``kind``.
+    """
+    def pending(model):
+        return (model.objects.filter(approved=False).order_by()
+                .annotate(kind=Value(model._meta.model_name,
+                                     output_field=CharField()))
+                .values('id', 'title', 'date', 'kind'))
+
+    size = page_size()
+    page = _page_number(page)
+    offset = (page - 1) * size
+    queue = (pending(Article).union(pending(Newsletter), all=True)
+             .order_by('date', 'id'))
+    items = list(queue[offset:offset + size + 1])
+    return {
+        'items': items[:size],
+        'page': page,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if len(items) > size else None,
+    }
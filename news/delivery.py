@@ -0,0 +1,218 @@
+"""Database-backed outbox for subscriber notifications.
+
+``Article.approve`` and ``Newsletter.approve`` only enqueue a
+:class:`~news.models.DeliveryJob`. Worker processes started with
+``manage.py process_deliveries`` claim pending jobs, expand them into
+per-recipient rows, send the emails in batches through the pooled
+:mod:`news.mail` dispatcher and post the tweet, retrying failures with a
+growing delay. A job is only done once Twitter has accepted its tweet,
+or straight away when no Twitter token is configured. Waiting on the
+rate limit postpones a job without using up one of its attempts.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from . import feed, feed_cache
+from .mail import get_dispatcher
+from .models import DeliveryJob, DeliveryRecipient
+from .subscribers import iter_subscriber_emails
+from .tweet_dispatcher import RateLimited
+from .twitter_api import announce
+
+BATCH_SIZE = getattr(settings, 'NEWS_DELIVERY_BATCH_SIZE', 100)
+MAX_ATTEMPTS = getattr(settings, 'NEWS_DELIVERY_MAX_ATTEMPTS', 5)
+RETRY_DELAY = getattr(settings, 'NEWS_DELIVERY_RETRY_DELAY', 60)
+LEASE_SECONDS = getattr(settings, 'NEWS_DELIVERY_LEASE', 300)
+TWEET_WINDOW = getattr(settings, 'NEWS_TWEET_COALESCE_WINDOW', 0)
+
+logger = logging.getLogger('news.delivery')
+
+
+def claim_jobs(limit=10):
+    """Claims up to ``limit`` due jobs for this worker.
+
+    A claimed job is marked running and leased for ``LEASE_SECONDS``; if
+    the worker dies, the lease expires and another worker picks it up.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            DeliveryJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=['pending', 'running'], available_at__lte=now)
+            .order_by('available_at', 'id')
+            .values_list('id', flat=True)[:limit])
+        DeliveryJob.objects.filter(id__in=ids).update(
+            status='running',
+            attempts=F('attempts') + 1,
+            available_at=now + timedelta(seconds=LEASE_SECONDS))
+    return list(DeliveryJob.objects.filter(id__in=ids)
+                .select_related('article', 'newsletter'))
+
+
+def _subject(content):
+    kind = 'Article' if content._meta.model_name == 'article' \
+        else 'Newsletter'
+    return f"New {kind}: {content.title}"
+
+
+def _expand_recipients(job):
+    # Case-folded so the (job, email) constraint also drops an address
+    # that several accounts share in different spellings.
+    for emails in iter_subscriber_emails(job.content, BATCH_SIZE):
+        DeliveryRecipient.objects.bulk_create(
+            [DeliveryRecipient(job=job, email=email.strip().lower())
+             for email in emails],
+            ignore_conflicts=True)
+    job.recipients_resolved = True
+    job.save(update_fields=['recipients_resolved'])
+
+
+def _send_batch(job, batch):
+    content = job.content
+    subject = _subject(content)
+    messages = [EmailMessage(subject, content.content,
+                             settings.DEFAULT_FROM_EMAIL, [recipient.email])
+                for recipient in batch]
+    results = get_dispatcher().send(messages)
+    sent = [recipient.id for recipient, error in zip(batch, results)
+            if error is None]
+    DeliveryRecipient.objects.filter(id__in=sent).update(
+        status='sent', sent_at=timezone.now(), attempts=F('attempts') + 1)
+    for recipient, error in zip(batch, results):
+        if error is not None:
+            DeliveryRecipient.objects.filter(id=recipient.id).update(
+                status='failed', last_error=error,
+                attempts=F('attempts') + 1)
+
+
+def _send_emails(job):
+    pending = job.recipients.filter(
+        Q(status='pending') | Q(status='failed', attempts__lt=MAX_ATTEMPTS))
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id)
+                     .order_by('id')[:BATCH_SIZE])
+        if not batch:
+            break
+        _send_batch(job, batch)
+        last_id = batch[-1].id
+
+
+def _prepare(job):
+    if job.content is None:
+        raise ValueError("Delivery job has no article or newsletter")
+    if not job.recipients_resolved:
+        if feed.is_materialized():
+            feed.fan_out(job.content)
+            # The timelines changed after approval bumped the versions.
+            feed_cache.invalidate_content(job.content)
+        _expand_recipients(job)
+    _send_emails(job)
+
+
+def _hold_until(now):
+    # Lines fresh jobs up with any already waiting, so a burst of
+    # approvals is claimed, and tweeted, in one round.
+    window = timedelta(seconds=TWEET_WINDOW)
+    waiting = DeliveryJob.objects.filter(
+        status='pending', tweeted=False, recipients_resolved=True,
+        available_at__gt=now, available_at__lte=now + window,
+    ).aggregate(until=Min('available_at'))['until']
+    return waiting or now + window
+
+
+def _tweet(jobs):
+    """Announces ``jobs`` in one tweet; returns an error or ''.
+
+    Raises :class:`~news.tweet_dispatcher.RateLimited` rather than wait
+    for the bucket past half of the remaining lease.
+    """
+    lease = min(job.available_at for job in jobs) - timezone.now()
+    sent = announce([job.content for job in jobs],
+                    max_wait=max(lease.total_seconds(), 0) / 2)
+    if sent is None:
+        logger.warning("No Twitter token; delivery job(s) %s done "
+                       "without a tweet", ", ".join(str(job.id)
+                                                    for job in jobs))
+        return ''
+    if not sent:
+        return "Tweet was not posted"
+    DeliveryJob.objects.filter(id__in=[job.id for job in jobs]).update(
+        tweeted=True)
+    for job in jobs:
+        job.tweeted = True
+    return ''
+
+
+def _finish(job, error, until=None):
+    if until is not None:
+        # Held back for a digest or the rate limit, not a failed attempt.
+        job.status, job.available_at = 'pending', until
+        job.attempts -= 1
+        job.save(update_fields=['status', 'available_at', 'attempts'])
+        return
+    retry = bool(error)
+    if not retry and job.recipients.filter(
+            status='failed', attempts__lt=MAX_ATTEMPTS).exists():
+        error, retry = "Some recipients failed", True
+    if not retry:
+        job.status = 'done'
+    elif job.attempts >= MAX_ATTEMPTS:
+        job.status = 'failed'
+    else:
+        job.status = 'pending'
+        job.available_at = timezone.now() + timedelta(
+            seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+    job.last_error = error
+    job.save(update_fields=['status', 'available_at', 'last_error'])
+
+
+def process_jobs(jobs):
+    """Runs claimed jobs and records their outcomes.
+
+    Jobs are tweeted once their emails went out; with
+    ``NEWS_TWEET_COALESCE_WINDOW`` set, a round's jobs share one digest
+    tweet and fresh jobs first wait up to the window for others.
+    """
+    now = timezone.now()
+    errors, held, ready = {}, {}, []
+    for job in jobs:
+        fresh = not job.recipients_resolved
+        try:
+            _prepare(job)
+        except Exception as e:
+            errors[job.id] = str(e)
+            continue
+        if job.tweeted:
+            continue
+        if fresh and TWEET_WINDOW:
+            held[job.id] = _hold_until(now)
+        else:
+            ready.append(job)
+    groups = [ready] if TWEET_WINDOW else [[job] for job in ready]
+    for group in filter(None, groups):
+        try:
+            error = _tweet(group)
+        except RateLimited as e:
+            until = timezone.now() + timedelta(seconds=e.delay)
+            held.update((job.id, until) for job in group)
+            continue
+        except Exception as e:
+            error = str(e)
+        errors.update((job.id, error) for job in group)
+    for job in jobs:
+        _finish(job, errors.get(job.id, ''), held.get(job.id))
+    return jobs
+
+
+def run_pending(limit=10):
+    """Claims and processes one round of jobs; returns how many ran."""
+    jobs = claim_jobs(limit)
+    process_jobs(jobs)
+    return len(jobs)
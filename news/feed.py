@@ -0,0 +1,176 @@
+"""Reader feed queries and the optional materialised timeline.
+
+By default a reader's feed is computed on every request from their
+publisher and journalist subscriptions. With ``NEWS_MATERIALIZED_FEED``
+enabled, approved content is fanned out into :class:`FeedEntry` rows by
+the delivery worker. Following or unfollowing a source only inserts or
+deletes that source's rows, and an edit that moves content to another
+publisher or journalist re-targets its rows. Materialized feeds are
+filtered and paged on the :class:`FeedEntry` columns, annotated as
+``feed_date`` and ``feed_id`` (see :func:`~news.pagination.keyset_fields`),
+so reading a page is one range scan of the ``(reader, date, article)``
+or ``(reader, date, newsletter)`` index, joined to the content by
+primary key.
+"""
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from .models import Article, CustomUser, Newsletter, FeedEntry
+from .subscribers import iter_subscriber_ids
+
+BATCH_SIZE = 1000
+
+
+def is_materialized():
+    return getattr(settings, 'NEWS_MATERIALIZED_FEED', False)
+
+
+def reader_articles(reader, subscriptions=None):
+    """Returns the approved articles in ``reader``'s feed.
+
+    ``subscriptions`` is the reader's ``(publisher_ids, journalist_ids)``
+    if the caller already has it.
+    """
+    if is_materialized():
+        return _entries(Article, reader)
+    return Article.objects.for_reader(reader, subscriptions)
+
+
+def reader_newsletters(reader, subscriptions=None):
+    """Returns the approved newsletters in ``reader``'s feed."""
+    if is_materialized():
+        return _entries(Newsletter, reader)
+    return Newsletter.objects.for_reader(reader, subscriptions)
+
+
+def _entries(model, reader):
+    # Annotated in the same step as the filter, so they reuse its join.
+    field = model._meta.model_name
+    return model.objects.filter(feed_entries__reader=reader).annotate(
+        feed_date=F('feed_entries__date'),
+        feed_id=F(f'feed_entries__{field}_id'))
+
+
+def _field(content):
+    return content._meta.model_name
+
+
+def fan_out(content):
+    """Adds approved ``content`` to every subscriber's timeline."""
+    field = _field(content)
+    for reader_ids in iter_subscriber_ids(content, BATCH_SIZE):
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(reader_id=reader_id, date=content.date,
+                       **{field: content})
+             for reader_id in reader_ids],
+            ignore_conflicts=True)
+
+
+def _insert(entries):
+    entries = iter(entries)
+    while batch := list(islice(entries, BATCH_SIZE)):
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def _still_followed(field):
+    # True while the entry's reader follows its content by another path.
+    publishers = CustomUser.subscribed_publishers.through.objects.filter(
+        customuser_id=OuterRef('reader_id'),
+        publisher_id=OuterRef(f'{field}__publisher_id'))
+    journalists = CustomUser.subscribed_journalists.through.objects.filter(
+        from_customuser_id=OuterRef('reader_id'),
+        to_customuser_id=OuterRef(f'{field}__journalist_id'))
+    return Exists(publishers) | Exists(journalists)
+
+
+def add_follows(kind, pairs):
+    """Adds the content of newly followed sources to timelines.
+
+    ``kind`` is ``'publisher'`` or ``'journalist'``; ``pairs`` are the
+    ``(reader_id, source_id)`` follows just created.
+    """
+    readers = defaultdict(list)
+    for reader_id, source_id in pairs:
+        readers[source_id].append(reader_id)
+    column = f'{kind}_id'
+    for model in (Article, Newsletter):
+        field = model._meta.model_name
+        for source_ids in _chunks(readers):
+            rows = model.objects.filter(
+                approved=True, **{column + '__in': source_ids}) \
+                .values_list('id', 'date', column)
+            _insert(FeedEntry(reader_id=reader_id, date=date,
+                              **{field + '_id': pk})
+                    for pk, date, source_id in rows
+                    for reader_id in readers[source_id])
+
+
+def drop_follows(kind, pairs):
+    """Removes the content of unfollowed sources from timelines.
+
+    Called once the follows in ``pairs`` are deleted; rows the reader
+    still reaches through the content's other source are kept.
+    """
+    source_ids = list({source_id for _, source_id in pairs})
+    for model in (Article, Newsletter):
+        field = model._meta.model_name
+        for reader_ids in _chunks({reader_id for reader_id, _ in pairs}):
+            FeedEntry.objects.filter(
+                reader_id__in=reader_ids,
+                **{f'{field}__{kind}_id__in': source_ids},
+            ).exclude(_still_followed(field)).delete()
+
+
+def refresh_content(content):
+    """Re-targets ``content``'s rows after it moved to other sources."""
+    field = _field(content)
+    entries = FeedEntry.objects.filter(**{field: content})
+    if content.approved:
+        entries = entries.exclude(_still_followed(field))
+    entries.delete()
+    if content.approved:
+        fan_out(content)
+
+
+def _expected(reader):
+    """Returns the ``(field, id) -> date`` map a reader's feed should hold."""
+    expected = {}
+    subscriptions = reader.subscription_ids()
+    for model in (Article, Newsletter):
+        field = model._meta.model_name
+        rows = model.objects.for_reader(reader, subscriptions) \
+            .values_list('id', 'date')
+        expected.update(((field, pk), date) for pk, date in rows)
+    return expected
+
+
+def _materialized(reader):
+    rows = FeedEntry.objects.filter(reader=reader).values_list(
+        'article_id', 'newsletter_id')
+    return {('article', a) if a else ('newsletter', n) for a, n in rows}
+
+
+def rebuild_reader(reader):
+    """Replaces ``reader``'s timeline with one computed from scratch."""
+    entries = [FeedEntry(reader=reader, date=date, **{field + '_id': pk})
+               for (field, pk), date in _expected(reader).items()]
+    with transaction.atomic():
+        FeedEntry.objects.filter(reader=reader).delete()
+        FeedEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+
+def check_reader(reader):
+    """Returns ``(missing, extra)`` timeline keys for ``reader``."""
+    expected = set(_expected(reader))
+    actual = _materialized(reader)
+    return expected - actual, actual - expected
@@ -0,0 +1,183 @@
+"""Caching of rendered reader feeds with event-driven invalidation.
+
+A cached feed is keyed by the reader's subscription set plus a version
+number for every publisher and journalist in it. Saving or deleting an
+article or newsletter bumps the versions of its publisher and journalist
+(old and new), so exactly the feeds that can show it miss next time,
+along with a version of the item itself.
+Each reader's subscription set is cached too and dropped whenever their
+subscriptions change. Hits and misses are counted in :mod:`news.metrics`.
+
+Invalidation only reaches other processes (web workers, the delivery
+worker) through a shared cache backend, so ``NEWS_FEED_CACHE_ALIAS`` must
+not point at a process-local one; see :mod:`news.checks`. Versions expire
+after ``NEWS_FEED_VERSION_TIMEOUT`` seconds and are then recreated with a
+fresh value, which at worst costs one cache miss.
+
+The same versions give the API cheap ETag and Last-Modified values
+(:func:`feed_state`, :func:`publisher_state`, :func:`content_state`)
+without running a query.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .timeline import reader_timeline
+
+PREFIX = 'news:feed'
+
+
+def _cache():
+    return caches[getattr(settings, 'NEWS_FEED_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'NEWS_FEED_CACHE_TIMEOUT', 300)
+
+
+def _subscriptions_key(reader_id):
+    return f'{PREFIX}:subs:{reader_id}'
+
+
+def _version_timeout():
+    return getattr(settings, 'NEWS_FEED_VERSION_TIMEOUT', 86400)
+
+
+def _version_key(kind, pk):
+    return f'{PREFIX}:ver:{kind}:{pk}'
+
+
+def get_subscriptions(reader, request=None):
+    """Returns ``(publisher_ids, journalist_ids)`` for ``reader``.
+
+    With ``request``, the result is memoized on it, so the ETag check,
+    the feed query and the cache key of one request share one lookup.
+    """
+    memo = None
+    if request is not None:
+        memo = request.__dict__.setdefault('_news_subscriptions', {})
+        if reader.pk in memo:
+            return memo[reader.pk]
+    cache = _cache()
+    key = _subscriptions_key(reader.pk)
+    subscriptions = cache.get(key)
+    if subscriptions is None:
+        subscriptions = reader.subscription_ids()
+        cache.set(key, subscriptions, _timeout())
+    if memo is not None:
+        memo[reader.pk] = subscriptions
+    return subscriptions
+
+
+def _source_keys(publisher_ids=(), journalist_ids=(), reader_ids=()):
+    return ([_version_key('pub', pk) for pk in publisher_ids] +
+            [_version_key('jour', pk) for pk in journalist_ids] +
+            [_version_key('reader', pk) for pk in reader_ids])
+
+
+def _versions(keys):
+    cache = _cache()
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        # A fresh, never-before-used value, so an evicted version can't
+        # collide with a feed cached under an older one.
+        cache.set_many(missing, _version_timeout())
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _digest(value):
+    return hashlib.sha1(repr(value).encode()).hexdigest()
+
+
+def _state(keys, *parts):
+    versions = _versions(keys)
+    return _digest((parts, versions)), max(versions, default=0) / 1e9
+
+
+def _feed_key(publisher_ids, journalist_ids):
+    digest, _ = _state(_source_keys(publisher_ids, journalist_ids),
+                       publisher_ids, journalist_ids)
+    return f'{PREFIX}:page:{digest}'
+
+
+def feed_state(reader, request=None):
+    """Returns ``(fingerprint, last_modified)`` for ``reader``'s feed.
+
+    Both come from the cache without touching the database once warm.
+    The fingerprint changes whenever content in the feed or the reader's
+    subscriptions change; ``last_modified`` is the Unix time of the latest
+    such change.
+    """
+    publisher_ids, journalist_ids = get_subscriptions(reader, request)
+    keys = _source_keys(publisher_ids, journalist_ids, [reader.pk])
+    return _state(keys, publisher_ids, journalist_ids)
+
+
+def publisher_state(publisher_id):
+    """Returns ``(fingerprint, last_modified)`` for a publisher's articles."""
+    return _state(_source_keys([publisher_id]), 'publisher', publisher_id)
+
+
+def content_state(model_name, pk):
+    """Returns ``(fingerprint, last_modified)`` for one article or
+    newsletter, without loading it."""
+    return _state([_version_key(model_name, pk)], model_name, pk)
+
+
+def get_reader_timeline(reader, params, request=None):
+    """Returns one page of ``reader``'s merged timeline.
+
+    ``params`` are the paging parameters of
+    :func:`~news.timeline.reader_timeline`; each distinct page is cached
+    under the feed's current versions.
+    """
+    cache = _cache()
+    subscriptions = get_subscriptions(reader, request)
+    page_params = (params.get('cursor'), params.get('since'),
+                   params.get('page_size'))
+    key = f'{_feed_key(*subscriptions)}:{_digest(page_params)}'
+    page = cache.get(key)
+    if page is not None:
+        metrics.incr('feed_cache_hits')
+        return page
+    metrics.incr('feed_cache_misses')
+    page = reader_timeline(reader, params, subscriptions)
+    cache.set(key, page, _timeout())
+    return page
+
+
+def invalidate_subscriptions(reader_ids):
+    """Forgets the cached subscription sets of ``reader_ids``."""
+    cache = _cache()
+    cache.delete_many([_subscriptions_key(pk) for pk in reader_ids])
+    now = time.time_ns()
+    cache.set_many({key: now for key in _source_keys(reader_ids=reader_ids)},
+                   _version_timeout())
+
+
+def invalidate_sources(publisher_ids=(), journalist_ids=()):
+    """Bumps the versions of the given publishers and journalists."""
+    now = time.time_ns()
+    keys = _source_keys([pk for pk in publisher_ids if pk],
+                        [pk for pk in journalist_ids if pk])
+    if keys:
+        _cache().set_many({key: now for key in keys}, _version_timeout())
+
+
+def invalidate_content(content):
+    """Invalidates every feed that can show ``content``.
+
+    Covers both its current publisher/journalist and the ones it was
+    loaded with, in case an edit moved it.
+    """
+    loaded = getattr(content, '_loaded_sources', (None, None))
+    invalidate_sources(
+        {content.publisher_id, loaded[0]},
+        {content.journalist_id, loaded[1]})
+    _cache().set(_version_key(content._meta.model_name, content.pk),
+                 time.time_ns(), _version_timeout())
@@ -16,8 +16,7 @@ class RegistrationForm(UserCreationForm):
         user = super().save(commit=False)
         user.role = self.cleaned_data['role']
         if commit:
-            user.save()
-            user.assign_group_and_permissions()  # Ensure this runs after save
+            user.save()  # New users get their role group in save()
         return user
 
 
@@ -0,0 +1,165 @@
+"""Per-request timing, SQL and outbound-call instrumentation.
+
+:class:`RequestMetricsMiddleware` times every request into
+``request_seconds{view,role}``. A random ``NEWS_REQUEST_SAMPLE_RATE``
+share of requests is also traced in detail: SQL query count and time,
+rendering time of template and API responses, response size and the
+time spent in outbound email and Twitter calls (see :func:`outbound`).
+Traced requests feed the ``request_*`` metrics and are logged as one
+JSON line to the ``news.requests`` logger. The counters are served in
+the Prometheus text format by the ``metrics`` view.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import metrics
+
+logger = logging.getLogger('news.requests')
+_trace = ContextVar('news_request_trace', default=None)
+
+
+class _Trace:
+    """Detailed measurements of one sampled request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.render = 0.0
+        self.size = 0
+        self.outbound = {}
+        self._render_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed as a database execute wrapper.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - started
+            self.queries += 1
+
+    def start_render(self, response):
+        self._render_started = time.perf_counter()
+        response.add_post_render_callback(self._rendered)
+
+    def _rendered(self, response):
+        self.render += time.perf_counter() - self._render_started
+
+
+@contextmanager
+def outbound(kind):
+    """Times an outbound call such as ``email`` or ``twitter``.
+
+    The time is recorded in ``outbound_seconds{kind}`` and, inside a
+    traced request, added to that request's log line.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe('outbound_seconds', elapsed, kind=kind)
+        trace = _trace.get()
+        if trace is not None:
+            trace.outbound[kind] = trace.outbound.get(kind, 0.0) + elapsed
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+def _role(request):
+    user = getattr(request, 'user', None)
+    # Don't load a user the view never looked at.
+    if user is None or (isinstance(user, SimpleLazyObject)
+                        and user._wrapped is empty):
+        return 'anonymous'
+    if not user.is_authenticated:
+        return 'anonymous'
+    return user.role or 'unknown'
+
+
+class RequestMetricsMiddleware:
+    """Records request metrics; traces a sample of requests in detail."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'NEWS_REQUEST_SAMPLE_RATE',
+                                   0.01)
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        if random.random() >= self.sample_rate:
+            response = self.get_response(request)
+            metrics.observe('request_seconds', time.perf_counter() - started,
+                            view=_view_name(request), role=_role(request))
+            return response
+
+        trace = _Trace()
+        _trace.set(trace)
+        connection.execute_wrappers.append(trace)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._finish(request, trace, started, None)
+            raise
+        if response.streaming:
+            response.streaming_content = self._stream(
+                request, response, response.streaming_content, trace,
+                started)
+        else:
+            trace.size = len(response.content)
+            self._finish(request, trace, started, response)
+        return response
+
+    def process_template_response(self, request, response):
+        trace = _trace.get()
+        if trace is not None:
+            trace.start_render(response)
+        return response
+
+    def _stream(self, request, response, content, trace, started):
+        # Streamed responses serialize while they are sent.
+        try:
+            chunk_started = time.perf_counter()
+            for chunk in content:
+                trace.render += time.perf_counter() - chunk_started
+                trace.size += len(chunk)
+                yield chunk
+                chunk_started = time.perf_counter()
+        finally:
+            self._finish(request, trace, started, response)
+
+    def _finish(self, request, trace, started, response):
+        elapsed = time.perf_counter() - started
+        if trace in connection.execute_wrappers:
+            connection.execute_wrappers.remove(trace)
+        _trace.set(None)
+        view, role = _view_name(request), _role(request)
+        metrics.observe('request_seconds', elapsed, view=view, role=role)
+        metrics.observe('request_queries', trace.queries, view=view)
+        metrics.observe('request_sql_seconds', trace.sql, view=view)
+        metrics.observe('request_render_seconds', trace.render, view=view)
+        metrics.observe('response_bytes', trace.size, view=view)
+        logger.info(json.dumps({
+            'view': view,
+            'role': role,
+            'method': request.method,
+            'status': response.status_code if response is not None else 500,
+            'duration_ms': round(elapsed * 1000, 2),
+            'queries': trace.queries,
+            'sql_ms': round(trace.sql * 1000, 2),
+            'render_ms': round(trace.render * 1000, 2),
+            'bytes': trace.size,
+            **{f'{kind}_ms': round(seconds * 1000, 2)
+               for kind, seconds in trace.outbound.items()},
+        }, separators=(',', ':')))
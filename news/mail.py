@@ -0,0 +1,174 @@
+"""Pooled, rate-limited email dispatch for subscriber notifications.
+
+The dispatcher keeps a small pool of open backend connections that is
+shared by every delivery job in the process, sends messages in batches,
+throttles to ``NEWS_MAIL_RATE_LIMIT`` messages per second and retries the
+unsent remainder of a batch with exponential backoff when the connection
+drops. Swap in another implementation with ``NEWS_MAIL_DISPATCHER``.
+"""
+import queue
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .instrumentation import outbound
+
+
+class MailDispatcher:
+    """Sends email messages over a pool of persistent connections."""
+
+    def __init__(self, pool_size=2, batch_size=100, rate_limit=None,
+                 max_retries=3, retry_backoff=1.0, backend=None):
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.backend = backend
+        self.sent = 0
+        self.failed = 0
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.pool_size
+            if create:
+                self._created += 1
+        if not create:
+            return self._pool.get()
+        connection = get_connection(self.backend, fail_silently=False)
+        try:
+            connection.open()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        return connection
+
+    def _release(self, connection):
+        self._pool.put(connection)
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _throttle(self, count):
+        if not self.rate_limit:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            self._next_slot = start + count / self.rate_limit
+        if start > now:
+            time.sleep(start - now)
+
+    def _count(self, sent, failed):
+        with self._lock:
+            self.sent += sent
+            self.failed += failed
+        metrics.incr('mail_sent', sent)
+        metrics.incr('mail_failed', failed)
+
+    def _send_batch(self, batch, results, offset):
+        remaining = list(range(len(batch)))
+        attempt = 0
+        while remaining:
+            try:
+                connection = self._acquire()
+            except Exception as e:
+                connection, error = None, e
+            else:
+                error = None
+                while remaining:
+                    index = remaining[0]
+                    try:
+                        with outbound('email'):
+                            connection.send_messages([batch[index]])
+                    except (smtplib.SMTPRecipientsRefused,
+                            smtplib.SMTPSenderRefused,
+                            smtplib.SMTPDataError) as e:
+                        results[offset + index] = str(e)
+                    except Exception as e:
+                        error = e
+                        break
+                    remaining.pop(0)
+                if error is None:
+                    self._release(connection)
+                else:
+                    self._discard(connection)
+            if error is None:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                for index in remaining:
+                    results[offset + index] = str(error)
+                break
+            metrics.incr('mail_retries')
+            time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+    def send(self, messages):
+        """Sends ``messages``; returns an error string or None for each."""
+        messages = list(messages)
+        results = [None] * len(messages)
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start:start + self.batch_size]
+            self._throttle(len(batch))
+            self._send_batch(batch, results, start)
+        failed = sum(1 for error in results if error is not None)
+        self._count(len(messages) - failed, failed)
+        return results
+
+    def close(self):
+        """Closes every pooled connection."""
+        while True:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Returns the process-wide dispatcher configured in settings."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            dispatcher_class = import_string(getattr(
+                settings, 'NEWS_MAIL_DISPATCHER', 'news.mail.MailDispatcher'))
+            _dispatcher = dispatcher_class(
+                pool_size=getattr(settings, 'NEWS_MAIL_POOL_SIZE', 2),
+                batch_size=getattr(settings, 'NEWS_MAIL_BATCH_SIZE', 100),
+                rate_limit=getattr(settings, 'NEWS_MAIL_RATE_LIMIT', None),
+                max_retries=getattr(settings, 'NEWS_MAIL_MAX_RETRIES', 3),
+                retry_backoff=getattr(settings, 'NEWS_MAIL_RETRY_BACKOFF',
+                                      1.0))
+        return _dispatcher
+
+
+def reset_dispatcher():
+    """Closes and drops the process-wide dispatcher."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.close()
+        _dispatcher = None
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from news.twitter_api import TwitterAPI, reset_twitter_client
+
+
+class Command(BaseCommand):
+    help = ("Authorizes the Twitter account with a PIN and saves its "
+            "token file.")
+
+    def handle(self, *args, **options):
+        client = TwitterAPI(interactive=True)
+        if client.session is None:
+            raise CommandError("Twitter authorization failed")
+        client.session.close()
+        reset_twitter_client()
+        token_file = getattr(settings, 'TWITTER_TOKEN_FILE',
+                             'twitter_tokens.json')
+        self.stdout.write(f"Saved the Twitter token to {token_file}")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from news.feed import rebuild_reader
+from news.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the materialised reader timelines from subscriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reader', type=int, action='append',
+                            help="Only rebuild this reader id (repeatable).")
+
+    def handle(self, *args, **options):
+        readers = CustomUser.objects.filter(role='reader').order_by('id')
+        if options['reader']:
+            readers = readers.filter(id__in=options['reader'])
+        count = 0
+        for reader in readers.iterator():
+            rebuild_reader(reader)
+            count += 1
+        self.stdout.write(f"Rebuilt {count} reader feed(s)")
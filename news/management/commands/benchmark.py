@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news.benchmarks import SUITES, run
+
+
+class Command(BaseCommand):
+    help = ("Runs the micro-benchmarks in news.benchmarks on seeded data "
+            "that is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*',
+                            help=f"Suites to run: {', '.join(SUITES)} "
+                                 "(default: all).")
+        parser.add_argument('--rows', type=int, default=10000,
+                            help="Rows to seed per suite.")
+
+    def handle(self, *args, **options):
+        names = options['suites'] or list(SUITES)
+        unknown = set(names) - set(SUITES)
+        if unknown:
+            raise CommandError(f"Unknown suite(s): {', '.join(unknown)}")
+        for name in names:
+            results = run(name, options['rows'])
+            self.stdout.write(f"{name} ({options['rows']} rows)")
+            baseline = results[0][1]
+            for label, seconds in results:
+                self.stdout.write(
+                    f"  {label:<24} {seconds * 1000:10.1f} ms "
+                    f"{baseline / seconds:6.1f}x")
@@ -0,0 +1,104 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from news import perf
+
+SQLITE = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+
+
+class Command(BaseCommand):
+    help = ("Seeds synthetic data on a throwaway test database, requests "
+            "every URL as every role at a small and the full scale and "
+            "fails if a query count grows with the data or passes its "
+            "budget.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--publishers', type=int, default=10000)
+        parser.add_argument('--journalists', type=int, default=1000)
+        parser.add_argument('--readers', type=int, default=10000)
+        parser.add_argument('--articles', type=int, default=100000)
+        parser.add_argument('--newsletters', type=int, default=10000)
+        parser.add_argument('--subscriptions', type=int, default=1000000)
+        parser.add_argument('--small', type=int, default=10,
+                            help="The small run uses 1/SMALL of each "
+                                 "count.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Warm requests timed per route and role.")
+        parser.add_argument('--budget', type=int,
+                            default=perf.DEFAULT_QUERY_BUDGET,
+                            help="Default query budget per request.")
+        parser.add_argument('--routes', nargs='*',
+                            help="Only request these URL names.")
+        parser.add_argument('--sqlite', action='store_true',
+                            help="Use an in-memory SQLite database instead "
+                                 "of a test copy of the configured one.")
+        parser.add_argument('--noinput', '--no-input', action='store_false',
+                            dest='interactive',
+                            help="Replace a leftover test database without "
+                                 "asking.")
+        parser.add_argument('--json', dest='json_file',
+                            help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        full = perf.Scale(*(options[field] for field in perf.Scale._fields))
+        if min(full) < 2 or options['small'] < 1:
+            raise CommandError("Every count must be at least 2 and --small "
+                               "positive")
+        small = perf.Scale(*(max(count // options['small'], 2)
+                             for count in full))
+        routes = perf.ROUTES
+        if options['routes']:
+            routes = [r for r in perf.ROUTES if r.name in options['routes']]
+            unknown = set(options['routes']) - {r.name for r in routes}
+            if unknown:
+                raise CommandError(f"Unknown route(s): {', '.join(unknown)}")
+        if options['sqlite']:
+            connections['default'].close()
+            connections.settings['default'] = \
+                connections.configure_settings({'default': SQLITE})['default']
+            del connections['default']
+
+        # The throwaway database must not touch the caches of a live server.
+        with override_settings(CACHES=perf.private_caches()):
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=not options['interactive'])
+            try:
+                runs = perf.run([small, full], options['repeat'], routes,
+                                progress=self._progress)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self._table(runs[-1], runs[0])
+        if options['json_file']:
+            with open(options['json_file'], 'w') as f:
+                json.dump({'scales': [small._asdict(), full._asdict()],
+                           'results': [[r._asdict() for r in results]
+                                       for results in runs]}, f, indent=2)
+        failures = perf.check(runs[0], runs[-1],
+                              default_budget=options['budget'])
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(runs[-1])} requests within their query budgets"))
+
+    def _progress(self, scale):
+        self.stdout.write(
+            "Measuring " + ", ".join(f"{count} {name}" for name, count
+                                     in scale._asdict().items()))
+
+    def _table(self, results, small):
+        before = {(r.route, r.role): r.queries for r in small}
+        self.stdout.write(f"{'route':<28} {'role':<10} {'status':>6} "
+                          f"{'queries':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'peak KB':>9}")
+        for r in results:
+            queries = f"{before.get((r.route, r.role), '?')}>{r.queries}"
+            self.stdout.write(f"{r.route:<28} {r.role:<10} {r.status:>6} "
+                              f"{queries:>9} {r.p50:8.1f} {r.p95:8.1f} "
+                              f"{r.peak_kb:9.0f}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news.feed import check_reader, rebuild_reader
+from news.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Compares materialised reader timelines with subscriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reader', type=int, action='append',
+                            help="Only check this reader id (repeatable).")
+        parser.add_argument('--fix', action='store_true',
+                            help="Rebuild timelines that are out of date.")
+
+    def handle(self, *args, **options):
+        readers = CustomUser.objects.filter(role='reader').order_by('id')
+        if options['reader']:
+            readers = readers.filter(id__in=options['reader'])
+        broken = 0
+        for reader in readers.iterator():
+            missing, extra = check_reader(reader)
+            if not missing and not extra:
+                continue
+            broken += 1
+            self.stdout.write(f"{reader}: {len(missing)} missing, "
+                              f"{len(extra)} extra")
+            if options['fix']:
+                rebuild_reader(reader)
+        if broken and not options['fix']:
+            raise CommandError(f"{broken} reader feed(s) are inconsistent")
+        self.stdout.write(f"Checked feeds, {broken} inconsistent")
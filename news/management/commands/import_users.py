@@ -0,0 +1,166 @@
+import csv
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from news import feed
+from news.models import CustomUser, Publisher, role_group_id
+
+
+_Row = namedtuple('_Row', 'username email password role publishers '
+                         'journalists')
+
+
+def _init_worker():
+    if not apps.ready:
+        django.setup()
+
+
+def _hash_password(raw):
+    return make_password(raw or None)
+
+
+def _split_ids(value):
+    ids = set()
+    for part in (value or '').replace(',', ';').split(';'):
+        part = part.strip()
+        if part:
+            ids.add(int(part))
+    return ids
+
+
+class Command(BaseCommand):
+    help = ("Bulk-imports users from a CSV with the columns username, "
+            "email, password, role, publishers and journalists (the last "
+            "two are ';'-separated ids).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Rows inserted per transaction.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Password hashing processes "
+                                 "(0 hashes in this process).")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive")
+        workers = options['workers']
+        pool = None
+        if workers != 0:
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_init_worker)
+        self.imported = self.skipped = 0
+        started = time.monotonic()
+        try:
+            with open(options['csv_file'], newline='',
+                      encoding='utf-8') as f:
+                rows = csv.DictReader(f)
+                while True:
+                    chunk = list(islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    self._import_chunk(chunk, pool)
+                    if options['verbosity'] > 1:
+                        self._report(started)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self._report(started)
+        if self.imported and feed.is_materialized():
+            self.stdout.write("Run backfill_feed to build the new readers' "
+                              "timelines.")
+
+    def _report(self, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(
+            f"Imported {self.imported} user(s), skipped {self.skipped} "
+            f"in {elapsed:.1f}s ({self.imported / elapsed:.0f} rows/s)")
+
+    def _valid_rows(self, chunk):
+        roles = dict(CustomUser.ROLE_CHOICES)
+        seen = set()
+        usernames = [(row.get('username') or '').strip() for row in chunk]
+        # Usernames differing only in case are duplicates, as in Django's
+        # user creation form.
+        existing = set(CustomUser.objects.annotate(folded=Lower('username'))
+                       .filter(folded__in={u.lower() for u in usernames})
+                       .values_list('folded', flat=True))
+        valid = []
+        for row, username in zip(chunk, usernames):
+            role = (row.get('role') or 'reader').strip()
+            try:
+                publishers = _split_ids(row.get('publishers'))
+                journalists = _split_ids(row.get('journalists'))
+            except ValueError:
+                publishers = None
+            folded = username.lower()
+            if (not username or folded in existing or folded in seen
+                    or role not in roles or publishers is None):
+                self.skipped += 1
+                continue
+            seen.add(folded)
+            if role != 'reader':
+                publishers, journalists = set(), set()
+            valid.append(_Row(username, (row.get('email') or '').strip(),
+                              row.get('password') or '', role,
+                              publishers, journalists))
+        return valid
+
+    def _import_chunk(self, chunk, pool):
+        rows = self._valid_rows(chunk)
+        if not rows:
+            return
+        passwords = [row.password for row in rows]
+        if pool is None:
+            hashes = [_hash_password(raw) for raw in passwords]
+        else:
+            hashes = list(pool.map(_hash_password, passwords,
+                                   chunksize=max(len(passwords) // 32, 1)))
+        publisher_ids = set().union(*(row.publishers for row in rows))
+        journalist_ids = set().union(*(row.journalists for row in rows))
+        publisher_ids = set(Publisher.objects.filter(id__in=publisher_ids)
+                            .values_list('id', flat=True))
+        journalist_ids = set(CustomUser.objects.filter(
+            id__in=journalist_ids, role='journalist')
+            .values_list('id', flat=True))
+
+        Groups = CustomUser.groups.through
+        Publishers = CustomUser.subscribed_publishers.through
+        Journalists = CustomUser.subscribed_journalists.through
+        with transaction.atomic():
+            CustomUser.objects.bulk_create([
+                CustomUser(username=row.username, email=row.email,
+                           password=hashed, role=row.role)
+                for row, hashed in zip(rows, hashes)
+            ])
+            # MySQL does not return primary keys from bulk_create.
+            ids = dict(CustomUser.objects.filter(
+                username__in=[row.username for row in rows])
+                .values_list('username', 'id'))
+            Groups.objects.bulk_create([
+                Groups(customuser_id=ids[row.username],
+                       group_id=role_group_id(row.role))
+                for row in rows
+            ])
+            Publishers.objects.bulk_create([
+                Publishers(customuser_id=ids[row.username], publisher_id=pk)
+                for row in rows for pk in row.publishers
+                if pk in publisher_ids
+            ])
+            Journalists.objects.bulk_create([
+                Journalists(from_customuser_id=ids[row.username],
+                            to_customuser_id=pk)
+                for row in rows for pk in row.journalists
+                if pk in journalist_ids
+            ])
+        self.imported += len(rows)
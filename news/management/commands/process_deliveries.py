@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import metrics
+from news.delivery import run_pending
+
+
+class Command(BaseCommand):
+    help = "Drains the subscriber delivery outbox (emails and tweets)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=10,
+                            help="Jobs to claim per round.")
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Process a single round and exit.")
+        parser.add_argument('--metrics-port', type=int,
+                            help="Serve this worker's mail and tweet "
+                                 "counters in the Prometheus format on "
+                                 "this port.")
+        parser.add_argument('--metrics-address', default='127.0.0.1',
+                            help="Address the metrics port binds to.")
+
+    def handle(self, *args, **options):
+        if options['metrics_port'] is not None:
+            server = metrics.serve(options['metrics_port'],
+                                   options['metrics_address'])
+            self.stdout.write("Serving metrics on port "
+                              f"{server.server_address[1]}")
+        while True:
+            processed = run_pending(options['jobs'])
+            if processed:
+                self.stdout.write(f"Processed {processed} delivery job(s)")
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['sleep'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from news.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the SQLite full-text search index, e.g. after bulk "
+            "writes that bypass model signals. MySQL keeps its FULLTEXT "
+            "indexes current by itself.")
+
+    def handle(self, *args, **options):
+        total = rebuild_index()
+        self.stdout.write(f"Indexed {total} item(s)")
@@ -0,0 +1,109 @@
+"""Process-wide counters and gauges for the news app.
+
+Every function takes optional ``labels`` keyword arguments, which become
+Prometheus labels: ``incr('requests', view='home')`` counts
+``requests{view="home"}``. :func:`render_prometheus` returns everything
+in the Prometheus text exposition format.
+
+Counters live in the process that updates them, so ``/metrics/`` only
+shows the web server's. Worker processes such as ``process_deliveries``
+publish theirs with :func:`serve` on a port of their own.
+"""
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+
+
+@lru_cache(maxsize=4096)
+def _format(name, labels):
+    pairs = ','.join(
+        '{}="{}"'.format(label, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for label, value in labels)
+    return f'{name}{{{pairs}}}'
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return _format(name, tuple(sorted(labels.items())))
+
+
+def incr(name, value=1, /, **labels):
+    """Adds ``value`` to the counter ``name``."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def set_value(name, value, /, **labels):
+    """Sets the gauge ``name`` to ``value``."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = value
+
+
+def observe(name, value, /, **labels):
+    """Records one observation as ``<name>_count``/``_sum``/``_max``."""
+    count = _key(name + '_count', labels)
+    total = _key(name + '_sum', labels)
+    peak = _key(name + '_max', labels)
+    with _lock:
+        _counters[count] += 1
+        _counters[total] += value
+        _counters[peak] = max(_counters[peak], value)
+
+
+def get(name, /, **labels):
+    """Returns the current value of the counter ``name``."""
+    key = _key(name, labels)
+    with _lock:
+        return _counters.get(key, 0)
+
+
+def snapshot():
+    """Returns a copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def render_prometheus(prefix='news_'):
+    """Returns all counters in the Prometheus text format."""
+    return ''.join(f'{prefix}{key} {float(value)!r}\n'
+                   for key, value in sorted(snapshot().items()))
+
+
+class _ExporterHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, address='127.0.0.1'):
+    """Serves this process's counters over HTTP from a daemon thread.
+
+    Returns the server; ``server.server_address`` has the bound port.
+    """
+    server = ThreadingHTTPServer((address, port), _ExporterHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-exporter',
+                     daemon=True).start()
+    return server
+
+
+def reset():
+    """Clears all counters; used by tests."""
+    with _lock:
+        _counters.clear()
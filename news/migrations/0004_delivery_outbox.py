@@ -0,0 +1,54 @@
+# Generated by Django 4.1.2 on 2026-10-17 17:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0003_newsletter_approved'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('recipients_resolved', models.BooleanField(default=False)),
+                ('tweeted', models.BooleanField(default=False)),
+                ('last_error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('article', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='delivery_jobs', to='news.article')),
+                ('newsletter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='delivery_jobs', to='news.newsletter')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DeliveryRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='news.deliveryjob')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrecipient',
+            index=models.Index(fields=['job', 'status'], name='news_delivery_rcpt_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryrecipient',
+            constraint=models.UniqueConstraint(fields=('job', 'email'), name='news_delivery_recipient_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryjob',
+            index=models.Index(fields=['status', 'available_at'], name='news_delivery_claim_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.1.2 on 2026-10-17 17:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0004_delivery_outbox'),
+    ]
+
+    # Add the composite indexes before dropping the single-column FK
+    # indexes they replace; MySQL needs an index on every FK column.
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['publisher', 'approved', 'date'], name='news_art_pub_appr_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['journalist', 'approved', 'date'], name='news_art_jour_appr_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['journalist', 'date'], name='news_art_jour_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['approved', 'date'], name='news_art_appr_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsletter',
+            index=models.Index(fields=['publisher', 'approved', 'date'], name='news_nl_pub_appr_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsletter',
+            index=models.Index(fields=['journalist', 'approved', 'date'], name='news_nl_jour_appr_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsletter',
+            index=models.Index(fields=['journalist', 'date'], name='news_nl_jour_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsletter',
+            index=models.Index(fields=['approved', 'date'], name='news_nl_appr_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='journalist',
+            field=models.ForeignKey(blank=True, db_index=False, limit_choices_to={'role': 'journalist'}, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='publisher',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='news.publisher'),
+        ),
+        migrations.AlterField(
+            model_name='newsletter',
+            name='journalist',
+            field=models.ForeignKey(blank=True, db_index=False, limit_choices_to={'role': 'journalist'}, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='newsletter',
+            name='publisher',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='news.publisher'),
+        ),
+    ]
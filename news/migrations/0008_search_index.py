@@ -0,0 +1,43 @@
+from django.db import migrations
+
+TABLES = (('news_article', 0), ('news_newsletter', 1))
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        for table, _ in TABLES:
+            schema_editor.execute(
+                f'ALTER TABLE {table} ADD FULLTEXT INDEX '
+                f'{table}_search_ft (title, content)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE news_search USING fts5("
+            "title, content, approved UNINDEXED, "
+            "tokenize = 'porter unicode61')")
+        for table, kind in TABLES:
+            schema_editor.execute(
+                f'INSERT INTO news_search (rowid, title, content, approved) '
+                f'SELECT id * 2 + {kind}, title, content, approved '
+                f'FROM {table}')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        for table, _ in TABLES:
+            schema_editor.execute(
+                f'ALTER TABLE {table} DROP INDEX {table}_search_ft')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE news_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0007_api_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.2 on 2026-10-17 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='feedentry',
+            name='news_feed_reader_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['reader', 'date', 'article'], name='news_feed_reader_art_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['reader', 'date', 'newsletter'], name='news_feed_reader_nl_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.2 on 2026-10-17 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0009_feed_entry_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['publisher', 'date'], name='news_art_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsletter',
+            index=models.Index(fields=['publisher', 'date'], name='news_nl_pub_date_idx'),
+        ),
+    ]
@@ -1,9 +1,86 @@
-from django.db import models
+import functools
+import hashlib
+import secrets
+import threading
+
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import AbstractUser, Group, Permission
-from django.contrib.contenttypes.models import ContentType
-from django.conf import settings
-from django.core.mail import send_mass_mail
-from .twitter_api import tweet_new_article, tweet_new_newsletter
+from django.utils import timezone
+
+
+ROLE_PERMISSIONS = {
+    'reader': (
+        'view_article', 'view_newsletter',
+    ),
+    'editor': (
+        'view_article', 'change_article', 'delete_article',
+        'view_newsletter', 'change_newsletter', 'delete_newsletter',
+    ),
+    'journalist': (
+        'add_article', 'view_article', 'change_article', 'delete_article',
+        'add_newsletter', 'view_newsletter', 'change_newsletter',
+        'delete_newsletter',
+    ),
+}
+
+_role_group_ids = {}
+_role_lock = threading.Lock()
+
+
+def role_group_name(role):
+    return role.capitalize() + 's'
+
+
+@functools.lru_cache(maxsize=None)
+def role_permission_ids():
+    """Returns ``{role: [permission ids]}``, resolved in one query."""
+    codenames = {c for perms in ROLE_PERMISSIONS.values() for c in perms}
+    ids = dict(Permission.objects.filter(
+        content_type__app_label='news',
+        content_type__model__in=['article', 'newsletter'],
+        codename__in=codenames).values_list('codename', 'id'))
+    return {role: [ids[codename] for codename in perms]
+            for role, perms in ROLE_PERMISSIONS.items()}
+
+
+def provision_role_groups():
+    """Creates every role group and syncs it with ``ROLE_PERMISSIONS``."""
+    role_permission_ids.cache_clear()
+    permission_ids = role_permission_ids()
+    with _role_lock:
+        _role_group_ids.clear()
+    for role in ROLE_PERMISSIONS:
+        group, _ = Group.objects.get_or_create(name=role_group_name(role))
+        group.permissions.set(permission_ids[role])
+        with _role_lock:
+            _role_group_ids[role] = group.id
+
+
+def role_group_id(role):
+    """Returns the id of ``role``'s group, cached per process.
+
+    The group is only provisioned with permissions when it has to be
+    created here; otherwise it was set up by :func:`provision_role_groups`
+    after migrate.
+    """
+    with _role_lock:
+        group_id = _role_group_ids.get(role)
+    if group_id is None:
+        group, created = Group.objects.get_or_create(
+            name=role_group_name(role))
+        if created:
+            group.permissions.set(role_permission_ids()[role])
+        group_id = group.id
+        with _role_lock:
+            _role_group_ids[role] = group_id
+    return group_id
+
+
+def forget_role_groups():
+    """Drops the cached group ids, e.g. after a group was deleted."""
+    with _role_lock:
+        _role_group_ids.clear()
 
 
 class CustomUser(AbstractUser):
@@ -31,82 +108,59 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    def subscription_ids(self):
+        """Returns sorted ``(publisher_ids, journalist_ids)`` tuples.
+
+        Read straight from the through tables, without joining the
+        subscribed rows.
+        """
+        publishers = CustomUser.subscribed_publishers.through.objects \
+            .filter(customuser_id=self.pk) \
+            .values_list('publisher_id', flat=True)
+        journalists = CustomUser.subscribed_journalists.through.objects \
+            .filter(from_customuser_id=self.pk) \
+            .values_list('to_customuser_id', flat=True)
+        return tuple(sorted(publishers)), tuple(sorted(journalists))
+
     def assign_group_and_permissions(self):
         """Assigns group and permissions based on user role."""
         if self.role not in dict(self.ROLE_CHOICES):
             raise ValueError("Invalid role")
-        group_name = self.role.capitalize() + 's'
-        group, _ = Group.objects.get_or_create(name=group_name)
-        self.groups.add(group)
-        ct_article = ContentType.objects.get_for_model(Article)
-        ct_newsletter = ContentType.objects.get_for_model(Newsletter)
-
-        if self.role == 'reader':
-            group.permissions.add(
-                Permission.objects.get(
-                    content_type=ct_article,
-                    codename='view_article'),
-                Permission.objects.get(
-                    content_type=ct_newsletter,
-                    codename='view_newsletter')
-            )
-        elif self.role == 'editor':
-            group.permissions.add(
-                Permission.objects.get(
-                    content_type=ct_article,
-                    codename='view_article'),
-                Permission.objects.get(
-                    content_type=ct_article,
-                    codename='change_article'),
-                Permission.objects.get(
-                    content_type=ct_article,
-                    codename='delete_article'),
-                Permission.objects.get(
-                    content_type=ct_newsletter,
-                    codename='view_newsletter'),
-                Permission.objects.get(
-                    content_type=ct_newsletter,
-                    codename='change_newsletter'),
-                Permission.objects.get(
-                    content_type=ct_newsletter,
-                    codename='delete_newsletter')
-            )
-        elif self.role == 'journalist':
-            group.permissions.add(
-                Permission.objects.get(
-                    content_type=ct_article,
-                    codename='add_article'),
-                Permission.objects.get(
-                    content_type=ct_article,
-                    codename='view_article'),
-                Permission.objects.get(
-                    content_type=ct_article,
-                    codename='change_article'),
-                Permission.objects.get(
-                    content_type=ct_article,
-                    codename='delete_article'),
-                Permission.objects.get(
-                    content_type=ct_newsletter,
-                    codename='add_newsletter'),
-                Permission.objects.get(
-                    content_type=ct_newsletter,
-                    codename='view_newsletter'),
-                Permission.objects.get(
-                    content_type=ct_newsletter,
-                    codename='change_newsletter'),
-                Permission.objects.get(
-                    content_type=ct_newsletter,
-                    codename='delete_newsletter')
-            )
+        self.groups.add(role_group_id(self.role))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_role = instance.__dict__.get('role')
+        return instance
+
+    def _role_changed(self, update_fields):
+        if update_fields is not None and 'role' not in update_fields:
+            return False
+        if 'role' not in self.__dict__:  # Deferred and never touched
+            return False
+        return self.role != getattr(self, '_loaded_role', None)
 
     def save(self, *args, **kwargs):
+        """Saves the user, re-applying role side effects on role changes.
+
+        Group assignment and the clearing of subscriptions for non-readers
+        only run for new users or when ``role`` actually changed, so
+        routine saves such as ``last_login`` updates are a single UPDATE.
+        """
         is_new = self.pk is None
+        previous_role = getattr(self, '_loaded_role', None)
+        role_changed = is_new or self._role_changed(
+            kwargs.get('update_fields'))
         super().save(*args, **kwargs)
-        if is_new:
+        if role_changed:
+            if previous_role in ROLE_PERMISSIONS:
+                self.groups.remove(role_group_id(previous_role))
             self.assign_group_and_permissions()
-        if self.role != 'reader':
-            self.subscribed_publishers.clear()
-            self.subscribed_journalists.clear()
+            if self.role != 'reader' and not is_new:
+                self.subscribed_publishers.clear()
+                self.subscribed_journalists.clear()
+        self._loaded_role = self.role
 
 
 class Publisher(models.Model):
@@ -124,74 +178,295 @@ class Publisher(models.Model):
         return self.name
 
 
+class ContentQuerySet(models.QuerySet):
+    """Feed queries shared by :class:`Article` and :class:`Newsletter`."""
+
+    def for_sources(self, publisher_ids, journalist_ids):
+        """Approved items by any of the given publishers or journalists.
+
+        Filters on flat ``IN`` lists, which MySQL answers with range
+        seeks on the ``(publisher, approved, date)`` and ``(journalist,
+        approved, date)`` indexes instead of correlated subqueries.
+        """
+        condition = Q()
+        if publisher_ids:
+            condition |= Q(publisher_id__in=publisher_ids)
+        if journalist_ids:
+            condition |= Q(journalist_id__in=journalist_ids)
+        if not condition:
+            return self.none()
+        return self.filter(condition, approved=True)
+
+    def for_reader(self, reader, subscriptions=None):
+        """Approved items from ``reader``'s subscriptions.
+
+        ``subscriptions`` is a ``(publisher_ids, journalist_ids)`` pair
+        the caller already holds, such as
+        :func:`news.feed_cache.get_subscriptions`; otherwise it is read
+        from the database.
+        """
+        if subscriptions is None:
+            subscriptions = reader.subscription_ids()
+        return self.for_sources(*subscriptions)
+
+
 class Article(models.Model):
     title = models.CharField(max_length=255)
     content = models.TextField()
+    # Indexed through the composite feed indexes in Meta.
     publisher = models.ForeignKey(
         Publisher,
         on_delete=models.CASCADE,
-        null=True, blank=True)
+        null=True, blank=True, db_index=False)
     journalist = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
-        null=True, blank=True,
+        null=True, blank=True, db_index=False,
         limit_choices_to={'role': 'journalist'})
     approved = models.BooleanField(default=False)
     date = models.DateTimeField(auto_now_add=True)
 
+    objects = ContentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['publisher', 'approved', 'date'],
+                         name='news_art_pub_appr_date_idx'),
+            # Publisher listings page over drafts as well.
+            models.Index(fields=['publisher', 'date'],
+                         name='news_art_pub_date_idx'),
+            models.Index(fields=['journalist', 'approved', 'date'],
+                         name='news_art_jour_appr_date_idx'),
+            models.Index(fields=['journalist', 'date'],
+                         name='news_art_jour_date_idx'),
+            models.Index(fields=['approved', 'date'],
+                         name='news_art_appr_date_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so cache invalidation also covers the old sources
+        # when an edit moves the article.
+        instance._loaded_sources = (instance.__dict__.get('publisher_id'),
+                                    instance.__dict__.get('journalist_id'))
+        return instance
+
     def approve(self):
-        self.approved = True
-        self.save()
-        subscribers = set()
-        if self.publisher:
-            subscribers.update(
-                self.publisher.subscribers.all())
-        if self.journalist:
-            subscribers.update(
-                self.journalist.subscribers_journalists.all())
-        messages = [
-            ('New Article: ' + self.title, self.content,
-             settings.DEFAULT_FROM_EMAIL, [sub.email])
-            for sub in subscribers if sub.email
-        ]
-        send_mass_mail(messages, fail_silently=True)
-        tweet_new_article(self)
+        """Approves the article and queues its subscriber delivery."""
+        with transaction.atomic():
+            self.approved = True
+            self.save()
+            DeliveryJob.objects.create(article=self)
 
 
 class Newsletter(models.Model):
     title = models.CharField(max_length=255)
     content = models.TextField()
+    # Indexed through the composite feed indexes in Meta.
     publisher = models.ForeignKey(
         Publisher,
         on_delete=models.CASCADE,
-        null=True, blank=True)
+        null=True, blank=True, db_index=False)
     journalist = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE, null=True,
-        blank=True,
+        blank=True, db_index=False,
         limit_choices_to={'role': 'journalist'})
     approved = models.BooleanField(default=False)
     date = models.DateTimeField(auto_now_add=True)
 
+    objects = ContentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['publisher', 'approved', 'date'],
+                         name='news_nl_pub_appr_date_idx'),
+            # Publisher listings page over drafts as well.
+            models.Index(fields=['publisher', 'date'],
+                         name='news_nl_pub_date_idx'),
+            models.Index(fields=['journalist', 'approved', 'date'],
+                         name='news_nl_jour_appr_date_idx'),
+            models.Index(fields=['journalist', 'date'],
+                         name='news_nl_jour_date_idx'),
+            models.Index(fields=['approved', 'date'],
+                         name='news_nl_appr_date_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so cache invalidation also covers the old sources
+        # when an edit moves the newsletter.
+        instance._loaded_sources = (instance.__dict__.get('publisher_id'),
+                                    instance.__dict__.get('journalist_id'))
+        return instance
+
     def approve(self):
-        self.approved = True
-        self.save()
-        subscribers = set()
-        if self.publisher:
-            subscribers.update(
-                self.publisher.subscribers.all())
-        if self.journalist:
-            subscribers.update(
-                self.journalist.subscribers_journalists.all())
-        messages = [
-            ('New Newsletter: ' + self.title,
-             self.content, settings.DEFAULT_FROM_EMAIL, [sub.email])
-            for sub in subscribers if sub.email]
-        send_mass_mail(messages, fail_silently=True)
-        tweet_new_newsletter(self)
+        """Approves the newsletter and queues its subscriber delivery."""
+        with transaction.atomic():
+            self.approved = True
+            self.save()
+            DeliveryJob.objects.create(newsletter=self)
+
+
+class DeliveryJob(models.Model):
+    """Outbox entry for emailing and tweeting one approved item.
+
+    Jobs are drained by the ``process_deliveries`` management command, so
+    approving never waits on SMTP or Twitter.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    article = models.ForeignKey(
+        Article,
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='delivery_jobs')
+    newsletter = models.ForeignKey(
+        Newsletter,
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='delivery_jobs')
+    status = models.CharField(max_length=20,
+                              choices=STATUS_CHOICES,
+                              default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    recipients_resolved = models.BooleanField(default=False)
+    tweeted = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'],
+                         name='news_delivery_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"Delivery of {self.content} ({self.status})"
+
+    @property
+    def content(self):
+        return self.article or self.newsletter
+
+
+class DeliveryRecipient(models.Model):
+    """Per-subscriber delivery state for a :class:`DeliveryJob`."""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    job = models.ForeignKey(
+        DeliveryJob,
+        on_delete=models.CASCADE,
+        related_name='recipients')
+    email = models.EmailField()
+    status = models.CharField(max_length=20,
+                              choices=STATUS_CHOICES,
+                              default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'email'],
+                                    name='news_delivery_recipient_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['job', 'status'],
+                         name='news_delivery_rcpt_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.status})"
+
+
+class FeedEntry(models.Model):
+    """Materialised row of a reader's feed (fan-out on write).
+
+    Only maintained when ``NEWS_MATERIALIZED_FEED`` is enabled; see
+    :mod:`news.feed`.
+    """
+    reader = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='feed_entries')
+    article = models.ForeignKey(
+        Article,
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='feed_entries')
+    newsletter = models.ForeignKey(
+        Newsletter,
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='feed_entries')
+    date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reader', 'article'],
+                                    name='news_feed_reader_article_unique'),
+            models.UniqueConstraint(fields=['reader', 'newsletter'],
+                                    name='news_feed_reader_nl_unique'),
+        ]
+        # Feeds are paged on (date, content id); see news.feed.
+        indexes = [
+            models.Index(fields=['reader', 'date', 'article'],
+                         name='news_feed_reader_art_idx'),
+            models.Index(fields=['reader', 'date', 'newsletter'],
+                         name='news_feed_reader_nl_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reader}: {self.article or self.newsletter}"
+
+
+class ApiToken(models.Model):
+    """Long-lived API credential for a user.
+
+    Only a SHA-256 digest of the key is stored: keys are random, so a
+    fast hash is enough and checking one costs microseconds instead of a
+    PBKDF2 run. See :mod:`news.authentication`.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='api_tokens')
+    name = models.CharField(max_length=100, blank=True)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    prefix = models.CharField(max_length=8, editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user}: {self.name or self.prefix}"
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name=''):
+        """Creates a token for ``user``; returns ``(token, key)``.
+
+        The plain ``key`` is only available here and is never stored.
+        """
+        key = secrets.token_urlsafe(32)
+        token = cls.objects.create(user=user, name=name,
+                                   key_hash=cls.hash_key(key),
+                                   prefix=key[:8])
+        return token, key
@@ -0,0 +1,371 @@
+"""Query-count and latency regression checks for every view.
+
+:func:`run` seeds synthetic publishers, users, content and subscriptions
+at a small and a large scale and drives every URL in :mod:`news.urls` as
+each role. For every route and role it records the query count of a cold
+request (caches cleared), p50/p95 latency over warm repeats and peak
+Python memory. A route fails if its query count grows between the two
+scales, passes its budget or it returns a server error. Everything runs
+inside a transaction that is rolled back; ``manage.py benchmark_views``
+also runs it on a throwaway test database.
+"""
+import json
+import logging
+import math
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import get_resolver, reverse
+
+from . import search
+from .models import ApiToken, Article, CustomUser, Newsletter, Publisher
+
+ROLES = ('anonymous', 'reader', 'journalist', 'editor')
+DEFAULT_QUERY_BUDGET = 15
+# Routes that legitimately need more queries than the default budget.
+QUERY_BUDGETS = {}
+TOPICS = ('economy', 'volcano', 'election', 'football', 'science',
+          'weather', 'market', 'health')
+LOREM = ('Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua. ') * 8
+BATCH_SIZE = 5000
+
+Scale = namedtuple('Scale', 'publishers journalists readers articles '
+                            'newsletters subscriptions')
+
+
+class Route(namedtuple('Route', 'name method kwargs data query')):
+    """How to request one URL; ``kwargs``/``data`` take the dataset."""
+
+    @property
+    def api(self):
+        return self.name.startswith('api_')
+
+
+def route(name, method='get', kwargs=None, data=None, query=None):
+    return Route(name, method, kwargs, data, query)
+
+
+ROUTES = [
+    route('register'),
+    route('login'),
+    route('logout'),
+    route('home'),
+    route('journalist_dashboard'),
+    route('create_article'),
+    route('editor_dashboard'),
+    route('approval_queue'),
+    route('editor_dashboard_section',
+          kwargs=lambda d: {'section': 'approved_articles'}),
+    route('approve_article', kwargs=lambda d: {'pk': d.draft(Article)}),
+    route('subscribe'),
+    route('search', query={'q': 'volcano'}),
+    route('edit_article', kwargs=lambda d: {'pk': d.own(Article)}),
+    route('delete_article', 'post',
+          kwargs=lambda d: {'pk': d.draft(Article)}),
+    route('create_newsletter'),
+    route('edit_newsletter', kwargs=lambda d: {'pk': d.own(Newsletter)}),
+    route('delete_newsletter', 'post',
+          kwargs=lambda d: {'pk': d.draft(Newsletter)}),
+    route('approve_newsletter',
+          kwargs=lambda d: {'pk': d.draft(Newsletter)}),
+    route('api_articles', query={'client_id': None}),
+    route('api_timeline', query={'client_id': None}),
+    route('api_list_publisher_articles',
+          kwargs=lambda d: {'pk': d.publisher_ids[0]}),
+    route('api_approve_article', 'post',
+          kwargs=lambda d: {'pk': d.draft(Article)},
+          data=lambda d: {'approved': True}),
+    route('api_newsletters', query={'client_id': None}),
+    route('api_newsletter_detail',
+          kwargs=lambda d: {'pk': d.own(Newsletter)}),
+    route('api_list_publisher_newsletters',
+          kwargs=lambda d: {'pk': d.publisher_ids[0]}),
+    route('api_approve_newsletter', 'post',
+          kwargs=lambda d: {'pk': d.draft(Newsletter)}),
+    route('api_subscribe', 'post',
+          data=lambda d: {'client_id': d.reader.id,
+                          'publisher_id': d.unsubscribed()}),
+    route('api_bulk_subscribe', 'put',
+          data=lambda d: {'subscriptions': [
+              {'client_id': d.reader.id,
+               'publisher_ids': d.subscribed() + [d.unsubscribed()]}]}),
+    route('api_search', query={'q': 'volcano'}),
+    route('api_tokens'),
+    route('api_revoke_token', 'delete',
+          kwargs=lambda d: {'pk': d.token_id()}),
+    route('metrics'),
+]
+
+
+def url_names():
+    """Returns the names of all routes in :mod:`news.urls`."""
+    return {pattern.name for pattern in get_resolver('news.urls').url_patterns
+            if pattern.name}
+
+
+class Dataset:
+    """Synthetic data plus the users the routes act as."""
+
+    def __init__(self):
+        self.scale = Scale(0, 0, 0, 0, 0, 0)
+        self.password = make_password('perf-pass')
+        self.editor = CustomUser.objects.create(
+            username='perf-editor', password=self.password, role='editor')
+        self.publisher_ids, self.journalist_ids, self.reader_ids = [], [], []
+        self._tokens = {}
+        self._current = None
+
+    @property
+    def users(self):
+        return {'anonymous': None, 'reader': self.reader,
+                'journalist': self.journalist, 'editor': self.editor}
+
+    def _users(self, role, start, stop):
+        CustomUser.objects.bulk_create(
+            [CustomUser(username=f'perf-{role}-{i}', password=self.password,
+                        role=role)
+             for i in range(start, stop)], batch_size=BATCH_SIZE)
+        return list(CustomUser.objects.filter(role=role)
+                    .order_by('id').values_list('id', flat=True))
+
+    def _content(self, model, start, stop):
+        publishers, journalists = self.publisher_ids, self.journalist_ids
+        model.objects.bulk_create(
+            [model(title=f'{model.__name__} {i}',
+                   content=f'{TOPICS[i % len(TOPICS)]} report {i}. {LOREM}',
+                   publisher_id=publishers[i % len(publishers)],
+                   journalist_id=journalists[i % len(journalists)],
+                   approved=i % 10 != 0)
+             for i in range(start, stop)], batch_size=BATCH_SIZE)
+
+    def _subscriptions(self, start, stop):
+        Publishers = CustomUser.subscribed_publishers.through
+        Journalists = CustomUser.subscribed_journalists.through
+        readers = self.reader_ids
+        by_publisher, by_journalist = [], []
+        for k in range(start, stop):
+            reader, slot = readers[k % len(readers)], k // len(readers)
+            if slot % 2:
+                by_journalist.append(Journalists(
+                    from_customuser_id=reader,
+                    to_customuser_id=self.journalist_ids[
+                        slot // 2 % len(self.journalist_ids)]))
+            else:
+                by_publisher.append(Publishers(
+                    customuser_id=reader,
+                    publisher_id=self.publisher_ids[
+                        slot // 2 % len(self.publisher_ids)]))
+        Publishers.objects.bulk_create(by_publisher, batch_size=BATCH_SIZE,
+                                       ignore_conflicts=True)
+        Journalists.objects.bulk_create(by_journalist, batch_size=BATCH_SIZE,
+                                        ignore_conflicts=True)
+
+    def grow(self, scale):
+        """Adds rows until every total reaches ``scale``."""
+        old = self.scale
+        Publisher.objects.bulk_create(
+            [Publisher(name=f'Perf Publisher {i}')
+             for i in range(old.publishers, scale.publishers)],
+            batch_size=BATCH_SIZE)
+        self.publisher_ids = list(Publisher.objects.order_by('id')
+                                  .values_list('id', flat=True))
+        self.journalist_ids = self._users('journalist', old.journalists,
+                                          scale.journalists)
+        self.reader_ids = self._users('reader', old.readers, scale.readers)
+        self._content(Article, old.articles, scale.articles)
+        self._content(Newsletter, old.newsletters, scale.newsletters)
+        self._subscriptions(old.subscriptions, scale.subscriptions)
+        self.scale = scale
+        self.reader = CustomUser.objects.get(pk=self.reader_ids[0])
+        self.journalist = CustomUser.objects.get(pk=self.journalist_ids[0])
+        self.reader.subscribed_publishers.add(self.publisher_ids[0])
+        # Bulk inserts bypass the signals that keep the index current.
+        search.rebuild_index()
+
+    def draft(self, model):
+        """Creates an unapproved item by the journalist; returns its id."""
+        return model.objects.create(
+            title='Perf draft', content=LOREM,
+            publisher_id=self.publisher_ids[0],
+            journalist=self.journalist).pk
+
+    def own(self, model):
+        return model.objects.filter(journalist=self.journalist) \
+            .values_list('id', flat=True).first()
+
+    def subscribed(self):
+        return list(self.reader.subscribed_publishers
+                    .exclude(pk=self.publisher_ids[1])
+                    .values_list('id', flat=True))
+
+    def unsubscribed(self):
+        """Returns a publisher the reader has just unsubscribed from."""
+        publisher_id = self.publisher_ids[1]
+        self.reader.subscribed_publishers.remove(publisher_id)
+        return publisher_id
+
+    def token(self, user):
+        if user.pk not in self._tokens:
+            self._tokens[user.pk] = ApiToken.issue(user, 'perf')[1]
+        return self._tokens[user.pk]
+
+    def token_id(self):
+        return ApiToken.issue(self._current or self.editor, 'perf')[0].pk
+
+    def prepare(self, route, role):
+        """Creates what ``route`` needs as ``role``.
+
+        Returns a callable that performs the request, so that logging in
+        and fixture queries stay out of the measurement.
+        """
+        user = self.users[role]
+        self._current = user
+        path = reverse(route.name, kwargs=route.kwargs(self)
+                       if route.kwargs else None)
+        query = dict(route.query or {})
+        if 'client_id' in query:
+            query['client_id'] = self.reader.id
+        client = Client(raise_request_exception=False)
+        headers = {}
+        if user is not None:
+            if route.api:
+                headers['HTTP_AUTHORIZATION'] = f'Token {self.token(user)}'
+            else:
+                client.force_login(user)
+        data = route.data(self) if route.data else {}
+        send = getattr(client, route.method)
+        if route.method == 'get':
+            return lambda: _consume(send(path, query, **headers))
+        if route.api:
+            return lambda: _consume(send(
+                path, json.dumps(data), content_type='application/json',
+                **headers))
+        return lambda: _consume(send(path, data, **headers))
+
+
+Result = namedtuple('Result', 'route role status queries p50 p95 peak_kb')
+
+
+def _consume(response):
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def measure(dataset, route, role, repeat=5):
+    """Returns a :class:`Result` for ``route`` requested as ``role``.
+
+    The query count comes from a cold request with every cache cleared;
+    latency from ``repeat`` further requests and memory from one more.
+    """
+    send = dataset.prepare(route, role)
+    for cache in caches.all():
+        cache.clear()
+    # request_started clears the query log, so start from an empty one.
+    reset_queries()
+    with CaptureQueriesContext(connection) as ctx:
+        status = send().status_code
+    # captured_queries slices the live log, which later requests reset.
+    queries = len(ctx)
+    latencies = []
+    for _ in range(repeat):
+        send = dataset.prepare(route, role)
+        started = time.perf_counter()
+        send()
+        latencies.append(time.perf_counter() - started)
+    send = dataset.prepare(route, role)
+    tracemalloc.start()
+    try:
+        send()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    latencies = latencies or [0.0]
+    return Result(route.name, role, status, queries,
+                  statistics.median(latencies) * 1000,
+                  _percentile(latencies, 0.95) * 1000, peak / 1024)
+
+
+def check(small, large, budgets=None, default_budget=DEFAULT_QUERY_BUDGET):
+    """Compares two runs; returns a list of failure messages."""
+    budgets = {**QUERY_BUDGETS, **(budgets or {})}
+    before = {(r.route, r.role): r for r in small}
+    failures = []
+    for result in large:
+        key = result.route, result.role
+        budget = budgets.get(result.route, default_budget)
+        if result.status >= 500:
+            failures.append(f"{result.route} as {result.role} returned "
+                            f"{result.status}")
+        if result.queries > budget:
+            failures.append(f"{result.route} as {result.role} ran "
+                            f"{result.queries} queries (budget {budget})")
+        if key in before and result.queries > before[key].queries:
+            failures.append(f"{result.route} as {result.role} grew from "
+                            f"{before[key].queries} to {result.queries} "
+                            f"queries with the data size")
+    return failures
+
+
+class _Rollback(Exception):
+    pass
+
+
+def private_caches():
+    """Returns a ``CACHES`` setting of process-local caches.
+
+    Measurements clear the caches and fill them with entries keyed by
+    throwaway primary keys, so they must never touch the shared caches a
+    running server uses.
+    """
+    return {alias: {'BACKEND': 'django.core.cache.backends.locmem.'
+                               'LocMemCache',
+                    'LOCATION': f'news-perf-{alias}'}
+            for alias in settings.CACHES}
+
+
+def run(scales, repeat=5, routes=None, roles=ROLES, progress=None):
+    """Runs every route as every role at each of ``scales`` in turn.
+
+    Returns one list of :class:`Result` per scale. All data is rolled
+    back afterwards, and the caches used are private to this run.
+    """
+    routes = ROUTES if routes is None else routes
+    missing = url_names() - {r.name for r in ROUTES}
+    if missing:
+        raise ValueError(f"No perf route for {', '.join(sorted(missing))}")
+    runs = []
+    # Most roles are refused most routes; don't log every 401/403.
+    request_log = logging.getLogger('django.request')
+    level = request_log.level
+    request_log.setLevel(logging.ERROR)
+    try:
+        with override_settings(CACHES=private_caches()), \
+                transaction.atomic():
+            dataset = Dataset()
+            for scale in scales:
+                dataset.grow(scale)
+                if progress:
+                    progress(scale)
+                runs.append([measure(dataset, route, role, repeat)
+                             for route in routes for role in roles])
+            raise _Rollback
+    except _Rollback:
+        pass
+    finally:
+        request_log.setLevel(level)
+    return runs
@@ -0,0 +1,199 @@
+"""Fast and streaming JSON/XML renderers for the API.
+
+:class:`FastJSONRenderer` and :class:`FastXMLRenderer` produce exactly
+the bytes of the stock DRF JSON and ``rest_framework_xml`` renderers.
+The JSON one encodes with ``orjson`` when it is installed; the XML one
+writes tags and escaped text straight into a list of strings instead of
+going through the SAX ``XMLGenerator``. The streaming variants emit a
+listing in chunks, so a large page or archive never has to be rendered
+into a single buffer.
+"""
+from django.http import StreamingHttpResponse
+from django.utils.encoding import force_str
+from django.utils.xmlutils import UnserializableContentError
+from rest_framework.renderers import JSONRenderer
+from rest_framework_xml.renderers import XMLRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+CHUNK_SIZE = 64 * 1024
+
+_ORJSON_OPTIONS = 0
+if orjson is not None:
+    # Dates and dataclasses go through DRF's encoder, as with json.dumps.
+    _ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS |
+                       orjson.OPT_PASSTHROUGH_DATETIME |
+                       orjson.OPT_PASSTHROUGH_DATACLASS)
+
+# Every byte except the control characters rejected by
+# django.utils.xmlutils.SimplerXMLGenerator.characters.
+_CONTROL = {*range(0x09), 0x0B, 0x0C, *range(0x0E, 0x20)}
+_NON_CONTROL = bytes(b for b in range(256) if b not in _CONTROL)
+
+
+def _chunked(pieces, size=CHUNK_SIZE):
+    """Joins an iterable of byte strings into chunks of about ``size``."""
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Drop-in ``JSONRenderer`` that encodes compact output with orjson.
+
+    Indented or ASCII-only output, and anything orjson rejects, falls
+    back to the stock renderer. Floats are the one type orjson may spell
+    differently (``1e16`` rather than ``1e+16``); the API emits none.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=_ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # Escaped by JSONRenderer so the output is also valid JavaScript.
+        # Both start with 0xE2, which a single memchr rules out.
+        if b'\xe2' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028') \
+                     .replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastXMLRenderer(XMLRenderer):
+    """Drop-in ``XMLRenderer`` that builds the document as a string list."""
+
+    def _header(self):
+        return (f'<?xml version="1.0" encoding="{self.charset}"?>\n'
+                f'<{self.root_tag_name}>')
+
+    def _footer(self):
+        return f'</{self.root_tag_name}>'
+
+    def _text(self, data):
+        if data is None:
+            return ''
+        kind = type(data)
+        if kind is int or kind is bool:
+            return str(data)
+        text = data if kind is str else force_str(data)
+        # Control characters encode to the same bytes in UTF-8, and
+        # deleting every other byte is much cheaper than a regex search.
+        if text.encode('utf-8', 'surrogatepass').translate(None,
+                                                           _NON_CONTROL):
+            raise UnserializableContentError(
+                "Control characters are not supported in XML 1.0")
+        return text.replace('&', '&amp;').replace('>', '&gt;') \
+                   .replace('<', '&lt;')
+
+    def _write(self, out, data):
+        if isinstance(data, (list, tuple)):
+            start = f'<{self.item_tag_name}>'
+            end = f'</{self.item_tag_name}>'
+            for item in data:
+                if isinstance(item, (list, tuple, dict)):
+                    out.append(start)
+                    self._write(out, item)
+                    out.append(end)
+                else:
+                    out.append(start + self._text(item) + end)
+        elif isinstance(data, dict):
+            for key, value in data.items():
+                if isinstance(value, (list, tuple, dict)):
+                    out.append(f'<{key}>')
+                    self._write(out, value)
+                    out.append(f'</{key}>')
+                else:
+                    out.append(f'<{key}>{self._text(value)}</{key}>')
+        else:
+            out.append(self._text(data))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return ''
+        out = [self._header()]
+        self._write(out, data)
+        out.append(self._footer())
+        return ''.join(out)
+
+
+class StreamingJSONRenderer(FastJSONRenderer):
+    """JSON renderer with an incremental :meth:`stream` method."""
+
+    def _pieces(self, data, items, results_key):
+        if data is None:
+            yield b'['
+        else:
+            yield b'{'
+            for key, value in data.items():
+                yield self.render({key: value})[1:-1] + b','
+            yield self.render(results_key) + b':['
+        for index, item in enumerate(items):
+            yield (b',' if index else b'') + self.render(item)
+        yield b']' if data is None else b']}'
+
+    def stream(self, data, items, results_key='results'):
+        """Yields ``data`` with ``items`` rendered under ``results_key``.
+
+        With ``data`` of None the body is just the list of ``items``.
+        """
+        return _chunked(self._pieces(data, items, results_key))
+
+
+class StreamingXMLRenderer(FastXMLRenderer):
+    """XML renderer with an incremental :meth:`stream` method."""
+
+    def _pieces(self, data, items, results_key):
+        charset = self.charset
+        out = [self._header()]
+        if data is not None:
+            self._write(out, data)
+            out.append(f'<{results_key}>')
+        yield ''.join(out).encode(charset)
+        start = f'<{self.item_tag_name}>'
+        end = f'</{self.item_tag_name}>'
+        for item in items:
+            out = [start]
+            self._write(out, item)
+            out.append(end)
+            yield ''.join(out).encode(charset)
+        footer = self._footer()
+        if data is not None:
+            footer = f'</{results_key}>' + footer
+        yield footer.encode(charset)
+
+    def stream(self, data, items, results_key='results'):
+        """Yields ``data`` with ``items`` rendered under ``results_key``.
+
+        With ``data`` of None the body is just the list of ``items``.
+        """
+        return _chunked(self._pieces(data, items, results_key))
+
+
+def streaming_response(request, data, items, status=200):
+    """Streams ``data`` plus ``items`` with the negotiated renderer.
+
+    Pass ``data=None`` to stream a bare list.
+    """
+    renderer = request.accepted_renderer
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type += f'; charset={renderer.charset}'
+    return StreamingHttpResponse(renderer.stream(data, items),
+                                 status=status, content_type=content_type)
@@ -0,0 +1,190 @@
+"""Ranked full-text search over articles and newsletters.
+
+On MySQL, ``FULLTEXT`` indexes on ``(title, content)`` are queried with
+``MATCH ... AGAINST`` and maintained by the server. On SQLite an FTS5
+table, ``news_search``, holds one row per item under
+``rowid = id * 2 + kind`` and is updated from the save and delete
+signals; :func:`rebuild_index` refills it after bulk writes that bypass
+them. Both schemas are created by migration ``0008_search_index``.
+"""
+import re
+
+from django.conf import settings
+from django.db import NotSupportedError, connection, transaction
+from django.db.models.functions import Substr
+
+from .models import Article, Newsletter
+from .serializers import EXCERPT_LENGTH, make_excerpt
+
+KINDS = ('article', 'newsletter')
+MODELS = {'article': Article, 'newsletter': Newsletter}
+FTS_TABLE = 'news_search'
+# bm25() weights for the title and content columns.
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+BATCH_SIZE = 1000
+
+
+def page_size():
+    return getattr(settings, 'NEWS_SEARCH_PAGE_SIZE', 20)
+
+
+def terms(query):
+    """Splits ``query`` into lowercase word terms, dropping operators."""
+    return re.findall(r'\w+', query.lower())
+
+
+def _uses_fts5():
+    return connection.vendor == 'sqlite'
+
+
+def _rowid(kind, pk):
+    return pk * 2 + KINDS.index(kind)
+
+
+def index_content(content):
+    """Adds or refreshes ``content`` in the SQLite index."""
+    if not _uses_fts5():
+        return
+    kind = content._meta.model_name
+    rowid = _rowid(kind, content.pk)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [rowid])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content, approved) '
+            f'VALUES (%s, %s, %s, %s)',
+            [rowid, content.title, content.content, content.approved])
+
+
+def remove_content(content):
+    """Drops ``content`` from the SQLite index."""
+    if not _uses_fts5():
+        return
+    rowid = _rowid(content._meta.model_name, content.pk)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [rowid])
+
+
+def rebuild_index():
+    """Rebuilds the SQLite index from scratch; returns the rows indexed."""
+    if not _uses_fts5():
+        return 0
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        for kind, model in MODELS.items():
+            rows = model.objects.values_list(
+                'id', 'title', 'content', 'approved').order_by('id')
+            batch = []
+            for pk, title, content, approved in rows.iterator(BATCH_SIZE):
+                batch.append((_rowid(kind, pk), title, content, approved))
+                if len(batch) == BATCH_SIZE:
+                    total += _insert(cursor, batch)
+                    batch = []
+            total += _insert(cursor, batch)
+    return total
+
+
+def _insert(cursor, rows):
+    if rows:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content, approved) '
+            f'VALUES (%s, %s, %s, %s)', rows)
+    return len(rows)
+
+
+def _fts5_hits(words, include_unapproved, kind, limit, offset):
+    where = [f'{FTS_TABLE} MATCH %s']
+    # Quoted terms are matched literally and ANDed together.
+    params = [' '.join(f'"{word}"' for word in words)]
+    if not include_unapproved:
+        where.append('approved = 1')
+    if kind:
+        where.append('rowid %% 2 = %s')
+        params.append(KINDS.index(kind))
+    sql = (f'SELECT rowid, bm25({FTS_TABLE}, %s, %s) AS score '
+           f'FROM {FTS_TABLE} WHERE {" AND ".join(where)} '
+           f'ORDER BY score, rowid DESC LIMIT %s OFFSET %s')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [TITLE_WEIGHT, CONTENT_WEIGHT, *params,
+                             limit, offset])
+        # bm25() is lower for better matches.
+        return [(KINDS[rowid % 2], rowid // 2, -score)
+                for rowid, score in cursor.fetchall()]
+
+
+def _fulltext_hits(words, include_unapproved, kind, limit, offset):
+    text = ' '.join(words)
+    selects, params = [], []
+    for name in ([kind] if kind else KINDS):
+        table = MODELS[name]._meta.db_table
+        match = 'MATCH (title, content) AGAINST (%s IN NATURAL LANGUAGE MODE)'
+        where = match + ('' if include_unapproved else ' AND approved')
+        selects.append(f"SELECT '{name}' AS kind, id, date, {match} AS score "
+                       f"FROM {table} WHERE {where}")
+        params += [text, text]
+    sql = (f'SELECT kind, id, score FROM ({" UNION ALL ".join(selects)}) '
+           f'AS hits ORDER BY score DESC, date DESC, id DESC '
+           f'LIMIT %s OFFSET %s')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit, offset])
+        return [(name, pk, score) for name, pk, score in cursor.fetchall()]
+
+
+def _load(hits):
+    """Fetches the listed fields for ``hits`` with one query per kind."""
+    rows = {}
+    for kind, model in MODELS.items():
+        ids = [pk for name, pk, _ in hits if name == kind]
+        if ids:
+            for row in (model.objects.filter(id__in=ids)
+                        .annotate(excerpt_source=Substr(
+                            'content', 1, EXCERPT_LENGTH + 1))
+                        .values('id', 'title', 'date', 'publisher',
+                                'journalist', 'excerpt_source')):
+                rows[kind, row['id']] = row
+    items = []
+    for kind, pk, score in hits:
+        row = rows.get((kind, pk))
+        if row is None:
+            # Deleted since it was indexed.
+            continue
+        items.append({
+            'type': kind,
+            'id': pk,
+            'title': row['title'],
+            'date': row['date'],
+            'publisher': row['publisher'],
+            'journalist': row['journalist'],
+            'excerpt': make_excerpt(row['excerpt_source']),
+            'score': score,
+        })
+    return items
+
+
+def search(query, include_unapproved=False, kind=None, page=1, size=None):
+    """Returns one page of ranked matches for ``query``, best first.
+
+    ``kind`` limits results to ``'article'`` or ``'newsletter'``. The page
+    is a dict with ``items``, ``page``, ``previous_page`` and
+    ``next_page``; each item has ``type``, ``id``, ``title``, ``date``,
+    ``publisher``, ``journalist``, ``excerpt`` and ``score``.
+    """
+    if kind is not None and kind not in KINDS:
+        raise ValueError(f"Unknown content type: {kind}")
+    size = size or page_size()
+    page = max(page, 1)
+    words = terms(query)
+    hits = []
+    if words:
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise NotSupportedError("Full-text search needs MySQL or SQLite")
+        find = _fts5_hits if _uses_fts5() else _fulltext_hits
+        hits = find(words, include_unapproved, kind, size + 1,
+                    (page - 1) * size)
+    return {
+        'items': _load(hits[:size]),
+        'page': page,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if len(hits) > size else None,
+    }
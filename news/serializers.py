@@ -1,5 +1,13 @@
-from rest_framework import serializers
-from .models import Article
+from django.conf import settings
+from django.db.models.functions import Substr
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .models import ApiToken, Article, Newsletter
+
+EXCERPT_LENGTH = getattr(settings, 'NEWS_EXCERPT_LENGTH', 200)
+SUMMARY_FIELDS = ['id', 'title', 'date', 'publisher', 'journalist',
+                  'excerpt']
 
 
 class ArticleSerializer(serializers.ModelSerializer):
@@ -21,8 +29,276 @@ class ArticleSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """Shortens ``text`` to at most ``length`` characters on a word break."""
+    if len(text) <= length:
+        return text
+    cut = text[:length - 3]
+    if not text[length - 3].isspace() and ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip() + '...'
+
+
+class _FieldSelectionMixin:
+    """Read-only listing limited to the ``fields`` passed in.
+
+    ``excerpt`` is built from an ``excerpt_source`` annotation holding
+    just the start of the body, see :func:`article_listing`.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_excerpt(self, item):
+        return make_excerpt(item.excerpt_source)
+
+
+class ArticleListSerializer(_FieldSelectionMixin,
+                            serializers.ModelSerializer):
+    """Read-only article listing limited to the requested fields."""
+    excerpt = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Article
+        fields = ArticleSerializer.Meta.fields + ['excerpt']
+        read_only_fields = fields
+
+
+class NewsletterSerializer(serializers.ModelSerializer):
+    """Serializer for Newsletter model with journalist validation.
+
+    Includes the publisher and journalist names, so load instances with
+    ``select_related('publisher', 'journalist')``.
+    """
+    publisher_name = serializers.CharField(source='publisher.name',
+                                           read_only=True, default=None)
+    journalist_name = serializers.CharField(source='journalist.username',
+                                            read_only=True, default=None)
+
+    class Meta:
+        model = Newsletter
+        fields = ['id', 'title', 'content',
+                  'publisher', 'publisher_name',
+                  'journalist', 'journalist_name', 'approved',
+                  'date']
+        read_only_fields = ['id', 'date', 'approved']
+
+    def create(self, validated_data):
+        """Creates a newsletter, restricted to journalists."""
+        journalist = self.context['request'].user
+        if journalist.role != 'journalist':
+            raise serializers.ValidationError(
+                "Only journalists can create newsletters")
+        validated_data['journalist'] = journalist
+        return super().create(validated_data)
+
+
+class NewsletterListSerializer(_FieldSelectionMixin,
+                               serializers.ModelSerializer):
+    """Read-only newsletter listing limited to the requested fields."""
+    publisher_name = serializers.CharField(source='publisher.name',
+                                           read_only=True, default=None)
+    journalist_name = serializers.CharField(source='journalist.username',
+                                            read_only=True, default=None)
+    excerpt = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Newsletter
+        fields = NewsletterSerializer.Meta.fields + ['excerpt']
+        read_only_fields = fields
+
+
+# Fields whose to_representation is the identity on ``.values()`` output.
+_PASSTHROUGH = (serializers.IntegerField, serializers.CharField,
+                serializers.BooleanField)
+
+
+def _datetime_converter(field):
+    """Returns a converter matching ``field.to_representation`` for aware
+    datetimes, with the output timezone resolved once instead of per row.
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    tz = field.timezone if hasattr(field, 'timezone') \
+        else field.default_timezone()
+    if tz is None:
+        return field.to_representation
+
+    def convert(value):
+        if not timezone.is_aware(value):
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _converter(name, field):
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return field.pk_field.to_representation if field.pk_field else None
+    if (isinstance(field, (serializers.SerializerMethodField,
+                           serializers.RelatedField,
+                           serializers.BaseSerializer))
+            or field.source == '*' or '.' in field.source):
+        raise TypeError(f"Field {name!r} can't be read from a values row")
+    if type(field) in _PASSTHROUGH:
+        return None
+    if type(field) is serializers.DateTimeField:
+        return _datetime_converter(field)
+    return field.to_representation
+
+
+class RowSerializer:
+    """Fast read-only counterpart of a ``ModelSerializer`` for listings.
+
+    Works on ``.values()`` rows with one converter per field worked out up
+    front (``None`` where the value is already in output form), skipping
+    DRF's per-row field machinery. The output is identical to the
+    serializer's ``.data``. ``overrides`` maps a field name to a
+    ``(column, converter)`` pair for fields that are not plain columns.
+    """
+
+    def __init__(self, serializer, overrides=None):
+        overrides = overrides or {}
+        self._fields = []
+        for name, field in serializer.fields.items():
+            if name in overrides:
+                column, convert = overrides[name]
+            else:
+                column, convert = field.source, _converter(name, field)
+            self._fields.append((name, column, convert))
+        self.columns = [column for _, column, _ in self._fields]
+
+    def to_representation(self, row):
+        data = {}
+        for name, column, convert in self._fields:
+            value = row[column]
+            if convert is not None and value is not None:
+                value = convert(value)
+            data[name] = value
+        return data
+
+    def rows(self, queryset, *extra):
+        """Returns ``queryset`` as ``.values()`` rows holding our columns."""
+        return queryset.values(*dict.fromkeys(self.columns + list(extra)))
+
+
+def selected_fields(params, list_serializer_class):
+    """Returns the fields picked by ``view``/``fields``, or None for all.
+
+    Raises ``ValidationError`` for unknown views or fields.
+    """
+    view = params.get('view', 'full')
+    if params.get('fields'):
+        fields = [f.strip() for f in params['fields'].split(',')
+                  if f.strip()]
+    elif view == 'summary':
+        fields = SUMMARY_FIELDS
+    elif view == 'full':
+        return None
+    else:
+        raise serializers.ValidationError(
+            {'view': "Must be 'full' or 'summary'."})
+    unknown = set(fields) - set(list_serializer_class.Meta.fields)
+    if unknown:
+        raise serializers.ValidationError(
+            {'fields': f"Unknown fields: {', '.join(sorted(unknown))}."})
+    return fields
+
+
+def with_excerpt(queryset):
+    """Annotates the ``excerpt_source`` the list serializers read."""
+    return queryset.annotate(
+        excerpt_source=Substr('content', 1, EXCERPT_LENGTH + 1))
+
+
+def _listing(queryset, params, serializer, list_serializer_class,
+             overrides=None):
+    overrides = dict(overrides or {})
+    fields = selected_fields(params, list_serializer_class)
+    if fields is None:
+        rows = RowSerializer(serializer, overrides)
+        return rows.rows(queryset, 'id', 'date'), rows
+    if 'excerpt' in fields:
+        queryset = with_excerpt(queryset)
+    overrides['excerpt'] = ('excerpt_source', make_excerpt)
+    rows = RowSerializer(list_serializer_class(fields=fields), overrides)
+    return rows.rows(queryset, 'id', 'date'), rows
+
+
+def article_listing(queryset, params):
+    """Applies the ``view``/``fields`` query options to an article listing.
+
+    ``view=summary`` selects :data:`SUMMARY_FIELDS`; ``fields`` takes a
+    comma-separated list and wins over ``view``. Only the needed columns
+    are read, so a listing without ``content`` never loads the body.
+    Returns ``(rows, serializer)``: ``.values()`` rows (always including
+    ``id`` and ``date`` for paging) and a :class:`RowSerializer` for them.
+    Raises ``ValidationError`` for unknown views or fields.
+    """
+    return _listing(queryset, params, ArticleSerializer(),
+                    ArticleListSerializer)
+
+
+def newsletter_listing(queryset, params):
+    """:func:`article_listing` for newsletters.
+
+    The publisher and journalist names are read through the same join
+    ``select_related`` would use, and only when selected.
+    """
+    return _listing(queryset, params, NewsletterSerializer(),
+                    NewsletterListSerializer, {
+                        'publisher_name': ('publisher__name', None),
+                        'journalist_name': ('journalist__username', None),
+                    })
+
+
 class ApproveArticleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Article
         fields = ['id', 'approved']
         read_only_fields = ['id']
+
+
+class SubscriptionSyncSerializer(serializers.Serializer):
+    """One reader's complete set of subscriptions for a bulk update."""
+    client_id = serializers.IntegerField()
+    publisher_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_null=True)
+    journalist_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_null=True)
+
+
+class ApiTokenSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ApiToken
+        fields = ['id', 'name', 'prefix', 'created']
+        read_only_fields = ['id', 'prefix', 'created']
+
+
+class TimelineItemSerializer(serializers.Serializer):
+    """One entry of :func:`news.timeline.reader_timeline`."""
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    date = serializers.DateTimeField()
+    publisher = serializers.IntegerField(allow_null=True)
+    journalist = serializers.IntegerField(allow_null=True)
+    excerpt = serializers.CharField()
+
+
+class SearchResultSerializer(serializers.Serializer):
+    """One ranked hit from :func:`news.search.search`."""
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    date = serializers.DateTimeField()
+    publisher = serializers.IntegerField(allow_null=True)
+    journalist = serializers.IntegerField(allow_null=True)
+    excerpt = serializers.CharField()
+    score = serializers.FloatField()
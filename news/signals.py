@@ -0,0 +1,116 @@
+"""Signal handlers keeping derived data in step with the models."""
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication, feed, feed_cache, search
+from .models import ApiToken, CustomUser, Article, Newsletter
+from .models import forget_role_groups, provision_role_groups
+
+
+def _kind(sender):
+    if sender is CustomUser.subscribed_publishers.through:
+        return 'publisher'
+    return 'journalist'
+
+
+def _linked_ids(sender, instance, reverse):
+    # The ids on the other side of ``instance``'s follows in ``sender``.
+    if sender is CustomUser.subscribed_publishers.through:
+        related = instance.subscribers if reverse \
+            else instance.subscribed_publishers
+    else:
+        related = instance.subscribers_journalists if reverse \
+            else instance.subscribed_journalists
+    return list(related.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=CustomUser.subscribed_publishers.through)
+@receiver(m2m_changed, sender=CustomUser.subscribed_journalists.through)
+def subscriptions_changed(sender, instance, action, reverse, pk_set,
+                          **kwargs):
+    """Refreshes cached and materialised feeds of readers who changed follows.
+
+    On the reverse side (``publisher.subscribers``) ``instance`` is the
+    followed object and ``pk_set`` holds the readers. A clear has no
+    ``pk_set``, so the ids it removes are captured in ``pre_clear``.
+    Materialised timelines only gain or lose the changed sources' rows.
+    """
+    if action == 'pre_clear':
+        instance._cleared_ids = _linked_ids(sender, instance, reverse)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_ids', [])
+    if reverse:
+        reader_ids = list(pk_set)
+        pairs = [(reader_id, instance.pk) for reader_id in reader_ids]
+    else:
+        reader_ids = [instance.pk]
+        pairs = [(instance.pk, source_id) for source_id in pk_set]
+    feed_cache.invalidate_subscriptions(reader_ids)
+    if pairs and feed.is_materialized():
+        if action == 'post_add':
+            feed.add_follows(_kind(sender), pairs)
+        else:
+            feed.drop_follows(_kind(sender), pairs)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=Newsletter)
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=Newsletter)
+def content_changed(sender, instance, **kwargs):
+    """Invalidates the cached feeds that can show ``instance``."""
+    feed_cache.invalidate_content(instance)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=Newsletter)
+def content_moved(sender, instance, **kwargs):
+    """Re-targets materialised timeline rows when an edit moved
+    ``instance`` to another publisher or journalist."""
+    loaded = getattr(instance, '_loaded_sources', None)
+    if loaded and feed.is_materialized() and \
+            loaded != (instance.publisher_id, instance.journalist_id):
+        feed.refresh_content(instance)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=Newsletter)
+def content_saved(sender, instance, update_fields=None, **kwargs):
+    """Refreshes ``instance`` in the search index if a searched field may
+    have changed."""
+    if update_fields is None or \
+            {'title', 'content', 'approved'} & set(update_fields):
+        search.index_content(instance)
+
+
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=Newsletter)
+def content_deleted(sender, instance, **kwargs):
+    search.remove_content(instance)
+
+
+@receiver(post_delete, sender=ApiToken)
+def token_deleted(sender, instance, **kwargs):
+    authentication.forget_token(instance.key_hash)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    """Drops the user's cached copy used by token authentication."""
+    authentication.forget_user(instance.pk)
+
+
+def provision_groups_after_migrate(sender, using, **kwargs):
+    """Creates and syncs the role groups once the schema is in place."""
+    if using == 'default':
+        provision_role_groups()
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    forget_role_groups()
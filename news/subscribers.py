@@ -0,0 +1,66 @@
+"""Streaming resolution of the audience for an article or newsletter.
+
+Followers are read from the two subscription through tables rather than
+from the user table: each source is walked in keyset order of the
+through rows' ids, which its foreign-key index already holds, so every
+chunk is a short range scan however large the audience grows. Readers
+following both sources are only matched through the publisher.
+
+Each reader is yielded once, but email addresses are not unique across
+readers, so two accounts can share one. Deduplicating them here would
+need a sort over the whole audience. The delivery outbox leaves that to
+the ``(job, email)`` unique constraint of
+:class:`~news.models.DeliveryRecipient` instead.
+"""
+from django.db.models import Exists, OuterRef
+
+from .models import CustomUser
+
+CHUNK_SIZE = 1000
+
+
+def _followers(publisher_id=None, journalist_id=None):
+    """Yields ``(through rows, reader field)`` for each source followed."""
+    Publishers = CustomUser.subscribed_publishers.through
+    Journalists = CustomUser.subscribed_journalists.through
+    if publisher_id:
+        yield (Publishers.objects.filter(publisher_id=publisher_id),
+               'customuser')
+    if journalist_id:
+        rows = Journalists.objects.filter(to_customuser_id=journalist_id)
+        if publisher_id:
+            rows = rows.exclude(Exists(Publishers.objects.filter(
+                publisher_id=publisher_id,
+                customuser_id=OuterRef('from_customuser_id'))))
+        yield rows, 'from_customuser'
+
+
+def _iter_followers(content, column, chunk_size):
+    for rows, reader in _followers(content.publisher_id,
+                                   content.journalist_id):
+        if column == 'email':
+            rows = rows.exclude(**{f'{reader}__email': ''})
+        rows = rows.values_list('id', f'{reader}__{column}').order_by('id')
+        last = 0
+        while True:
+            chunk = list(rows.filter(id__gt=last)[:chunk_size])
+            if chunk:
+                yield [value for _, value in chunk]
+            if len(chunk) < chunk_size:
+                break
+            last = chunk[-1][0]
+
+
+def iter_subscriber_ids(content, chunk_size=CHUNK_SIZE):
+    """Yields lists of at most ``chunk_size`` distinct subscriber ids."""
+    return _iter_followers(content, 'id', chunk_size)
+
+
+def iter_subscriber_emails(content, chunk_size=CHUNK_SIZE):
+    """Yields lists of at most ``chunk_size`` subscriber emails.
+
+    Each subscriber appears once, though an address shared by several
+    accounts repeats; readers without an email are skipped. Memory use
+    stays bounded by ``chunk_size`` regardless of audience size.
+    """
+    return _iter_followers(content, 'email', chunk_size)
@@ -0,0 +1,112 @@
+"""Bulk synchronisation of reader subscriptions with set semantics."""
+from django.db import transaction
+from django.db.models import Q
+
+from . import feed, feed_cache
+from .models import CustomUser, Publisher
+
+# kind -> (through model, reader column, target column)
+RELATIONS = {
+    'publisher': (CustomUser.subscribed_publishers.through,
+                  'customuser_id', 'publisher_id'),
+    'journalist': (CustomUser.subscribed_journalists.through,
+                   'from_customuser_id', 'to_customuser_id'),
+}
+
+
+def _valid_ids(kind, ids):
+    if kind == 'publisher':
+        targets = Publisher.objects.filter(id__in=ids)
+    else:
+        targets = CustomUser.objects.filter(id__in=ids, role='journalist')
+    return set(targets.values_list('id', flat=True))
+
+
+def _current(kind, reader_ids):
+    through, reader_field, target_field = RELATIONS[kind]
+    current = {pk: set() for pk in reader_ids}
+    rows = through.objects.filter(**{reader_field + '__in': reader_ids}) \
+        .values_list(reader_field, target_field)
+    for reader_id, target_id in rows:
+        current[reader_id].add(target_id)
+    return current
+
+
+def sync_subscriptions(items):
+    """Replaces the subscriptions of several readers at once.
+
+    ``items`` is a list of dicts with ``client_id`` and optional
+    ``publisher_ids``/``journalist_ids`` lists; an omitted list is left
+    untouched. Ids are validated with one ``IN`` query per kind and the
+    net change per reader against the stored state is applied with one
+    bulk insert and one delete per kind, in a single transaction, so
+    repeated ``client_id`` items end in the state of the last one.
+    Materialised timelines only gain or lose the changed sources' rows.
+    Returns one result dict per item, in order.
+    """
+    readers = set(CustomUser.objects.filter(
+        id__in={item['client_id'] for item in items}, role='reader')
+        .values_list('id', flat=True))
+    valid = {
+        kind: _valid_ids(kind, set().union(
+            *(item.get(f'{kind}_ids') or () for item in items)))
+        for kind in RELATIONS
+    }
+
+    results, changed = [], set()
+    follows, unfollows = {}, {}
+    with transaction.atomic():
+        stored = {kind: _current(kind, readers) for kind in RELATIONS}
+        current = {kind: dict(stored[kind]) for kind in RELATIONS}
+        for item in items:
+            client_id = item['client_id']
+            if client_id not in readers:
+                results.append({'client_id': client_id, 'status': 'error',
+                                'error': 'Invalid client'})
+                continue
+            result = {'client_id': client_id, 'status': 'ok'}
+            for kind in RELATIONS:
+                if item.get(f'{kind}_ids') is None:
+                    continue
+                wanted = set(item[f'{kind}_ids'])
+                invalid = sorted(wanted - valid[kind])
+                wanted &= valid[kind]
+                existing = current[kind][client_id]
+                added = sorted(wanted - existing)
+                removed = sorted(existing - wanted)
+                # Later items for the same reader see this item's result.
+                current[kind][client_id] = wanted
+                result[f'added_{kind}s'] = added
+                result[f'removed_{kind}s'] = removed
+                if invalid:
+                    result[f'invalid_{kind}s'] = invalid
+            results.append(result)
+        for kind, (through, reader_field, target_field) \
+                in RELATIONS.items():
+            follows[kind], unfollows[kind], removals = [], [], Q()
+            for reader_id, wanted in current[kind].items():
+                before = stored[kind][reader_id]
+                follows[kind] += [(reader_id, pk)
+                                  for pk in sorted(wanted - before)]
+                unfollows[kind] += [(reader_id, pk)
+                                    for pk in sorted(before - wanted)]
+                if before - wanted:
+                    removals |= Q(**{reader_field: reader_id,
+                                     target_field + '__in':
+                                     sorted(before - wanted)})
+                if wanted != before:
+                    changed.add(reader_id)
+            if removals:
+                through.objects.filter(removals).delete()
+            through.objects.bulk_create(
+                [through(**{reader_field: reader_id, target_field: pk})
+                 for reader_id, pk in follows[kind]],
+                ignore_conflicts=True)
+        # Bulk operations on the through tables bypass m2m_changed.
+        if feed.is_materialized():
+            for kind in RELATIONS:
+                feed.drop_follows(kind, unfollows[kind])
+                feed.add_follows(kind, follows[kind])
+
+    feed_cache.invalidate_subscriptions(changed)
+    return results
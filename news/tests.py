@@ -1,6 +1,72 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest.mock import ANY, patch
+from urllib.request import urlopen
+from django.conf import settings
+from django.contrib.auth.models import Group, update_last_login
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.mail import EmailMessage
+from django.db import connection
+from django.http import HttpRequest
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.xmlutils import UnserializableContentError
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from .models import CustomUser, Publisher, Article
+from rest_framework_xml.renderers import XMLRenderer
+from . import metrics, perf
+from .authentication import TokenAuthentication, api_authentication
+from .checks import check_shared_caches
+from .delivery import run_pending
+from .feed import check_reader, reader_articles, reader_newsletters
+from .pagination import CursorError
+from .timeline import reader_timeline
+from .feed_cache import get_reader_timeline, get_subscriptions
+from .renderers import FastJSONRenderer, FastXMLRenderer
+from .renderers import StreamingJSONRenderer, StreamingXMLRenderer
+from .serializers import ArticleSerializer, SUMMARY_FIELDS, make_excerpt
+from .serializers import ArticleListSerializer, RowSerializer
+from .mail import MailDispatcher, reset_dispatcher
+from .twitter_api import get_twitter_client, reset_twitter_client
+from .twitter_api import announce, reset_tweet_dispatcher
+from .tweet_dispatcher import RateLimited, TokenBucket, TweetDispatcher
+from .models import CustomUser, Publisher, Article, Newsletter
+from .models import ApiToken, DeliveryJob, FeedEntry
+from .models import ROLE_PERMISSIONS, forget_role_groups, role_group_name
+from .subscribers import iter_subscriber_emails
+
+
+# Request tracing is random; tests that check it turn it back on. The
+# shared on-disk caches belong to the dev server, so tests use their own.
+_isolated = override_settings(NEWS_REQUEST_SAMPLE_RATE=0,
+                              CACHES=perf.private_caches())
+
+
+def setUpModule():
+    _isolated.enable()
+
+
+def tearDownModule():
+    _isolated.disable()
+
+
+def streamed_json(response):
+    return json.loads(b''.join(response.streaming_content))
 
 
 class APITestCase(TestCase):
@@ -28,7 +94,7 @@ class APITestCase(TestCase):
         self.client.force_authenticate(self.reader)
         response = self.client.get('/api/articles/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(streamed_json(response)['results']), 1)
 
     def test_get_articles_unauthorized(self):
         self.client.force_authenticate(self.journalist)
@@ -54,7 +120,7 @@ class APITestCase(TestCase):
         response = self.client.get(
             f'/api/articles/publisher/{self.publisher.id}/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(streamed_json(response)['results']), 1)
 
     def test_approve_article_editor(self):
         unapproved_article = Article.objects.create(
@@ -82,3 +148,1887 @@ class APITestCase(TestCase):
             data, format='json'
         )
         self.assertEqual(response.status_code, 403)
+
+
+@override_settings(NEWS_MAIL_RETRY_BACKOFF=0)
+class DeliveryQueueTestCase(TestCase):
+    """Tests the approval outbox and its worker."""
+    def setUp(self):
+        reset_dispatcher()
+        self.addCleanup(reset_dispatcher)
+        self.journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        for i in range(3):
+            reader = CustomUser.objects.create_user(
+                username=f'reader{i}', password='pass', role='reader',
+                email=f'reader{i}@example.com'
+            )
+            reader.subscribed_publishers.add(self.publisher)
+        self.article = Article.objects.create(
+            title='Queued', content='Content', publisher=self.publisher,
+            journalist=self.journalist
+        )
+
+    def test_approve_only_enqueues(self):
+        self.article.approve()
+        self.assertTrue(Article.objects.get(id=self.article.id).approved)
+        self.assertEqual(len(mail.outbox), 0)
+        job = DeliveryJob.objects.get(article=self.article)
+        self.assertEqual(job.status, 'pending')
+
+    @patch('news.delivery.announce', return_value=True)
+    def test_worker_sends_and_records_recipients(self, tweet):
+        self.article.approve()
+        self.assertEqual(run_pending(), 1)
+        job = DeliveryJob.objects.get(article=self.article)
+        self.assertEqual(job.status, 'done')
+        self.assertTrue(job.tweeted)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            job.recipients.filter(status='sent').count(), 3)
+        tweet.assert_called_once_with([self.article], max_wait=ANY)
+        self.assertLess(tweet.call_args.kwargs['max_wait'],
+                        settings.NEWS_DELIVERY_LEASE)
+        self.assertEqual(run_pending(), 0)
+
+    @patch('news.delivery.TWEET_WINDOW', 60)
+    @patch('news.delivery.announce', return_value=True)
+    def test_burst_is_tweeted_once(self, tweet):
+        other = Article.objects.create(
+            title='Also queued', content='Content',
+            publisher=self.publisher, journalist=self.journalist
+        )
+        self.article.approve()
+        other.approve()
+        self.assertEqual(run_pending(), 2)
+        tweet.assert_not_called()
+        self.assertEqual(len(mail.outbox), 6)
+        jobs = DeliveryJob.objects.order_by('id')
+        self.assertEqual({job.status for job in jobs}, {'pending'})
+        self.assertEqual(len({job.available_at for job in jobs}), 1)
+        jobs.update(available_at=timezone.now())
+        self.assertEqual(run_pending(), 2)
+        tweet.assert_called_once_with([self.article, other], max_wait=ANY)
+        self.assertEqual([(job.status, job.tweeted, job.attempts)
+                          for job in jobs], [('done', True, 1)] * 2)
+
+    @patch('news.delivery.announce', side_effect=RateLimited(600))
+    def test_rate_limit_postpones_without_an_attempt(self, tweet):
+        self.article.approve()
+        run_pending()
+        job = DeliveryJob.objects.get(article=self.article)
+        self.assertEqual((job.status, job.attempts), ('pending', 0))
+        self.assertGreater(job.available_at,
+                           timezone.now() + timezone.timedelta(seconds=500))
+        self.assertEqual(len(mail.outbox), 3)
+
+    @patch('news.delivery.announce', return_value=None)
+    def test_missing_token_does_not_retry(self, tweet):
+        self.article.approve()
+        with self.assertLogs('news.delivery', 'WARNING'):
+            run_pending()
+        job = DeliveryJob.objects.get(article=self.article)
+        self.assertEqual((job.status, job.tweeted), ('done', False))
+        self.assertEqual(len(mail.outbox), 3)
+
+    @patch('news.delivery.announce', return_value=True)
+    def test_shared_address_is_emailed_once(self, tweet):
+        twin = CustomUser.objects.create_user(
+            username='twin', password='pass', role='reader',
+            email='Reader0@Example.com')
+        twin.subscribed_publishers.add(self.publisher)
+        self.article.approve()
+        run_pending()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         [f'reader{i}@example.com' for i in range(3)])
+
+    @patch('news.delivery.announce', return_value=False)
+    def test_failed_tweet_keeps_job_open(self, tweet):
+        self.article.approve()
+        run_pending()
+        job = DeliveryJob.objects.get(article=self.article)
+        self.assertEqual(job.status, 'pending')
+        self.assertFalse(job.tweeted)
+        self.assertEqual(job.last_error, "Tweet was not posted")
+        tweet.return_value = True
+        DeliveryJob.objects.filter(id=job.id).update(
+            available_at=timezone.now())
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertTrue(job.tweeted)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @patch('news.delivery.announce', return_value=True)
+    def test_worker_retries_failed_recipients(self, tweet):
+        self.article.approve()
+        with patch('django.core.mail.backends.locmem.EmailBackend'
+                   '.send_messages', side_effect=OSError('down')):
+            run_pending()
+        job = DeliveryJob.objects.get(article=self.article)
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.recipients.filter(status='failed').count(), 3)
+        DeliveryJob.objects.filter(id=job.id).update(
+            available_at=timezone.now())
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class SubscriberResolutionTestCase(TestCase):
+    """Tests the streaming subscriber email resolution."""
+    def setUp(self):
+        self.journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        for i in range(5):
+            reader = CustomUser.objects.create_user(
+                username=f'reader{i}', password='pass', role='reader',
+                email=f'reader{i}@example.com'
+            )
+            reader.subscribed_publishers.add(self.publisher)
+            if i % 2:
+                reader.subscribed_journalists.add(self.journalist)
+        CustomUser.objects.create_user(
+            username='noemail', password='pass', role='reader'
+        ).subscribed_journalists.add(self.journalist)
+        self.article = Article.objects.create(
+            title='Test', content='Content', publisher=self.publisher,
+            journalist=self.journalist
+        )
+
+    def test_chunks_are_distinct_and_bounded(self):
+        # Three publisher chunks, then one for the journalist's followers.
+        with self.assertNumQueries(4):
+            chunks = list(iter_subscriber_emails(self.article, chunk_size=2))
+        self.assertEqual([len(c) for c in chunks], [2, 2, 1])
+        emails = [e for chunk in chunks for e in chunk]
+        self.assertEqual(emails,
+                         [f'reader{i}@example.com' for i in range(5)])
+
+    def test_journalist_only(self):
+        self.article.publisher = None
+        emails = [e for c in iter_subscriber_emails(self.article) for e in c]
+        self.assertEqual(emails, ['reader1@example.com',
+                                  'reader3@example.com'])
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Minimal in-process SMTP server used as a stand-in relay."""
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 localhost ready')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            verb = line.split(' ')[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'RCPT' and 'refused' in line:
+                self.reply('550 no such user')
+            elif verb == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                    pass
+                server.messages += 1
+                self.reply('250 queued')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class MailDispatcherTestCase(TestCase):
+    """Tests the pooled dispatcher against a local SMTP stand-in."""
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), _SMTPHandler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.messages = 0
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.settings_override = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.server.server_address[1],
+            EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='')
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        metrics.reset()
+
+    def messages(self, *recipients):
+        return [EmailMessage('Subject', 'Body', 'from@example.com', [to])
+                for to in recipients]
+
+    def test_batches_share_pooled_connection(self):
+        dispatcher = MailDispatcher(pool_size=1, batch_size=2)
+        emails = [f'reader{i}@example.com' for i in range(5)]
+        self.assertEqual(dispatcher.send(self.messages(*emails)),
+                         [None] * 5)
+        dispatcher.send(self.messages('late@example.com'))
+        dispatcher.close()
+        self.assertEqual(self.server.messages, 6)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(dispatcher.sent, 6)
+        self.assertEqual(metrics.get('mail_sent'), 6)
+
+    def test_refused_recipient_is_reported(self):
+        dispatcher = MailDispatcher()
+        results = dispatcher.send(
+            self.messages('ok@example.com', 'refused@example.com'))
+        dispatcher.close()
+        self.assertIsNone(results[0])
+        self.assertIsNotNone(results[1])
+        self.assertEqual((dispatcher.sent, dispatcher.failed), (1, 1))
+
+    def test_retries_then_fails_batch(self):
+        self.server.shutdown()
+        self.server.server_close()
+        dispatcher = MailDispatcher(max_retries=2, retry_backoff=0)
+        results = dispatcher.send(self.messages('a@example.com'))
+        self.assertIsNotNone(results[0])
+        self.assertEqual(metrics.get('mail_retries'), 2)
+        self.assertEqual(dispatcher.failed, 1)
+
+    def test_rate_limit_spaces_batches(self):
+        dispatcher = MailDispatcher(batch_size=1, rate_limit=20)
+        started = time.monotonic()
+        dispatcher.send(self.messages('a@example.com', 'b@example.com',
+                                      'c@example.com'))
+        dispatcher.close()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class _TwitterHandler(BaseHTTPRequestHandler):
+    """Mock Twitter endpoint recording posted tweets."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        status, headers = 201, {}
+        if self.server.responses:
+            status, headers = self.server.responses.pop(0)
+        if status == 201:
+            self.server.tweets.append(json.loads(body)['text'])
+        self.server.ports.add(self.client_address[1])
+        reply = b'{"data": {"id": "1"}}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class TwitterClientTestCase(TestCase):
+    """Tests the shared Twitter client against a local mock endpoint."""
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _TwitterHandler)
+        self.server.tweets = []
+        self.server.responses = []
+        self.server.ports = set()
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        tokens = tempfile.NamedTemporaryFile('w', suffix='.json',
+                                             delete=False)
+        json.dump({'oauth_token': 't', 'oauth_token_secret': 's'}, tokens)
+        tokens.close()
+        self.addCleanup(os.unlink, tokens.name)
+        self.settings_override = override_settings(
+            TWITTER_API_URL='http://127.0.0.1:%d' %
+            self.server.server_address[1],
+            TWITTER_TOKEN_FILE=tokens.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        reset_twitter_client()
+        self.addCleanup(reset_twitter_client)
+        self.article = Article.objects.create(title='Tweeted',
+                                              content='Content')
+
+    def test_client_is_shared_and_keeps_alive(self):
+        with patch('news.twitter_api.json.load',
+                   wraps=json.load) as load_tokens:
+            self.assertEqual(get_twitter_client().post_tweet('one'),
+                             'Tweet posted!')
+            self.assertEqual(get_twitter_client().post_tweet('two'),
+                             'Tweet posted!')
+        self.assertEqual(load_tokens.call_count, 1)
+        self.assertIs(get_twitter_client(), get_twitter_client())
+        self.assertEqual(self.server.tweets, ['one', 'two'])
+        self.assertEqual(len(self.server.ports), 1)
+
+    def test_missing_token_is_not_cached_or_prompted(self):
+        token_file = settings.TWITTER_TOKEN_FILE
+        with override_settings(TWITTER_TOKEN_FILE=token_file + '.missing'), \
+                patch('builtins.input', side_effect=AssertionError), \
+                self.assertLogs('news.twitter', 'WARNING') as logs:
+            client = get_twitter_client()
+            self.assertIsNone(client.session)
+            self.assertIsNot(get_twitter_client(), client)
+        self.assertIn('authorize_twitter', logs.output[0])
+        self.assertIsNotNone(get_twitter_client().session)
+
+    def test_announce_merges_items_into_one_tweet(self):
+        reset_tweet_dispatcher()
+        self.addCleanup(reset_tweet_dispatcher)
+        other = Article.objects.create(title='Other', content='Content')
+        self.assertTrue(announce([self.article]))
+        self.assertTrue(announce([self.article, other]))
+        self.assertTrue(self.server.tweets[0].startswith('New Article'))
+        self.assertEqual(self.server.tweets[1],
+                         'New on the site: Tweeted | Other')
+
+    def test_dispatcher_retries_rate_limited_tweet(self):
+        metrics.reset()
+        self.server.responses = [
+            (429, {'x-rate-limit-remaining': '0',
+                   'x-rate-limit-reset': str(int(time.time()))}),
+            (503, {}),
+        ]
+        dispatcher = TweetDispatcher(get_twitter_client, retry_backoff=0)
+        dispatcher.submit('retried')
+        self.assertTrue(dispatcher.flush(5))
+        self.assertEqual(self.server.tweets, ['retried'])
+        self.assertEqual(metrics.get('tweets_retried'), 2)
+        self.assertEqual(metrics.get('tweets_sent'), 1)
+        self.assertEqual(metrics.get('tweet_latency_seconds_count'), 1)
+        self.assertEqual(dispatcher.backlog, 0)
+
+    def test_post_reports_outcome(self):
+        dispatcher = TweetDispatcher(get_twitter_client)
+        self.assertTrue(dispatcher.post('now'))
+        self.server.responses = [(403, {})]
+        self.assertFalse(dispatcher.post('forbidden'))
+        self.server.responses = [(429, {'x-rate-limit-remaining': '0',
+                                        'x-rate-limit-reset':
+                                        str(time.time() + 60)})]
+        with self.assertRaises(RateLimited):
+            dispatcher.post('limited')
+        with self.assertRaises(RateLimited):
+            dispatcher.post('still limited', max_wait=1)
+        self.assertEqual(self.server.tweets, ['now'])
+
+    def test_dispatcher_coalesces_burst(self):
+        dispatcher = TweetDispatcher(get_twitter_client,
+                                     coalesce_window=0.3)
+        for title in ('One', 'Two', 'Three'):
+            dispatcher.submit(f'New Article: {title}', title=title)
+        self.assertTrue(dispatcher.flush(5))
+        self.assertEqual(self.server.tweets,
+                         ['New on the site: One | Two | Three'])
+
+    def test_token_bucket_honours_reset_header(self):
+        bucket = TokenBucket(capacity=5, refill_rate=1)
+        bucket.update_from_headers({'x-rate-limit-remaining': '0',
+                                    'x-rate-limit-reset':
+                                    str(time.time() + 60)})
+        self.assertGreater(bucket.reserve(), 50)
+
+
+class ArticleFeedPaginationTestCase(TestCase):
+    """Tests cursor pagination and streaming of GET /api/articles/."""
+    def setUp(self):
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.reader.subscribed_publishers.add(self.publisher)
+        self.articles = [
+            Article.objects.create(title=f'Article {i}', content='Content',
+                                   publisher=self.publisher, approved=True)
+            for i in range(5)
+        ]
+        self.client.force_authenticate(self.reader)
+
+    def test_pages_follow_cursor(self):
+        seen = []
+        url = '/api/articles/?page_size=2'
+        while True:
+            body = streamed_json(self.client.get(url))
+            self.assertLessEqual(len(body['results']), 2)
+            seen += [item['id'] for item in body['results']]
+            if not body['next']:
+                break
+            url = f'/api/articles/?page_size=2&cursor={body["next"]}'
+        self.assertEqual(seen, [a.id for a in reversed(self.articles)])
+
+    def test_page_size_is_capped(self):
+        with patch('news.pagination.MAX_PAGE_SIZE', 3):
+            body = streamed_json(
+                self.client.get('/api/articles/?page_size=1000'))
+        self.assertEqual(len(body['results']), 3)
+
+    def test_since_returns_newer_items(self):
+        Article.objects.filter(id=self.articles[0].id).update(
+            date=timezone.now() - timezone.timedelta(days=1))
+        since = (timezone.now() - timezone.timedelta(hours=1)).isoformat()
+        body = streamed_json(self.client.get('/api/articles/',
+                                             {'since': since}))
+        self.assertEqual(len(body['results']), 4)
+
+    def test_bad_cursor(self):
+        response = self.client.get('/api/articles/?cursor=!!')
+        self.assertEqual(response.status_code, 400)
+
+    def test_streamed_output_matches_stock_renderers(self):
+        for renderer, stream in ((JSONRenderer(), StreamingJSONRenderer()),
+                                 (XMLRenderer(), StreamingXMLRenderer())):
+            items = [ArticleSerializer(a).data for a in self.articles]
+            expected = renderer.render({'next': 'abc', 'results': items})
+            if isinstance(expected, str):
+                expected = expected.encode()
+            self.assertEqual(
+                b''.join(stream.stream({'next': 'abc'}, iter(items))),
+                expected)
+
+    def test_xml_feed(self):
+        response = self.client.get('/api/articles/',
+                                   HTTP_ACCEPT='application/xml')
+        body = b''.join(response.streaming_content)
+        self.assertTrue(body.startswith(b'<?xml'))
+        self.assertEqual(body.count(b'<list-item>'), 5)
+
+
+class FeedIndexTestCase(TestCase):
+    """Checks with EXPLAIN that the feed query shapes use their indexes."""
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            self.skipTest('EXPLAIN checks cover SQLite and MySQL only')
+        journalists = [
+            CustomUser.objects.create_user(username=f'journalist{i}',
+                                           role='journalist')
+            for i in range(10)
+        ]
+        publishers = Publisher.objects.bulk_create(
+            [Publisher(name=f'Pub {i}') for i in range(20)])
+        for model in (Article, Newsletter):
+            model.objects.bulk_create([
+                model(title=f'Item {i}', content='Content',
+                      publisher=publishers[i % 20],
+                      journalist=journalists[i % 10],
+                      approved=bool(i % 2))
+                for i in range(400)
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_feed_by_publisher(self):
+        for model, prefix in ((Article, 'art'), (Newsletter, 'nl')):
+            self.assertUsesIndex(
+                model.objects.filter(approved=True, publisher_id__in=[1, 2])
+                .order_by('-date'),
+                f'news_{prefix}_pub_appr_date_idx',
+                f'news_{prefix}_pub_date_idx')
+
+    def test_feed_by_journalist(self):
+        for model, prefix in ((Article, 'art'), (Newsletter, 'nl')):
+            self.assertUsesIndex(
+                model.objects.filter(approved=True, journalist_id__in=[1, 2])
+                .order_by('-date'),
+                f'news_{prefix}_jour_appr_date_idx',
+                f'news_{prefix}_jour_date_idx')
+
+    def test_reader_feed(self):
+        for model, prefix in ((Article, 'art'), (Newsletter, 'nl')):
+            plan = model.objects.for_sources([1, 2], [3]) \
+                .order_by('-date').explain()
+            self.assertRegex(plan, f'news_{prefix}_pub_(appr_)?date_idx')
+            self.assertRegex(plan, f'news_{prefix}_jour_(appr_)?date_idx')
+
+    def test_publisher_listing(self):
+        for model, prefix in ((Article, 'art'), (Newsletter, 'nl')):
+            plan = model.objects.filter(publisher_id=1) \
+                .order_by('-date', '-id').explain()
+            self.assertIn(f'news_{prefix}_pub_date_idx', plan)
+            self.assertNotRegex(plan, 'TEMP B-TREE|filesort')
+
+    def test_editor_dashboard(self):
+        if connection.vendor == 'sqlite':
+            # Django renders approved=False as a bare NOT "approved" on
+            # SQLite, which the planner cannot seek on.
+            self.skipTest('boolean-only filters are not seekable on SQLite')
+        for model, prefix in ((Article, 'art'), (Newsletter, 'nl')):
+            self.assertUsesIndex(
+                model.objects.filter(approved=False).order_by('date'),
+                f'news_{prefix}_appr_date_idx')
+
+    def test_journalist_dashboard(self):
+        for model, prefix in ((Article, 'art'), (Newsletter, 'nl')):
+            self.assertUsesIndex(
+                model.objects.filter(journalist_id=1).order_by('-date'),
+                f'news_{prefix}_jour_date_idx')
+
+
+@override_settings(NEWS_MATERIALIZED_FEED=True, NEWS_MAIL_RETRY_BACKOFF=0)
+class MaterializedFeedTestCase(TestCase):
+    """Tests the fan-out-on-write reader timeline."""
+    def setUp(self):
+        reset_dispatcher()
+        self.addCleanup(reset_dispatcher)
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.old = Article.objects.create(
+            title='Old', content='Content', publisher=self.publisher,
+            approved=True
+        )
+
+    def test_subscribing_backfills_reader(self):
+        self.reader.subscribed_publishers.add(self.publisher)
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('article', flat=True)),
+            [self.old.id])
+        self.publisher.subscribers.clear()
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_follow_changes_are_incremental(self):
+        other = Publisher.objects.create(name='Other')
+        by_both = Article.objects.create(
+            title='Both', content='Content', publisher=self.publisher,
+            journalist=self.journalist, approved=True)
+        elsewhere = Article.objects.create(
+            title='Elsewhere', content='Content', publisher=other,
+            approved=True)
+        self.reader.subscribed_publishers.add(self.publisher)
+        self.reader.subscribed_journalists.add(self.journalist)
+        self.journalist.subscribers_journalists.remove(self.reader)
+        # Still reached through its publisher.
+        self.assertEqual(check_reader(self.reader), (set(), set()))
+        self.assertTrue(FeedEntry.objects.filter(article=by_both).exists())
+        with patch('news.feed.rebuild_reader') as rebuild:
+            self.reader.subscribed_publishers.set([other])
+        rebuild.assert_not_called()
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('article', flat=True)),
+            [elsewhere.id])
+        self.reader.subscribed_publishers.clear()
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_bulk_sync_updates_timelines(self):
+        editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor')
+        self.client.force_authenticate(editor)
+        response = self.client.put('/api/subscriptions/', {
+            'client_id': self.reader.id,
+            'publisher_ids': [self.publisher.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(check_reader(self.reader), (set(), set()))
+        self.assertTrue(FeedEntry.objects.exists())
+        self.client.put('/api/subscriptions/', {
+            'client_id': self.reader.id, 'publisher_ids': []},
+            format='json')
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_moving_content_retargets_entries(self):
+        other = Publisher.objects.create(name='Other')
+        follower = CustomUser.objects.create_user(
+            username='follower', password='pass', role='reader')
+        self.reader.subscribed_publishers.add(self.publisher)
+        follower.subscribed_publishers.add(other)
+        article = Article.objects.get(id=self.old.id)
+        article.publisher = other
+        article.save()
+        self.assertEqual(check_reader(self.reader), (set(), set()))
+        self.assertEqual(check_reader(follower), (set(), set()))
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('reader', flat=True)),
+            [follower.id])
+
+    def test_pages_are_read_through_feed_entries(self):
+        for i in range(4):
+            Article.objects.create(title=f'New {i}', content='Content',
+                                   publisher=self.publisher, approved=True)
+        self.reader.subscribed_publishers.add(self.publisher)
+        expected = list(Article.objects.order_by('-date', '-id')
+                        .values_list('id', flat=True))
+        self.client.force_authenticate(self.reader)
+        seen, params = [], {'page_size': 2, 'fields': 'id'}
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                body = streamed_json(
+                    self.client.get('/api/articles/', params))
+            sql = ctx.captured_queries[-1]['sql']
+            self.assertIn('ORDER BY "news_feedentry"."date" DESC, '
+                          '"news_feedentry"."article_id" DESC', sql)
+            seen += [row['id'] for row in body['results']]
+            if not body['next']:
+                break
+            params['cursor'] = body['next']
+        self.assertEqual(seen, expected)
+        timeline = reader_timeline(self.reader, {'page_size': 3})
+        self.assertEqual([item['id'] for item in timeline.items],
+                         expected[:3])
+
+    @patch('news.delivery.announce', return_value=True)
+    def test_approval_fans_out(self, tweet):
+        self.reader.subscribed_journalists.add(self.journalist)
+        newsletter = Newsletter.objects.create(
+            title='Fresh', content='Content', journalist=self.journalist
+        )
+        newsletter.approve()
+        run_pending()
+        self.assertEqual(list(reader_newsletters(self.reader)), [newsletter])
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(
+            len(streamed_json(self.client.get('/api/articles/'))['results']),
+            0)
+
+    def test_check_and_backfill_commands(self):
+        self.reader.subscribed_publishers.add(self.publisher)
+        FeedEntry.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('check_feed', stdout=StringIO())
+        call_command('backfill_feed', stdout=StringIO())
+        self.assertEqual(check_reader(self.reader), (set(), set()))
+        self.assertEqual(list(reader_articles(self.reader)), [self.old])
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'feed-cache-tests'}})
+class FeedCacheTestCase(TestCase):
+    """Tests reader feed caching and its invalidation."""
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.other = Publisher.objects.create(name='OtherPub')
+        self.reader.subscribed_publishers.add(self.publisher)
+        self.article = Article.objects.create(
+            title='Cached', content='Content', publisher=self.publisher,
+            approved=True
+        )
+
+    def home_titles(self):
+        self.client.force_login(self.reader)
+        response = self.client.get('/')
+        return [item['title'] for item in response.context['items']]
+
+    def test_second_load_is_a_hit(self):
+        self.assertEqual(self.home_titles(), ['Cached'])
+        page = get_reader_timeline(self.reader, {})
+        self.assertEqual([item['id'] for item in page.items],
+                         [self.article.id])
+        self.assertEqual(metrics.get('feed_cache_misses'), 1)
+        self.assertEqual(metrics.get('feed_cache_hits'), 1)
+        with self.assertNumQueries(0):
+            get_reader_timeline(self.reader, {})
+
+    def test_edit_and_delete_invalidate(self):
+        self.home_titles()
+        self.client.force_login(self.editor)
+        self.client.post(f'/article/{self.article.id}/edit/', {
+            'title': 'Edited', 'content': 'Content',
+            'publisher': self.publisher.id})
+        self.assertEqual(self.home_titles(), ['Edited'])
+        self.client.force_login(self.editor)
+        self.client.post(f'/article/{self.article.id}/edit/', {
+            'title': 'Moved', 'content': 'Content',
+            'publisher': self.other.id})
+        self.assertEqual(self.home_titles(), [])
+        self.reader.subscribed_publishers.add(self.other)
+        self.assertEqual(self.home_titles(), ['Moved'])
+        self.client.force_login(self.editor)
+        self.client.post(f'/article/{self.article.id}/delete/')
+        self.assertEqual(self.home_titles(), [])
+
+    def test_approval_and_subscription_invalidate(self):
+        self.home_titles()
+        pending = Article.objects.create(
+            title='Pending', content='Content', publisher=self.other
+        )
+        self.client.force_login(self.reader)
+        self.client.post('/subscribe/', {'publishers': [self.publisher.id,
+                                                         self.other.id]})
+        self.assertEqual(self.home_titles(), ['Cached'])
+        pending.approve()
+        self.assertEqual(sorted(self.home_titles()), ['Cached', 'Pending'])
+        self.assertEqual(metrics.get('feed_cache_hits'), 0)
+
+
+@override_settings(NEWS_DASHBOARD_PAGE_SIZE=2)
+class EditorDashboardTestCase(TestCase):
+    """Tests the paginated editor dashboard and approval queue."""
+    def setUp(self):
+        self.editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor'
+        )
+        now = timezone.now()
+        for i in range(5):
+            article = Article.objects.create(title=f'Article {i}',
+                                             content='Body ' * 100)
+            Article.objects.filter(id=article.id).update(
+                date=now - timezone.timedelta(days=10 - i))
+        Newsletter.objects.create(title='Newsletter', content='Body')
+        Newsletter.objects.create(title='Approved', content='Body',
+                                  approved=True)
+        self.client.force_login(self.editor)
+
+    def test_sections_are_paged_and_counted(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/editor/')
+        sections = {s['key']: s for s in response.context['sections']}
+        self.assertEqual(sections['unapproved_articles']['total'], 5)
+        self.assertEqual(sections['approved_newsletters']['total'], 1)
+        self.assertEqual(
+            [i['title'] for i in sections['unapproved_articles']['items']],
+            ['Article 0', 'Article 1'])
+        self.assertFalse(any('"content"' in q['sql']
+                             for q in queries.captured_queries))
+        response = self.client.get('/editor/?unapproved_articles_page=3')
+        sections = {s['key']: s for s in response.context['sections']}
+        self.assertEqual(
+            [i['title'] for i in sections['unapproved_articles']['items']],
+            ['Article 4'])
+
+    def test_query_count_is_constant(self):
+        self.client.get('/editor/')
+        with CaptureQueriesContext(connection) as before:
+            self.client.get('/editor/')
+        Article.objects.bulk_create(
+            [Article(title=f'More {i}', content='Body') for i in range(20)])
+        with self.assertNumQueries(len(before)):
+            self.client.get('/editor/')
+
+    def test_single_section(self):
+        response = self.client.get(
+            '/editor/section/unapproved_newsletters/')
+        self.assertContains(response, 'Newsletter')
+        self.assertNotContains(response, 'Article 0')
+        self.assertEqual(self.client.get(
+            '/editor/section/bogus/').status_code, 404)
+
+    def test_approval_queue_is_oldest_first(self):
+        response = self.client.get('/editor/queue/?page=3')
+        queue = response.context['queue']
+        self.assertEqual([i['title'] for i in queue['items']],
+                         ['Article 4', 'Newsletter'])
+        self.assertIsNone(queue['next_page'])
+
+
+class RolePermissionTestCase(TestCase):
+    """Tests cached role groups and permission provisioning."""
+    def test_groups_are_provisioned(self):
+        for role, codenames in ROLE_PERMISSIONS.items():
+            group = Group.objects.get(name=role_group_name(role))
+            self.assertEqual(
+                set(group.permissions.values_list('codename', flat=True)),
+                set(codenames))
+
+    def test_user_creation_is_constant_queries(self):
+        CustomUser.objects.create_user(username='warm', role='reader')
+        with self.assertNumQueries(2):
+            user = CustomUser.objects.create_user(username='reader',
+                                                  role='reader')
+        self.assertTrue(user.has_perm('news.view_article'))
+        self.assertFalse(user.has_perm('news.change_article'))
+
+    def test_registration_assigns_group_once(self):
+        response = self.client.post('/register/', {
+            'username': 'newjournalist', 'email': 'j@example.com',
+            'password1': 'S3cure-pass!', 'password2': 'S3cure-pass!',
+            'role': 'journalist'})
+        self.assertEqual(response.status_code, 200)
+        user = CustomUser.objects.get(username='newjournalist')
+        self.assertEqual(list(user.groups.values_list('name', flat=True)),
+                         ['Journalists'])
+        self.assertTrue(user.has_perm('news.add_newsletter'))
+
+    def test_recreates_deleted_group(self):
+        self.addCleanup(forget_role_groups)
+        Group.objects.filter(name='Editors').delete()
+        user = CustomUser.objects.create_user(username='editor',
+                                              role='editor')
+        self.assertTrue(user.has_perm('news.delete_article'))
+
+
+class ImportUsersTestCase(TestCase):
+    """Tests the bulk CSV user import command."""
+    def setUp(self):
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        CustomUser.objects.create_user(username='taken', role='reader')
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                             delete=False, newline='')
+        writer = csv.writer(handle)
+        writer.writerow(['username', 'email', 'password', 'role',
+                         'publishers', 'journalists'])
+        for i in range(5):
+            writer.writerow([f'bulk{i}', f'bulk{i}@example.com', 'secret',
+                             'reader', f'{self.publisher.id};999',
+                             self.journalist.id])
+        writer.writerow(['taken', '', 'secret', 'reader', '', ''])
+        writer.writerow(['Taken', '', 'secret', 'reader', '', ''])
+        writer.writerow(['BULK1', '', 'secret', 'reader', '', ''])
+        writer.writerow(['', '', 'secret', 'reader', '', ''])
+        writer.writerow(['baderole', '', 'secret', 'admin', '', ''])
+        writer.writerow(['bulkeditor', '', 'secret', 'editor',
+                         self.publisher.id, ''])
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        self.path = handle.name
+
+    def test_import(self):
+        out = StringIO()
+        call_command('import_users', self.path, '--chunk-size', '2',
+                     '--workers', '0', stdout=out)
+        self.assertIn('Imported 6 user(s), skipped 5', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        reader = CustomUser.objects.get(username='bulk3')
+        self.assertTrue(reader.check_password('secret'))
+        self.assertEqual(list(reader.subscribed_publishers.all()),
+                         [self.publisher])
+        self.assertEqual(list(reader.subscribed_journalists.all()),
+                         [self.journalist])
+        self.assertTrue(reader.has_perm('news.view_article'))
+        editor = CustomUser.objects.get(username='bulkeditor')
+        self.assertFalse(editor.subscribed_publishers.exists())
+        self.assertTrue(editor.has_perm('news.change_article'))
+
+    def test_short_row_has_no_username(self):
+        with open(self.path, 'w', newline='') as f:
+            f.write('email,username\r\nshort@example.com\r\n')
+        out = StringIO()
+        call_command('import_users', self.path, '--workers', '0',
+                     stdout=out)
+        self.assertIn('Imported 0 user(s), skipped 1', out.getvalue())
+
+    def test_import_with_hashing_pool(self):
+        call_command('import_users', self.path, '--workers', '2',
+                     stdout=StringIO())
+        self.assertTrue(CustomUser.objects.get(
+            username='bulk0').check_password('secret'))
+
+
+class RoleChangeTestCase(TestCase):
+    """Tests that role side effects only run when the role changes."""
+    def setUp(self):
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.reader.subscribed_publishers.add(self.publisher)
+        self.editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor'
+        )
+
+    def test_non_reader_save_is_one_statement(self):
+        editor = CustomUser.objects.get(id=self.editor.id)
+        editor.first_name = 'Ed'
+        with self.assertNumQueries(1):
+            editor.save()
+        with self.assertNumQueries(1):
+            update_last_login(None, editor)
+
+    def test_role_change_clears_subscriptions_and_switches_group(self):
+        reader = CustomUser.objects.get(id=self.reader.id)
+        reader.role = 'journalist'
+        reader.save()
+        self.assertFalse(reader.subscribed_publishers.exists())
+        self.assertEqual(list(reader.groups.values_list('name', flat=True)),
+                         ['Journalists'])
+        reader = CustomUser.objects.get(id=self.reader.id)
+        self.assertTrue(reader.has_perm('news.add_article'))
+        self.assertFalse(CustomUser.objects.get(
+            id=self.editor.id).subscribed_publishers.exists())
+
+
+class BulkSubscriptionTestCase(TestCase):
+    """Tests the bulk subscription endpoint's set semantics."""
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor'
+        )
+        self.journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        self.readers = [
+            CustomUser.objects.create_user(
+                username=f'reader{i}', password='pass', role='reader')
+            for i in range(3)
+        ]
+        self.publishers = [Publisher.objects.create(name=f'Pub{i}')
+                           for i in range(3)]
+        self.readers[0].subscribed_publishers.add(self.publishers[0])
+        self.client.force_authenticate(self.editor)
+
+    def sync(self, payload):
+        response = self.client.put('/api/subscriptions/', payload,
+                                   format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def publisher_ids(self, reader):
+        return set(reader.subscribed_publishers.values_list('id', flat=True))
+
+    def test_replaces_subscriptions(self):
+        p0, p1, p2 = (p.id for p in self.publishers)
+        results = self.sync({'subscriptions': [
+            {'client_id': self.readers[0].id, 'publisher_ids': [p1, p2],
+             'journalist_ids': [self.journalist.id]},
+            {'client_id': self.readers[1].id, 'publisher_ids': [p0]},
+        ]})
+        self.assertEqual(results[0]['added_publishers'], [p1, p2])
+        self.assertEqual(results[0]['removed_publishers'], [p0])
+        self.assertEqual(self.publisher_ids(self.readers[0]), {p1, p2})
+        self.assertEqual(self.publisher_ids(self.readers[1]), {p0})
+        self.assertEqual(
+            list(self.readers[0].subscribed_journalists.all()),
+            [self.journalist])
+        # Re-sending the same sets is a no-op.
+        results = self.sync({'client_id': self.readers[1].id,
+                             'publisher_ids': [p0]})
+        self.assertEqual(results[0]['added_publishers'], [])
+        self.assertEqual(results[0]['removed_publishers'], [])
+
+    def test_repeated_client_ends_in_last_state(self):
+        p0, p1, p2 = (p.id for p in self.publishers)
+        reader = self.readers[0]
+        results = self.sync({'subscriptions': [
+            {'client_id': reader.id, 'publisher_ids': [p1]},
+            {'client_id': reader.id, 'publisher_ids': [p0, p2]},
+            {'client_id': reader.id, 'publisher_ids': [p0]},
+        ]})
+        self.assertEqual(self.publisher_ids(reader), {p0})
+        self.assertEqual(results[1]['added_publishers'], [p0, p2])
+        self.assertEqual(results[1]['removed_publishers'], [p1])
+        self.assertEqual(results[2]['removed_publishers'], [p2])
+
+    def test_omitted_kind_is_unchanged(self):
+        self.sync({'client_id': self.readers[0].id,
+                   'journalist_ids': [self.journalist.id]})
+        self.assertEqual(self.publisher_ids(self.readers[0]),
+                         {self.publishers[0].id})
+
+    def test_reports_invalid_ids_and_clients(self):
+        results = self.sync({'subscriptions': [
+            {'client_id': self.readers[0].id,
+             'publisher_ids': [self.publishers[1].id, 9999],
+             'journalist_ids': [self.editor.id]},
+            {'client_id': self.editor.id, 'publisher_ids': []},
+        ]})
+        self.assertEqual(results[0]['invalid_publishers'], [9999])
+        self.assertEqual(results[0]['invalid_journalists'], [self.editor.id])
+        self.assertEqual(results[1]['error'], 'Invalid client')
+        self.assertEqual(self.publisher_ids(self.readers[0]),
+                         {self.publishers[1].id})
+
+    def test_readers_only_change_their_own(self):
+        reader, other = self.readers[:2]
+        self.client.force_authenticate(reader)
+        response = self.client.put('/api/subscriptions/', {'subscriptions': [
+            {'client_id': reader.id, 'publisher_ids': []},
+            {'client_id': other.id, 'publisher_ids': []},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.publisher_ids(reader), {self.publishers[0].id})
+        response = self.client.post('/api/subscribe/', {
+            'client_id': other.id, 'publisher_id': self.publishers[1].id})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.publisher_ids(other), set())
+        self.sync({'client_id': reader.id, 'publisher_ids': []})
+        self.assertEqual(self.publisher_ids(reader), set())
+        self.client.force_authenticate(self.journalist)
+        response = self.client.put('/api/subscriptions/', {
+            'client_id': other.id, 'publisher_ids': []}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_malformed_payload(self):
+        response = self.client.put('/api/subscriptions/',
+                                   {'publisher_ids': ['x']}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_is_independent_of_batch_size(self):
+        def count(readers):
+            payload = {'subscriptions': [
+                {'client_id': r.id,
+                 'publisher_ids': [p.id for p in self.publishers[1:]],
+                 'journalist_ids': [self.journalist.id]}
+                for r in readers
+            ]}
+            with CaptureQueriesContext(connection) as ctx:
+                self.sync(payload)
+            return len(ctx.captured_queries)
+        for reader in self.readers:
+            reader.subscribed_publishers.add(self.publishers[0])
+        self.assertEqual(count(self.readers[:1]), count(self.readers[1:]))
+
+    def test_invalidates_cached_feed(self):
+        Article.objects.create(title='New', content='Content',
+                               publisher=self.publishers[1], approved=True)
+        self.assertEqual(get_reader_timeline(self.readers[0], {}).items, [])
+        self.sync({'client_id': self.readers[0].id,
+                   'publisher_ids': [self.publishers[1].id]})
+        self.assertEqual([item['title'] for item in
+                          get_reader_timeline(self.readers[0], {}).items],
+                         ['New'])
+
+
+class ConditionalFeedTestCase(TestCase):
+    """Tests ETag/Last-Modified handling on the article feeds."""
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.other = Publisher.objects.create(name='OtherPub')
+        self.reader.subscribed_publishers.add(self.publisher)
+        self.article = Article.objects.create(
+            title='Test', content='Content', publisher=self.publisher,
+            approved=True
+        )
+
+    def test_unchanged_feed_is_not_modified_without_queries(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/articles/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/articles/',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(metrics.get('api_not_modified'), 1)
+        response = self.client.get(
+            '/api/articles/',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_content_and_subscriptions(self):
+        self.client.force_authenticate(self.reader)
+        etag = self.client.get('/api/articles/')['ETag']
+        self.article.title = 'Edited'
+        self.article.save()
+        response = self.client.get('/api/articles/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.reader.subscribed_publishers.add(self.other)
+        response = self.client.get('/api/articles/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_varies_by_page_and_format(self):
+        self.client.force_authenticate(self.reader)
+        etags = {self.client.get('/api/articles/')['ETag'],
+                 self.client.get('/api/articles/?page_size=1')['ETag'],
+                 self.client.get('/api/articles/?format=xml')['ETag']}
+        self.assertEqual(len(etags), 3)
+
+    def test_publisher_articles(self):
+        self.client.force_authenticate(self.editor)
+        url = f'/api/articles/publisher/{self.publisher.id}/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Article.objects.create(title='Draft', content='Content',
+                               publisher=self.publisher)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        body = streamed_json(self.client.get(url, {'page_size': 1}))
+        self.assertEqual([r['title'] for r in body['results']], ['Draft'])
+        body = streamed_json(self.client.get(
+            url, {'page_size': 1, 'cursor': body['next']}))
+        self.assertEqual([r['id'] for r in body['results']],
+                         [self.article.id])
+        self.assertIsNone(body['next'])
+        response = self.client.get(url, {'cursor': 'junk'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArticleSummaryTestCase(TestCase):
+    """Tests the summary and field-selection views of article listings."""
+    def setUp(self):
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.reader.subscribed_publishers.add(self.publisher)
+        for i in range(3):
+            Article.objects.create(
+                title=f'Article {i}', content='word ' * 100,
+                publisher=self.publisher, approved=True)
+
+    def assert_body_not_read(self, queries):
+        for query in queries:
+            sql = query['sql']
+            self.assertEqual(sql.count('"content"'),
+                             sql.count('SUBSTR("news_article"."content"'))
+
+    def test_summary_feed(self):
+        self.client.force_authenticate(self.reader)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                '/api/articles/?view=summary&page_size=2')
+            body = streamed_json(response)
+        self.assert_body_not_read(ctx.captured_queries)
+        self.assertEqual(set(body['results'][0]), set(SUMMARY_FIELDS))
+        excerpt = body['results'][0]['excerpt']
+        self.assertTrue(excerpt.endswith('word...'))
+        self.assertLessEqual(len(excerpt), 200)
+        response = self.client.get(
+            f"/api/articles/?view=summary&cursor={body['next']}")
+        self.assertEqual(len(streamed_json(response)['results']), 1)
+
+    def test_field_selection_on_publisher_listing(self):
+        self.client.force_authenticate(self.editor)
+        url = f'/api/articles/publisher/{self.publisher.id}/'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url + '?fields=id,title')
+            body = streamed_json(response)
+        self.assert_body_not_read(ctx.captured_queries)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(list(body['results'][0]), ['id', 'title'])
+        full = streamed_json(self.client.get(url))
+        self.assertEqual(full['results'][0]['content'], 'word ' * 100)
+
+    def test_invalid_options(self):
+        self.client.force_authenticate(self.editor)
+        url = f'/api/articles/publisher/{self.publisher.id}/'
+        self.assertEqual(self.client.get(url + '?view=tiny').status_code,
+                         400)
+        response = self.client.get(url + '?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['fields'])
+
+    def test_make_excerpt(self):
+        self.assertEqual(make_excerpt('short text', 20), 'short text')
+        self.assertEqual(make_excerpt('one two three four', 12), 'one two...')
+
+
+class RowSerializerTestCase(TestCase):
+    """Tests that the values-based serializer matches ArticleSerializer."""
+    def setUp(self):
+        journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        publisher = Publisher.objects.create(name='TestPub')
+        Article.objects.create(title='With journalist', content='<b>&</b>',
+                               publisher=publisher, journalist=journalist,
+                               approved=True)
+        Article.objects.create(title='Unsigned', content='Content',
+                               publisher=publisher)
+
+    def assert_same_output(self):
+        articles = Article.objects.order_by('id')
+        expected = ArticleSerializer(articles, many=True).data
+        fast = RowSerializer(ArticleSerializer())
+        actual = [fast.to_representation(row) for row in fast.rows(articles)]
+        self.assertEqual(JSONRenderer().render(actual),
+                         JSONRenderer().render(expected))
+        self.assertEqual(XMLRenderer().render(actual),
+                         XMLRenderer().render(expected))
+
+    def test_matches_model_serializer(self):
+        self.assert_same_output()
+
+    def test_matches_in_other_timezone(self):
+        with timezone.override('Asia/Kolkata'):
+            self.assert_same_output()
+
+    def test_rejects_computed_fields(self):
+        with self.assertRaises(TypeError):
+            RowSerializer(ArticleListSerializer())
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark', 'serializers', rows=5, stdout=out)
+        self.assertIn('RowSerializer', out.getvalue())
+        self.assertFalse(Article.objects.filter(
+            title__startswith='Article ').exists())
+
+
+class FastRendererTestCase(TestCase):
+    """Tests that the fast renderers match the stock ones byte for byte."""
+    payloads = [
+        None,
+        [],
+        {},
+        {'error': 'Only editors can approve articles'},
+        [{'id': 1, 'title': 'Café <b>&amp;</b> "quotes"',
+          'content': 'line\nbreak\ttab \u2028\u2029 \U0001f4f0 >',
+          'journalist': None, 'approved': True, 'date':
+          '2024-01-02T03:04:05.678901Z'}],
+        {'results': [[1, 2], (3, 'x')], 'nested': {'empty': '', 'n': 0},
+         'when': timezone.now(), 1: False},
+    ]
+
+    def as_bytes(self, value):
+        return value.encode() if isinstance(value, str) else value
+
+    def test_json_matches(self):
+        for data in self.payloads:
+            self.assertEqual(FastJSONRenderer().render(data),
+                             JSONRenderer().render(data))
+        indented = 'application/json; indent=2'
+        self.assertEqual(
+            FastJSONRenderer().render(self.payloads[4], indented),
+            JSONRenderer().render(self.payloads[4], indented))
+
+    def test_xml_matches(self):
+        for data in self.payloads[:-1]:
+            self.assertEqual(FastXMLRenderer().render(data),
+                             XMLRenderer().render(data))
+        with self.assertRaises(UnserializableContentError):
+            FastXMLRenderer().render({'bad': 'bell\x07'})
+
+    def test_streamed_bare_list_matches(self):
+        items = self.payloads[4] * 3
+        for renderer, stream in ((JSONRenderer(), StreamingJSONRenderer()),
+                                 (XMLRenderer(), StreamingXMLRenderer())):
+            self.assertEqual(b''.join(stream.stream(None, iter(items))),
+                             self.as_bytes(renderer.render(items)))
+
+    def test_xml_archive_is_streamed_in_chunks(self):
+        journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        publisher = Publisher.objects.create(name='TestPub')
+        Article.objects.bulk_create(
+            [Article(title=f'Article {i}', content='x' * 1000,
+                     publisher=publisher, journalist=journalist)
+             for i in range(100)])
+        client = APIClient()
+        client.force_authenticate(journalist)
+        response = client.get(f'/api/articles/publisher/{publisher.id}/',
+                              {'page_size': 100},
+                              HTTP_ACCEPT='application/xml')
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks).count(b'<list-item>'), 100)
+
+
+class TokenAuthenticationTestCase(TestCase):
+    """Tests issuing, using and revoking API tokens."""
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        publisher = Publisher.objects.create(name='TestPub')
+        self.reader.subscribed_publishers.add(publisher)
+        Article.objects.create(title='Test', content='Content',
+                               publisher=publisher, approved=True)
+
+    def issue(self):
+        credentials = base64.b64encode(b'reader:pass').decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Basic {credentials}')
+        response = self.client.post('/api/tokens/', {'name': 'phone'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.credentials()
+        return response.json()
+
+    def test_issue_and_use_token(self):
+        issued = self.issue()
+        token = ApiToken.objects.get()
+        self.assertEqual(token.prefix, issued['key'][:8])
+        self.assertNotEqual(token.key_hash, issued['key'])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {issued['key']}")
+        response = self.client.get('/api/articles/')
+        self.assertEqual(len(streamed_json(response)['results']), 1)
+        # Warm token and feed caches: nothing touches the database.
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/articles/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        listed = self.client.get('/api/tokens/').json()
+        self.assertEqual([t['name'] for t in listed], ['phone'])
+        self.assertNotIn('key', listed[0])
+
+    def test_cache_holds_no_user_row(self):
+        key = self.issue()['key']
+        TokenAuthentication().authenticate_credentials(key)
+        self.assertEqual(cache.get(f'news:token:user:{self.reader.id}'),
+                         (True, 'reader'))
+        with self.assertNumQueries(0):
+            user, _ = TokenAuthentication().authenticate_credentials(key)
+            self.assertEqual((user.id, user.role), (self.reader.id, 'reader'))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.username, 'reader')
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(self.client.get('/api/articles/').status_code, 401)
+        request = HttpRequest()
+        request.META['HTTP_AUTHORIZATION'] = b'\xff\xfe key'
+        with self.assertRaises(AuthenticationFailed):
+            TokenAuthentication().authenticate(request)
+
+    def test_revoked_token_and_inactive_user(self):
+        key = self.issue()['key']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {key}')
+        self.assertEqual(self.client.get('/api/articles/').status_code, 200)
+        self.reader.is_active = False
+        self.reader.save()
+        self.assertEqual(self.client.get('/api/articles/').status_code, 401)
+        self.reader.is_active = True
+        self.reader.save()
+        response = self.client.delete(
+            f"/api/tokens/{ApiToken.objects.get().id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/articles/').status_code, 401)
+
+    @override_settings(NEWS_API_VIEW_AUTHENTICATION={'api_articles': [
+        'rest_framework.authentication.SessionAuthentication']})
+    def test_per_view_configuration(self):
+        self.assertEqual(api_authentication('api_articles'),
+                         [SessionAuthentication])
+        self.assertEqual(api_authentication('api_subscribe'),
+                         [TokenAuthentication, BasicAuthentication])
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark', 'auth', rows=3, stdout=out)
+        self.assertIn('TokenAuthentication x3', out.getvalue())
+
+
+class SearchTestCase(TestCase):
+    """Tests ranked full-text search and incremental index updates."""
+    def setUp(self):
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor'
+        )
+        publisher = Publisher.objects.create(name='TestPub')
+        self.title_hit = Article.objects.create(
+            title='Volcano erupts', content='Ash over the island.',
+            publisher=publisher, approved=True)
+        self.body_hit = Article.objects.create(
+            title='Weather', content='Flights resume after the volcano.',
+            publisher=publisher, approved=True)
+        self.draft = Article.objects.create(
+            title='Volcano draft', content='Not approved yet.',
+            publisher=publisher)
+        self.newsletter = Newsletter.objects.create(
+            title='Weekly digest', content='Volcanoes and more volcano news.',
+            publisher=publisher, approved=True)
+
+    def api_search(self, user, query, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/search/', dict(q=query, **params))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def hits(self, user, query, **params):
+        return [(r['type'], r['id'])
+                for r in self.api_search(user, query, **params)['results']]
+
+    def test_ranked_results_without_like(self):
+        with CaptureQueriesContext(connection) as ctx:
+            hits = self.hits(self.reader, 'volcano')
+        self.assertEqual(hits[0], ('article', self.title_hit.id))
+        self.assertCountEqual(hits, [('article', self.title_hit.id),
+                                     ('article', self.body_hit.id),
+                                     ('newsletter', self.newsletter.id)])
+        self.assertFalse(any('LIKE' in q['sql']
+                             for q in ctx.captured_queries))
+
+    def test_unapproved_only_for_editors(self):
+        self.assertNotIn(('article', self.draft.id),
+                         self.hits(self.reader, 'draft volcano'))
+        self.assertEqual(self.hits(self.editor, 'draft volcano'),
+                         [('article', self.draft.id)])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.body_hit.title = 'Airport reopens'
+        self.body_hit.save()
+        self.assertEqual(self.hits(self.reader, 'airport'),
+                         [('article', self.body_hit.id)])
+        self.assertEqual(self.hits(self.reader, 'weather'), [])
+        self.body_hit.delete()
+        self.assertEqual(self.hits(self.reader, 'airport'), [])
+        self.draft.approve()
+        self.assertIn(('article', self.draft.id),
+                      self.hits(self.reader, 'draft'))
+
+    def test_pagination_type_filter_and_syntax(self):
+        first = self.api_search(self.reader, 'volcano', page_size=2)
+        self.assertEqual(first['next_page'], 2)
+        second = self.api_search(self.reader, 'volcano', page_size=2, page=2)
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next_page'])
+        self.assertEqual(self.hits(self.reader, 'volcano', type='newsletter'),
+                         [('newsletter', self.newsletter.id)])
+        self.assertEqual(self.hits(self.reader, '"volcano* (-:'),
+                         self.hits(self.reader, 'volcano'))
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/search/', {'q': 'x', 'type': 'y'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_page_and_rebuild(self):
+        Article.objects.filter(id=self.body_hit.id).update(title='Bulk')
+        self.assertEqual(self.hits(self.reader, 'bulk'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 item(s)', out.getvalue())
+        self.assertEqual(self.hits(self.reader, 'bulk'),
+                         [('article', self.body_hit.id)])
+        self.client.force_login(self.reader)
+        response = self.client.get('/search/', {'q': 'volcano'})
+        self.assertContains(response, 'Volcano erupts')
+        self.assertNotContains(response, 'Volcano draft')
+
+
+class ViewPerformanceTestCase(TestCase):
+    def test_routes_cover_every_url(self):
+        self.assertEqual(perf.url_names(), {r.name for r in perf.ROUTES})
+
+    def test_query_counts_stay_flat(self):
+        small = perf.Scale(3, 2, 3, 10, 4, 10)
+        large = perf.Scale(6, 4, 6, 40, 8, 40)
+        runs = perf.run([small, large], repeat=1)
+        self.assertEqual(len(runs[1]), len(perf.ROUTES) * len(perf.ROLES))
+        self.assertEqual(perf.check(*runs), [])
+        self.assertEqual(CustomUser.objects.count(), 0)
+        statuses = {(r.route, r.role): r.status for r in runs[1]}
+        self.assertEqual(statuses['home', 'reader'], 200)
+        self.assertEqual(statuses['api_articles', 'anonymous'], 401)
+
+    def test_check_reports_growth_and_budget(self):
+        result = perf.Result('home', 'reader', 200, 3, 1.0, 1.0, 1.0)
+        grown = result._replace(queries=4)
+        self.assertEqual(perf.check([result], [result]), [])
+        self.assertIn('grew from 3 to 4',
+                      perf.check([result], [grown])[0])
+        self.assertIn('budget 2',
+                      perf.check([result], [result], default_budget=2)[0])
+
+
+@override_settings(NEWS_REQUEST_SAMPLE_RATE=1)
+class RequestMetricsTestCase(TestCase):
+    """Tests the request instrumentation middleware and /metrics/."""
+    def setUp(self):
+        metrics.reset()
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.reader.subscribed_publishers.add(self.publisher)
+        Article.objects.create(title='Test', content='Content',
+                               publisher=self.publisher, approved=True)
+
+    def traced(self, path, **extra):
+        with self.assertLogs('news.requests', 'INFO') as logs:
+            response = self.client.get(path, **extra)
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.content
+        self.assertEqual(len(logs.records), 1)
+        return json.loads(logs.records[0].getMessage()), content
+
+    def test_sampled_requests_are_traced(self):
+        self.client.force_login(self.reader)
+        trace, content = self.traced('/')
+        self.assertEqual((trace['view'], trace['role'], trace['status']),
+                         ('home', 'reader', 200))
+        self.assertGreater(trace['queries'], 0)
+        self.assertEqual(trace['bytes'], len(content))
+        self.assertEqual(metrics.get('request_queries_sum', view='home'),
+                         trace['queries'])
+
+        self.client.force_authenticate(self.reader)
+        trace, _ = self.traced('/api/tokens/')
+        self.assertEqual(trace['view'], 'api_tokens')
+        self.assertGreater(trace['render_ms'], 0)
+
+        self.client.force_authenticate(self.journalist)
+        trace, content = self.traced(
+            f'/api/articles/publisher/{self.publisher.id}/')
+        self.assertEqual(trace['role'], 'journalist')
+        self.assertEqual(trace['bytes'], len(content))
+        self.assertGreater(trace['queries'], 0)
+
+    @override_settings(NEWS_REQUEST_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_only_timed(self):
+        self.client.force_login(self.reader)
+        with self.assertNoLogs('news.requests'):
+            self.client.get('/')
+            self.client.logout()
+            self.client.get('/register/')
+        self.assertEqual(metrics.get('request_seconds_count', view='home',
+                                     role='reader'), 1)
+        self.assertEqual(metrics.get('request_seconds_count',
+                                     view='register', role='anonymous'), 1)
+        self.assertEqual(metrics.get('request_queries_count', view='home'),
+                         0)
+
+    def test_outbound_calls_are_timed(self):
+        dispatcher = MailDispatcher(
+            backend='django.core.mail.backends.locmem.EmailBackend')
+        dispatcher.send([EmailMessage('Hi', 'Body', 'a@example.com',
+                                      ['b@example.com'])] * 2)
+        self.assertEqual(metrics.get('outbound_seconds_count',
+                                     kind='email'), 2)
+
+    @override_settings(NEWS_REQUEST_SAMPLE_RATE=0)
+    def test_prometheus_endpoint(self):
+        metrics.incr('tweets_sent', 2)
+        metrics.set_value('label', 1, name='say "hi"')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('text/plain', response['Content-Type'])
+        text = response.content.decode()
+        self.assertIn('news_tweets_sent 2.0\n', text)
+        self.assertIn('news_label{name="say \\"hi\\""} 1.0\n', text)
+
+        self.client.force_login(self.reader)
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        self.reader.is_staff = True
+        self.reader.save()
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('news_request_seconds_count{role="anonymous",'
+                      'view="metrics"} 1.0', response.content.decode())
+
+
+    def test_worker_exporter(self):
+        metrics.incr('mail_sent', 3)
+        server = metrics.serve(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with urlopen('http://127.0.0.1:%d/metrics' %
+                     server.server_address[1]) as response:
+            self.assertEqual(response.headers['Content-Type'],
+                             metrics.CONTENT_TYPE)
+            self.assertIn(b'news_mail_sent 3.0\n', response.read())
+        with patch('news.metrics.serve', return_value=server) as serve:
+            call_command('process_deliveries', once=True,
+                         metrics_port=9100, stdout=StringIO())
+        serve.assert_called_once_with(9100, '127.0.0.1')
+
+
+class FeedQueryTestCase(TestCase):
+    """Tests the flat-list reader feed queries."""
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        other = Publisher.objects.create(name='Other')
+        self.reader.subscribed_publishers.add(self.publisher)
+        self.reader.subscribed_journalists.add(self.journalist)
+        self.by_publisher = Article.objects.create(
+            title='Pub', content='Content', publisher=self.publisher,
+            approved=True)
+        self.by_journalist = Article.objects.create(
+            title='Jour', content='Content', publisher=other,
+            journalist=self.journalist, approved=True)
+        Article.objects.create(title='Draft', content='Content',
+                               publisher=self.publisher)
+        Article.objects.create(title='Unrelated', content='Content',
+                               publisher=other, approved=True)
+
+    def test_for_reader_uses_flat_id_lists(self):
+        queryset = Article.objects.for_reader(self.reader)
+        self.assertEqual(set(queryset),
+                         {self.by_publisher, self.by_journalist})
+        self.assertEqual(str(queryset.query).count('SELECT'), 1)
+        self.assertEqual(self.reader.subscription_ids(),
+                         ((self.publisher.id,), (self.journalist.id,)))
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                list(Newsletter.objects.for_reader(
+                    self.reader, ((self.publisher.id,), ()))), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                list(Article.objects.for_sources((), ())), [])
+
+    def test_subscriptions_resolved_once_per_request(self):
+        through_tables = (
+            CustomUser.subscribed_publishers.through._meta.db_table,
+            CustomUser.subscribed_journalists.through._meta.db_table)
+        self.client.force_authenticate(self.reader)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/articles/')
+            self.assertEqual(len(streamed_json(response)['results']), 2)
+        lookups = [q['sql'] for q in ctx.captured_queries
+                   if any(t in q['sql'] for t in through_tables)]
+        self.assertEqual(len(lookups), 2)
+
+        request = HttpRequest()
+        with self.assertNumQueries(0):
+            cache.set(f'news:feed:subs:{self.reader.pk}', ((1,), ()))
+            self.assertEqual(get_subscriptions(self.reader, request),
+                             ((1,), ()))
+            cache.clear()
+            self.assertEqual(get_subscriptions(self.reader, request),
+                             ((1,), ()))
+
+
+class TimelineTestCase(TestCase):
+    """Tests the merged article and newsletter timeline."""
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        publisher = Publisher.objects.create(name='TestPub')
+        other = Publisher.objects.create(name='Other')
+        self.reader.subscribed_publishers.add(publisher)
+        now = timezone.now()
+        # An article and a newsletter share each date, and their ids
+        # overlap, to exercise the (date, kind, id) ordering.
+        for i in range(6):
+            model = Article if i % 2 else Newsletter
+            item = model.objects.create(title=f'Item {i}', content='Body',
+                                        publisher=publisher, approved=True)
+            model.objects.filter(id=item.id).update(
+                date=now - timezone.timedelta(hours=i // 2))
+        Article.objects.create(title='Draft', content='Body',
+                               publisher=publisher)
+        Newsletter.objects.create(title='Other', content='Body',
+                                  publisher=other, approved=True)
+
+    def walk(self, page_size):
+        keys, params = [], {'page_size': page_size}
+        while True:
+            page = reader_timeline(self.reader, params,
+                                   self.reader.subscription_ids())
+            keys += [(item['type'], item['id']) for item in page.items]
+            if not page.next_cursor:
+                return keys
+            params = {'page_size': page_size, 'cursor': page.next_cursor}
+
+    def test_pages_merge_both_kinds_newest_first(self):
+        full = self.walk(10)
+        self.assertEqual([kind for kind, _ in full],
+                         ['newsletter', 'article'] * 3)
+        titles = [Article.objects.get(id=pk).title if kind == 'article'
+                  else Newsletter.objects.get(id=pk).title
+                  for kind, pk in full]
+        self.assertEqual(titles, [f'Item {i}' for i in range(6)])
+        for size in (1, 2, 4):
+            self.assertEqual(self.walk(size), full)
+        subscriptions = self.reader.subscription_ids()
+        with self.assertNumQueries(1):
+            reader_timeline(self.reader, {'page_size': 2}, subscriptions)
+        with self.assertRaises(CursorError):
+            reader_timeline(self.reader, {'cursor': 'bogus'}, subscriptions)
+
+    def test_api_and_home(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/timeline/', {'page_size': 4})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([(r['type'], r['id']) for r in body['results']],
+                         self.walk(10)[:4])
+        self.assertEqual(set(body['results'][0]),
+                         {'type', 'id', 'title', 'date', 'publisher',
+                          'journalist', 'excerpt'})
+        response = self.client.get(
+            '/api/timeline/', {'page_size': 4},
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/timeline/', {'cursor': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_login(self.reader)
+        response = self.client.get('/', {'page_size': 4})
+        self.assertContains(response, 'Older')
+        response = self.client.get('/', {'cursor': body['next']})
+        self.assertEqual(len(response.context['items']), 2)
+        self.assertContains(response, 'Newest')
+
+
+class NewsletterAPITestCase(TestCase):
+    """Tests the newsletter endpoints."""
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.reader = CustomUser.objects.create_user(
+            username='reader', password='pass', role='reader'
+        )
+        self.editor = CustomUser.objects.create_user(
+            username='editor', password='pass', role='editor'
+        )
+        self.journalist = CustomUser.objects.create_user(
+            username='journalist', password='pass', role='journalist'
+        )
+        self.publisher = Publisher.objects.create(name='TestPub')
+        self.reader.subscribed_publishers.add(self.publisher)
+        for i in range(3):
+            self.newsletter = Newsletter.objects.create(
+                title=f'Newsletter {i}', content='word ' * 100,
+                publisher=self.publisher, journalist=self.journalist,
+                approved=True)
+        self.draft = Newsletter.objects.create(
+            title='Draft', content='Body', publisher=self.publisher,
+            journalist=self.journalist)
+
+    def test_reader_feed(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/newsletters/?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        body = streamed_json(response)
+        self.assertEqual([r['title'] for r in body['results']],
+                         ['Newsletter 2', 'Newsletter 1'])
+        self.assertEqual(body['results'][0]['publisher_name'], 'TestPub')
+        self.assertEqual(body['results'][0]['journalist_name'],
+                         'journalist')
+        response = self.client.get('/api/newsletters/?page_size=2',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            f"/api/newsletters/?view=summary&cursor={body['next']}")
+        results = streamed_json(response)['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(set(results[0]), set(SUMMARY_FIELDS))
+        response = self.client.get(
+            '/api/newsletters/?fields=title,publisher_name')
+        self.assertEqual(list(streamed_json(response)['results'][0]),
+                         ['title', 'publisher_name'])
+        self.assertEqual(
+            self.client.get('/api/newsletters/?fields=secret').status_code,
+            400)
+        self.client.force_authenticate(self.editor)
+        self.assertEqual(self.client.get('/api/newsletters/').status_code,
+                         403)
+
+    def test_detail(self):
+        self.client.force_authenticate(self.reader)
+        url = f'/api/newsletters/{self.newsletter.id}/'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['journalist_name'], 'journalist')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.newsletter.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url + '?fields=id,title')
+        self.assertEqual(list(response.json()), ['id', 'title'])
+        response = self.client.get(url + '?view=summary')
+        self.assertEqual(set(response.json()), set(SUMMARY_FIELDS))
+        self.assertTrue(response.json()['excerpt'].endswith('...'))
+        response = self.client.get(url + '?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['fields'])
+        draft_url = f'/api/newsletters/{self.draft.id}/'
+        self.assertEqual(self.client.get(draft_url).status_code, 404)
+        self.client.force_authenticate(self.journalist)
+        self.assertEqual(self.client.get(draft_url).status_code, 200)
+
+    def test_publisher_listing_and_approve(self):
+        self.client.force_authenticate(self.editor)
+        url = f'/api/newsletters/publisher/{self.publisher.id}/'
+        with self.assertNumQueries(1):
+            body = streamed_json(self.client.get(url, {'page_size': 3}))
+        self.assertEqual(len(body['results']), 3)
+        body = streamed_json(self.client.get(url, {'cursor': body['next']}))
+        self.assertEqual([r['title'] for r in body['results']],
+                         ['Newsletter 0'])
+        self.assertIsNone(body['next'])
+        response = self.client.post(
+            f'/api/newsletters/{self.draft.id}/approve/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['approved'])
+        self.assertTrue(DeliveryJob.objects.filter(
+            newsletter=self.draft).exists())
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.post(
+            f'/api/newsletters/{self.draft.id}/approve/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_create(self):
+        data = {'title': 'New', 'content': 'Body',
+                'publisher': self.publisher.id}
+        self.client.force_authenticate(self.reader)
+        response = self.client.post('/api/newsletters/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_authenticate(self.journalist)
+        response = self.client.post('/api/newsletters/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        newsletter = Newsletter.objects.get(id=response.json()['id'])
+        self.assertEqual(newsletter.journalist, self.journalist)
+        self.assertFalse(newsletter.approved)
+
+
+class DeploymentChecksTestCase(TestCase):
+    """Tests the system checks on cache settings."""
+    def test_process_local_feed_cache_warns(self):
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': tempfile.gettempdir()}}):
+            warnings = check_shared_caches(None)
+        self.assertEqual([w.id for w in warnings], ['news.W003'])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': tempfile.gettempdir(),
+                'OPTIONS': {'MAX_ENTRIES': 200000}}}):
+            self.assertEqual(check_shared_caches(None), [])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.'
+                           'LocMemCache'}}):
+            warnings = check_shared_caches(None)
+        self.assertEqual([w.id for w in warnings],
+                         ['news.W001', 'news.W002'])
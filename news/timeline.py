@@ -0,0 +1,109 @@
+"""A reader's articles and newsletters merged into one timeline.
+
+Both tables are read in a single ``UNION ALL`` query ordered newest first
+on ``(date, kind, id)`` and paged with a keyset cursor, so every page is
+one bounded query however large the archive grows. Where the database
+allows ordering and limits inside a compound query (MySQL), each branch
+is also cut to the page size before the merge.
+"""
+import base64
+
+from django.db import connection
+from django.db.models import CharField, Q, Value
+from django.db.models.functions import Substr
+from django.utils.dateparse import parse_datetime
+
+from .feed import reader_articles, reader_newsletters
+from .pagination import CursorError, KeysetPage, get_page_size
+from .pagination import keyset_fields
+from .serializers import EXCERPT_LENGTH, make_excerpt
+
+COLUMNS = ('id', 'title', 'date', 'publisher', 'journalist', 'kind',
+           'excerpt_source')
+
+
+def encode_cursor(date, kind, pk):
+    raw = f"{date.isoformat()}|{kind}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, kind, pk = base64.urlsafe_b64decode(padded).decode() \
+            .split('|')
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise CursorError("Invalid cursor")
+    if date is None or kind not in ('article', 'newsletter'):
+        raise CursorError("Invalid cursor")
+    return date, kind, pk
+
+
+def _after(kind, cursor, date_field='date', id_field='id'):
+    """Condition for ``kind`` rows that sort after ``cursor``."""
+    date, cursor_kind, pk = cursor
+    if kind == cursor_kind:
+        return (Q(**{f'{date_field}__lt': date})
+                | Q(**{date_field: date, f'{id_field}__lt': pk}))
+    if kind < cursor_kind:
+        return Q(**{f'{date_field}__lte': date})
+    return Q(**{f'{date_field}__lt': date})
+
+
+def _branch(queryset, kind, cursor, since, size):
+    date_field, id_field = keyset_fields(queryset)
+    queryset = queryset.order_by()
+    if cursor:
+        queryset = queryset.filter(_after(kind, cursor, date_field,
+                                          id_field))
+    if since:
+        queryset = queryset.filter(**{f'{date_field}__gt': since})
+    queryset = queryset.annotate(
+        kind=Value(kind, output_field=CharField()),
+        excerpt_source=Substr('content', 1, EXCERPT_LENGTH + 1),
+    ).values(*COLUMNS)
+    if connection.features.supports_slicing_ordering_in_compound:
+        queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')[:size]
+    return queryset
+
+
+def reader_timeline(reader, params, subscriptions=None):
+    """Returns one :class:`~news.pagination.KeysetPage` of the timeline.
+
+    ``params`` may hold ``cursor``, ``since`` and ``page_size`` as for
+    :func:`~news.pagination.paginate`. Items are dicts with ``type``,
+    ``id``, ``title``, ``date``, ``publisher``, ``journalist`` and
+    ``excerpt``. Raises :class:`~news.pagination.CursorError` on malformed
+    values.
+    """
+    size = get_page_size(params)
+    cursor = params.get('cursor')
+    cursor = decode_cursor(cursor) if cursor else None
+    since = params.get('since')
+    if since:
+        since = parse_datetime(since)
+        if since is None:
+            raise CursorError("since must be an ISO 8601 datetime")
+    articles = _branch(reader_articles(reader, subscriptions), 'article',
+                       cursor, since, size + 1)
+    newsletters = _branch(reader_newsletters(reader, subscriptions),
+                          'newsletter', cursor, since, size + 1)
+    rows = list(articles.union(newsletters, all=True)
+                .order_by('-date', '-kind', '-id')[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['date'], last['kind'], last['id'])
+    items = [{
+        'type': row['kind'],
+        'id': row['id'],
+        'title': row['title'],
+        'date': row['date'],
+        'publisher': row['publisher'],
+        'journalist': row['journalist'],
+        'excerpt': make_excerpt(row['excerpt_source']),
+    } for row in rows]
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,263 @@
+"""Background, rate-limit-aware posting of announcement tweets.
+
+Callers hand tweets to :meth:`TweetDispatcher.submit`, which returns
+immediately. A single worker thread drains the queue through a token
+bucket that follows Twitter's ``x-rate-limit-*`` headers, retries 429 and
+5xx responses with backoff and can merge a burst of approvals into one
+digest tweet. Progress is reported through :mod:`news.metrics`.
+"""
+import atexit
+import queue
+import threading
+import time
+
+import requests
+
+from . import metrics
+
+TWEET_LENGTH = 280
+
+
+class RateLimited(Exception):
+    """Raised when a tweet would have to wait ``delay`` seconds."""
+
+    def __init__(self, delay):
+        super().__init__(f"Rate limited for {delay:.0f}s")
+        self.delay = delay
+
+
+def digest(titles):
+    """Returns one tweet announcing every title in ``titles``."""
+    text = "New on the site: " + " | ".join(titles)
+    if len(text) > TWEET_LENGTH:
+        text = text[:TWEET_LENGTH - 3] + "..."
+    return text
+
+
+class TokenBucket:
+    """Token bucket that can be resynchronised from rate-limit headers."""
+
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = float(capacity)
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self.tokens = min(self.capacity,
+                          self.tokens + elapsed * self.refill_rate)
+        self._updated = now
+
+    def reserve(self):
+        """Takes a token; returns seconds to wait first (0 if none)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.blocked_until:
+                if now < self.blocked_until:
+                    return self.blocked_until - now
+                # The rate-limit window has reset.
+                self.blocked_until = 0.0
+                self.tokens = float(self.capacity)
+                self._updated = now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.refill_rate
+
+    def acquire(self, max_wait=None):
+        """Blocks until a token is available and takes it.
+
+        Raises :class:`RateLimited` instead of waiting longer than
+        ``max_wait`` seconds in total.
+        """
+        deadline = None
+        if max_wait is not None:
+            deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.reserve()
+            if wait <= 0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimited(wait)
+            time.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """Applies ``x-rate-limit-remaining``/``-reset`` from a response."""
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        with self._lock:
+            if remaining is not None:
+                self.tokens = min(self.capacity, float(remaining))
+            if reset is not None and remaining is not None \
+                    and int(remaining) == 0:
+                delay = max(0.0, float(reset) - time.time())
+                self.blocked_until = time.monotonic() + delay
+                self.tokens = 0.0
+
+
+class _Tweet:
+    def __init__(self, text, title):
+        self.text = text
+        self.title = title or text
+        self.enqueued = time.monotonic()
+
+
+class TweetDispatcher:
+    """Queues tweets and posts them from one background thread.
+
+    ``client_factory`` returns a :class:`~news.twitter_api.TwitterAPI`.
+    With ``coalesce_window`` > 0, tweets submitted within that many
+    seconds of each other are merged into a single digest tweet.
+    """
+
+    def __init__(self, client_factory, bucket_size=50,
+                 refill_rate=50 / 900, max_retries=5, retry_backoff=2.0,
+                 coalesce_window=0):
+        self.client_factory = client_factory
+        self.bucket = TokenBucket(bucket_size, refill_rate)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.coalesce_window = coalesce_window
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='tweet-dispatcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, text, title=None):
+        """Queues ``text`` for posting without waiting for the network."""
+        self._ensure_started()
+        with self._idle:
+            self._pending += 1
+        self._queue.put(_Tweet(text, title))
+        metrics.incr('tweets_queued')
+        metrics.set_value('tweet_backlog', self.backlog)
+
+    @property
+    def backlog(self):
+        """Number of tweets queued or in flight."""
+        with self._idle:
+            return self._pending
+
+    def flush(self, timeout=None):
+        """Waits until the queue is drained; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        if not self.coalesce_window:
+            return batch
+        deadline = time.monotonic() + self.coalesce_window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return batch
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            if len(batch) > 1:
+                metrics.incr('tweets_coalesced', len(batch) - 1)
+                text = digest(t.title for t in batch)
+            else:
+                text = batch[0].text
+            try:
+                self._deliver(text, batch)
+            except Exception:
+                metrics.incr('tweets_failed', len(batch))
+            with self._idle:
+                self._pending -= len(batch)
+                metrics.set_value('tweet_backlog', self._pending)
+                self._idle.notify_all()
+
+    def post(self, text, max_wait=None):
+        """Posts ``text`` now, once; returns True if Twitter accepted it.
+
+        Returns None when there is no authorised client. Raises
+        :class:`RateLimited` on a 429 or rather than wait more than
+        ``max_wait`` seconds for the bucket. Nothing is retried, so
+        callers with their own durable retry schedule, such as the
+        delivery worker, only record a tweet as sent once it was.
+        """
+        client = self.client_factory()
+        if client is None or client.session is None:
+            return None
+        sent, retry, delay = self._attempt(text, max_wait)
+        if retry and delay is not None:
+            raise RateLimited(delay)
+        metrics.incr('tweets_sent' if sent else 'tweets_failed')
+        return sent
+
+    def _attempt(self, text, max_wait=None):
+        # Returns (sent, retry, delay); a None delay means default backoff.
+        client = self.client_factory()
+        if client is None or client.session is None:
+            return False, False, None
+        self.bucket.acquire(max_wait)
+        try:
+            response = client.create_tweet({'text': text})
+        except requests.RequestException:
+            return False, True, None
+        self.bucket.update_from_headers(response.headers)
+        if response.status_code == 201:
+            return True, False, None
+        if response.status_code == 429:
+            reset = response.headers.get('x-rate-limit-reset')
+            delay = None
+            if reset is not None:
+                delay = max(0.0, float(reset) - time.time())
+            return False, True, delay
+        return False, response.status_code >= 500, None
+
+    def _deliver(self, text, batch):
+        attempt = 0
+        while True:
+            sent, retry, delay = self._attempt(text)
+            if sent:
+                now = time.monotonic()
+                metrics.incr('tweets_sent')
+                for tweet in batch:
+                    metrics.observe('tweet_latency_seconds',
+                                    now - tweet.enqueued)
+                return True
+            attempt += 1
+            if not retry or attempt > self.max_retries:
+                metrics.incr('tweets_failed', len(batch))
+                return False
+            metrics.incr('tweets_retried')
+            if delay is None:
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+            time.sleep(delay)
+
+
+def create_dispatcher(client_factory, settings, drain_timeout=30):
+    """Builds a dispatcher from ``NEWS_TWEET_*`` settings.
+
+    The dispatcher is drained for up to ``drain_timeout`` seconds when the
+    process exits, so short-lived worker runs do not drop queued tweets.
+    """
+    dispatcher = TweetDispatcher(
+        client_factory,
+        bucket_size=getattr(settings, 'NEWS_TWEET_BUCKET_SIZE', 50),
+        refill_rate=getattr(settings, 'NEWS_TWEET_REFILL_RATE', 50 / 900),
+        max_retries=getattr(settings, 'NEWS_TWEET_MAX_RETRIES', 5),
+        retry_backoff=getattr(settings, 'NEWS_TWEET_RETRY_BACKOFF', 2.0),
+        coalesce_window=getattr(settings, 'NEWS_TWEET_COALESCE_WINDOW', 0))
+    atexit.register(dispatcher.flush, drain_timeout)
+    return dispatcher
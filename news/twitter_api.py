@@ -1,33 +1,75 @@
 import requests
-import time
+import threading
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth1Session
+from django.conf import settings
 import os
 import json
+import logging
+from .instrumentation import outbound
+from .tweet_dispatcher import create_dispatcher, digest
+
+logger = logging.getLogger('news.twitter')
 
 
 class TwitterAPI:
-    """API for interacting with Twitter (X) for posting tweets."""
+    """API for interacting with Twitter (X) for posting tweets.
+
+    Tokens are loaded once and every call goes through one long-lived
+    OAuth1 session, so keep-alive connections are reused between tweets.
+    Use :func:`get_twitter_client` rather than constructing it per tweet.
+    Only ``interactive`` clients, built by the ``authorize_twitter``
+    command, prompt for a PIN when there is no token file.
+    """
     CONSUMER_KEY = 'CONS_KEY'
     CONSUMER_SECRET = 'CONS_SECRET'
 
-    def __init__(self):
+    def __init__(self, interactive=False):
+        self.interactive = interactive
+        self.api_url = getattr(settings, 'TWITTER_API_URL',
+                               'https://api.twitter.com')
+        self.upload_url = getattr(settings, 'TWITTER_UPLOAD_URL',
+                                  'https://upload.twitter.com')
+        self.timeout = getattr(settings, 'TWITTER_TIMEOUT', 10)
         self.oauth = OAuth1Session(self.CONSUMER_KEY, client_secret=self.CONSUMER_SECRET)
         self.access_token = self._get_access_token()
+        self.session = self._build_session()
+
+    def _build_session(self):
+        if not self.access_token:
+            return None
+        session = OAuth1Session(
+            self.CONSUMER_KEY,
+            client_secret=self.CONSUMER_SECRET,
+            resource_owner_key=self.access_token['oauth_token'],
+            resource_owner_secret=self.access_token['oauth_token_secret']
+        )
+        pool_size = getattr(settings, 'TWITTER_POOL_SIZE', 4)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
 
     def _get_access_token(self):
-        token_file = "twitter_tokens.json"
+        token_file = getattr(settings, 'TWITTER_TOKEN_FILE',
+                             'twitter_tokens.json')
         if os.path.exists(token_file):
             with open(token_file, 'r') as f:
                 return json.load(f)
-        request_token_url = "https://api.twitter.com/oauth/request_token?oauth_callback=oob&x_auth_access_type=write"
+        if not self.interactive:
+            logger.warning("No Twitter token; run manage.py "
+                           "authorize_twitter")
+            return None
+        request_token_url = f"{self.api_url}/oauth/request_token?oauth_callback=oob&x_auth_access_type=write"
         try:
             fetch_response = self.oauth.fetch_request_token(request_token_url)
             resource_owner_key = fetch_response.get("oauth_token")
             resource_owner_secret = fetch_response.get("oauth_token_secret")
-            authorize_url = f"https://api.twitter.com/oauth/authorize?oauth_token={resource_owner_key}"
+            authorize_url = f"{self.api_url}/oauth/authorize?oauth_token={resource_owner_key}"
             print(f"Please authorize: {authorize_url}")
             verifier = input("Enter PIN: ")
-            access_token_url = "https://api.twitter.com/oauth/access_token"
+            access_token_url = f"{self.api_url}/oauth/access_token"
             self.oauth = OAuth1Session(
                 self.CONSUMER_KEY,
                 client_secret=self.CONSUMER_SECRET,
@@ -40,52 +82,112 @@ class TwitterAPI:
                 json.dump(access_token, f)
             return access_token
         except Exception as e:
-            print(f"Error getting access token: {e}")
+            logger.error("Error getting access token: %s", e)
             return None
 
+    def create_tweet(self, payload):
+        """Posts a tweet payload and returns the raw HTTP response."""
+        with outbound('twitter'):
+            return self.session.post(f"{self.api_url}/2/tweets",
+                                     json=payload, timeout=self.timeout)
+
     def post_tweet(self, text, media_url=None):
         """Posts a tweet with optional media."""
-        if not self.access_token:
-            print("No access token available")
+        if not self.session:
+            logger.warning("No access token available")
             return "Authentication failed"
-        oauth = OAuth1Session(
-            self.CONSUMER_KEY,
-            client_secret=self.CONSUMER_SECRET,
-            resource_owner_key=self.access_token['oauth_token'],
-            resource_owner_secret=self.access_token['oauth_token_secret']
-        )
-        tweet_url = "https://api.twitter.com/2/tweets"
         payload = {"text": text}
         if media_url:
-            media_upload_url = "https://upload.twitter.com/1.1/media/upload.json"
-            media_data = requests.get(media_url).content
-            media_response = oauth.post(media_upload_url, files={'media': media_data})
+            media_upload_url = f"{self.upload_url}/1.1/media/upload.json"
+            with outbound('twitter'):
+                media_data = requests.get(media_url,
+                                          timeout=self.timeout).content
+                media_response = self.session.post(
+                    media_upload_url, files={'media': media_data},
+                    timeout=self.timeout)
             if media_response.status_code == 200:
                 media_id = media_response.json()['media_id_string']
                 payload['media'] = {'media_ids': [media_id]}
             else:
-                print(f"Media upload failed: {media_response.text}")
-        response = oauth.post(tweet_url, json=payload)
+                logger.warning("Media upload failed: %s",
+                               media_response.text)
+        response = self.create_tweet(payload)
         if response.status_code == 201:
-            print("Tweet posted successfully")
+            logger.info("Tweet posted successfully")
             return "Tweet posted!"
-        print(f"Tweet failed: {response.status_code} - {response.text}")
+        logger.warning("Tweet failed: %s - %s", response.status_code,
+                       response.text)
         return f"Error: {response.text}"
 
 
-def tweet_new_article(article):
-    twitter = TwitterAPI()
-    text = (
-        f"New Article: {article.title} - "
-        f"{article.content[:100]}..."
-    )
-    return twitter.post_tweet(text)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_twitter_client():
+    """Returns the process-wide :class:`TwitterAPI` client.
+
+    A client without a session is returned but not kept, so tweets work
+    as soon as a token file appears.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            client = TwitterAPI()
+            if client.session is None:
+                return client
+            _client = client
+        return _client
+
+
+def reset_twitter_client():
+    """Drops the shared client so the next call reloads tokens."""
+    global _client
+    with _client_lock:
+        if _client is not None and _client.session is not None:
+            _client.session.close()
+        _client = None
+
+
+_dispatcher = None
+
+
+def get_tweet_dispatcher():
+    """Returns the process-wide background tweet dispatcher."""
+    global _dispatcher
+    with _client_lock:
+        if _dispatcher is None:
+            _dispatcher = create_dispatcher(
+                get_twitter_client, settings,
+                getattr(settings, 'NEWS_TWEET_DRAIN_TIMEOUT', 30))
+        return _dispatcher
+
+
+def reset_tweet_dispatcher():
+    """Drains and drops the shared dispatcher; used by tests."""
+    global _dispatcher
+    with _client_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.flush(5)
+
+
+def _announcement(content):
+    kind = 'Article' if content._meta.model_name == 'article' \
+        else 'Newsletter'
+    return f"New {kind}: {content.title} - {content.content[:100]}..."
+
 
+def announce(contents, max_wait=None):
+    """Tweets ``contents`` now through the shared rate limit.
 
-def tweet_new_newsletter(newsletter):
-    twitter = TwitterAPI()
-    text = (
-        f"New Newsletter: {newsletter.title} - "
-        f"{newsletter.content[:100]}..."
-    )
-    return twitter.post_tweet(text)
+    Several items go out as one digest tweet. Returns True once Twitter
+    has accepted the tweet and None when no token is configured; see
+    :meth:`~news.tweet_dispatcher.TweetDispatcher.post`. Used by the
+    delivery worker, which keeps its jobs open until this succeeds.
+    """
+    if len(contents) == 1:
+        text = _announcement(contents[0])
+    else:
+        text = digest(content.title for content in contents)
+    return get_tweet_dispatcher().post(text, max_wait)
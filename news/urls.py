@@ -15,9 +15,14 @@ urlpatterns = [
          name='create_article'),
     path('editor/', views.editor_dashboard,
          name='editor_dashboard'),
+    path('editor/queue/', views.approval_queue_view,
+         name='approval_queue'),
+    path('editor/section/<str:section>/', views.editor_dashboard_section,
+         name='editor_dashboard_section'),
     path('article/<int:pk>/approve/', views.approve_article,
          name='approve_article'),
     path('subscribe/', views.subscribe, name='subscribe'),
+    path('search/', views.search, name='search'),
     path('article/<int:pk>/edit/', views.edit_article,
          name='edit_article'),
     path('article/<int:pk>/delete/', views.delete_article,
@@ -37,6 +42,23 @@ urlpatterns = [
          name='api_list_publisher_articles'),
     path('api/articles/<int:pk>/approve/', views.api_approve_article,
          name='api_approve_article'),
+    path('api/timeline/', views.api_timeline, name='api_timeline'),
+    path('api/newsletters/', views.api_newsletters,
+         name='api_newsletters'),
+    path('api/newsletters/<int:pk>/', views.api_newsletter_detail,
+         name='api_newsletter_detail'),
+    path('api/newsletters/publisher/<int:pk>/',
+         views.api_list_publisher_newsletters,
+         name='api_list_publisher_newsletters'),
+    path('api/newsletters/<int:pk>/approve/', views.api_approve_newsletter,
+         name='api_approve_newsletter'),
     path('api/subscribe/', views.api_subscribe,
          name='api_subscribe'),
+    path('api/subscriptions/', views.api_bulk_subscribe,
+         name='api_bulk_subscribe'),
+    path('api/search/', views.api_search, name='api_search'),
+    path('api/tokens/', views.api_tokens, name='api_tokens'),
+    path('api/tokens/<int:pk>/', views.api_revoke_token,
+         name='api_revoke_token'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
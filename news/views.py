@@ -1,20 +1,37 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.http import HttpResponse
-from .models import CustomUser, Publisher, Article, Newsletter
+from .models import CustomUser, Publisher, Article, Newsletter, ApiToken
 from .forms import RegistrationForm, LoginForm, ArticleForm
 from .forms import NewsletterForm, SubscriptionForm
-from .twitter_api import tweet_new_article
+from rest_framework import serializers
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, authentication_classes
 from rest_framework.decorators import permission_classes, renderer_classes
-from rest_framework.authentication import BasicAuthentication
-from rest_framework.renderers import JSONRenderer
-from rest_framework_xml.renderers import XMLRenderer
-from django.db.models import Q
+from . import metrics
+from .authentication import api_authentication
 from .serializers import ArticleSerializer, ApproveArticleSerializer
+from .serializers import SubscriptionSyncSerializer, article_listing
+from .serializers import ApiTokenSerializer, SearchResultSerializer
+from .serializers import RowSerializer, TimelineItemSerializer
+from .serializers import NewsletterSerializer, newsletter_listing
+from .serializers import NewsletterListSerializer, selected_fields
+from .serializers import with_excerpt
+from .conditional import add_validators, not_modified, validators
+from .dashboard import SECTIONS, approval_queue, load_section
+from .dashboard import section_counts
+from .feed import reader_articles, reader_newsletters
+from .feed_cache import content_state, feed_state, get_reader_timeline
+from .feed_cache import get_subscriptions, publisher_state
+from .pagination import CursorError, get_page_size, paginate
+from .renderers import FastJSONRenderer, FastXMLRenderer
+from .renderers import StreamingJSONRenderer, StreamingXMLRenderer
+from .renderers import streaming_response
+from .search import search as search_content
+from .subscriptions import sync_subscriptions
 
 
 def register(request):
@@ -56,16 +73,13 @@ def logout_view(request):
 def home(request):
     """Role-based home dashboard view."""
     if request.user.role == 'reader':
-        articles = Article.objects.filter(approved=True).filter(
-            Q(publisher__in=request.user.subscribed_publishers.all()) |
-            Q(journalist__in=request.user.subscribed_journalists.all())
-        )
-        newsletters = Newsletter.objects.filter(approved=True).filter(
-            Q(publisher__in=request.user.subscribed_publishers.all()) |
-            Q(journalist__in=request.user.subscribed_journalists.all())
-        )
+        try:
+            page = get_reader_timeline(request.user, request.GET, request)
+        except CursorError:
+            return HttpResponse("Invalid cursor", status=400)
         return render(request, 'reader_home.html',
-                      {'articles': articles, 'newsletters': newsletters})
+                      {'items': page.items, 'next_cursor': page.next_cursor,
+                       'paged': bool(request.GET.get('cursor'))})
     elif request.user.role == 'journalist':
         return redirect('journalist_dashboard')
     elif request.user.role == 'editor':
@@ -73,6 +87,34 @@ def home(request):
     return HttpResponse("Invalid role", status=400)
 
 
+def _search_page(request, size=None):
+    """Runs the search described by ``request``'s query parameters."""
+    params = request.GET
+    kind = params.get('type') or None
+    try:
+        page = int(params.get('page', 1))
+    except ValueError:
+        page = 1
+    return search_content(params.get('q', ''),
+                          include_unapproved=request.user.role == 'editor',
+                          kind=kind, page=page, size=size)
+
+
+@login_required
+def search(request):
+    """Ranked full-text search over articles and newsletters.
+
+    Editors also see unapproved content.
+    """
+    try:
+        results = _search_page(request)
+    except ValueError:
+        return HttpResponse("Invalid type", status=400)
+    return render(request, 'search.html',
+                  {'query': request.GET.get('q', ''), 'results': results,
+                   'type': request.GET.get('type', '')})
+
+
 @login_required
 def journalist_dashboard(request):
     if request.user.role != 'journalist':
@@ -85,20 +127,41 @@ def journalist_dashboard(request):
 
 @login_required
 def editor_dashboard(request):
+    """Editor dashboard; each section pages with ``<section>_page``."""
+    if request.user.role != 'editor':
+        return HttpResponse("Unauthorized", status=403)
+    counts = section_counts()
+    sections = [
+        load_section(key, request.GET.get(f'{key}_page'), counts[key])
+        for key in SECTIONS
+    ]
+    return render(request, 'editor_dashboard.html', {'sections': sections})
+
+
+@login_required
+def editor_dashboard_section(request, section):
+    """Renders one dashboard section on its own, e.g. for lazy loading."""
     if request.user.role != 'editor':
         return HttpResponse("Unauthorized", status=403)
-    unapproved_articles = Article.objects.filter(approved=False)
-    approved_articles = Article.objects.filter(approved=True)
-    unapproved_newsletters = Newsletter.objects.filter(approved=False)
-    approved_newsletters = Newsletter.objects.filter(approved=True)
-    return render(request, 'editor_dashboard.html', {
-        'unapproved_articles': unapproved_articles,
-        'approved_articles': approved_articles,
-        'unapproved_newsletters': unapproved_newsletters,
-        'approved_newsletters': approved_newsletters
+    if section not in SECTIONS:
+        return HttpResponse("Unknown section", status=404)
+    model, approved, _ = SECTIONS[section]
+    total = model.objects.filter(approved=approved).count()
+    return render(request, 'editor_dashboard_section.html', {
+        'section': load_section(section,
+                                request.GET.get(f'{section}_page'), total)
     })
 
 
+@login_required
+def approval_queue_view(request):
+    """Unapproved articles and newsletters together, oldest first."""
+    if request.user.role != 'editor':
+        return HttpResponse("Unauthorized", status=403)
+    return render(request, 'approval_queue.html',
+                  {'queue': approval_queue(request.GET.get('page'))})
+
+
 @login_required
 def subscribe(request):
     if request.user.role != 'reader':
@@ -191,7 +254,7 @@ def approve_article(request, pk):
         return HttpResponse("Unauthorized", status=403)
     article = get_object_or_404(Article, pk=pk)
     try:
-        article.approve()  # Triggers email/tweet
+        article.approve()  # Queues email/tweet delivery
         return redirect('editor_dashboard')
     except Exception as e:
         return HttpResponse(f"Error approving: {e}", status=500)
@@ -273,9 +336,17 @@ def approve_newsletter(request, pk):
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
-@authentication_classes([BasicAuthentication])
-@renderer_classes((JSONRenderer, XMLRenderer))
+@authentication_classes(api_authentication('api_articles'))
+@renderer_classes((StreamingJSONRenderer, StreamingXMLRenderer))
 def api_articles(request):
+    """Lists a reader's feed page by page, or creates an article.
+
+    GET accepts ``cursor``, ``since`` and ``page_size`` and returns
+    ``{"next": <cursor>, "results": [...]}`` newest first, with ETag and
+    Last-Modified headers; a matching conditional request gets a 304.
+    ``view=summary`` or ``fields=`` trims each article, see
+    :func:`~news.serializers.article_listing`.
+    """
     if request.method == 'GET':
         user = request.user
         client_id = request.query_params.get('client_id')
@@ -286,12 +357,25 @@ def api_articles(request):
             client = user if user.role == 'reader' else None
         if not client:
             return Response({"error": "Invalid client"}, status=403)
-        articles = Article.objects.filter(approved=True).filter(
-            Q(publisher__in=client.subscribed_publishers.all()) |
-            Q(journalist__in=client.subscribed_journalists.all())
-        )
-        serializer = ArticleSerializer(articles, many=True)
-        return Response(serializer.data)
+        etag, last_modified = validators(request,
+                                         feed_state(client, request))
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        try:
+            subscriptions = get_subscriptions(client, request)
+            articles, serializer = article_listing(
+                reader_articles(client, subscriptions), request.query_params)
+            page = paginate(articles, request.query_params)
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=400)
+        except CursorError as e:
+            return Response({"error": str(e)}, status=400)
+        items = (serializer.to_representation(article)
+                 for article in page.items)
+        response = streaming_response(request, {'next': page.next_cursor},
+                                      items)
+        return add_validators(response, etag, last_modified)
     elif request.method == 'POST':
         if request.user.role != 'journalist':
             return Response({"error":
@@ -300,29 +384,81 @@ def api_articles(request):
         serializer = ArticleSerializer(data=request.data,
                                        context={'request': request})
         if serializer.is_valid():
-            article = serializer.save()
-            tweet_new_article(article)
+            serializer.save()
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-@authentication_classes([BasicAuthentication])
-@renderer_classes((JSONRenderer, XMLRenderer))
+@authentication_classes(api_authentication('api_timeline'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
+def api_timeline(request):
+    """A reader's articles and newsletters merged, newest first.
+
+    Takes ``client_id`` like ``api_articles`` plus ``cursor``, ``since``
+    and ``page_size``; returns ``{"next": <cursor>, "results": [...]}``
+    with ETag and Last-Modified headers.
+    """
+    client_id = request.query_params.get('client_id')
+    if client_id:
+        client = get_object_or_404(CustomUser, id=client_id, role='reader')
+    elif request.user.role == 'reader':
+        client = request.user
+    else:
+        return Response({"error": "Invalid client"}, status=403)
+    etag, last_modified = validators(request, feed_state(client, request))
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    try:
+        page = get_reader_timeline(client, request.query_params, request)
+    except CursorError as e:
+        return Response({"error": str(e)}, status=400)
+    serializer = RowSerializer(TimelineItemSerializer())
+    response = Response({
+        'next': page.next_cursor,
+        'results': [serializer.to_representation(item)
+                    for item in page.items],
+    })
+    return add_validators(response, etag, last_modified)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(api_authentication('api_list_publisher_articles'))
+@renderer_classes((StreamingJSONRenderer, StreamingXMLRenderer))
 def api_list_publisher_articles(request, pk):
+    """Pages through a publisher's articles, drafts included.
+
+    Takes the paging and ``view``/``fields`` options of ``api_articles``.
+    """
     if request.user.role not in ['editor', 'journalist']:
         return Response({"error": "Only editors and journalists"},
                         status=403)
-    articles = Article.objects.filter(publisher_id=pk)
-    serializer = ArticleSerializer(articles, many=True)
-    return Response(serializer.data)
+    etag, last_modified = validators(request, publisher_state(pk))
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    try:
+        articles, serializer = article_listing(
+            Article.objects.filter(publisher_id=pk), request.query_params)
+        page = paginate(articles, request.query_params)
+    except serializers.ValidationError as e:
+        return Response(e.detail, status=400)
+    except CursorError as e:
+        return Response({"error": str(e)}, status=400)
+    items = (serializer.to_representation(article)
+             for article in page.items)
+    response = streaming_response(request, {'next': page.next_cursor},
+                                  items)
+    return add_validators(response, etag, last_modified)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-@authentication_classes([BasicAuthentication])
-@renderer_classes((JSONRenderer, XMLRenderer))
+@authentication_classes(api_authentication('api_approve_article'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
 def api_approve_article(request, pk):
     if request.user.role != 'editor':
         return Response({"error":
@@ -339,10 +475,151 @@ def api_approve_article(request, pk):
     return Response(serializer.errors, status=400)
 
 
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(api_authentication('api_newsletters'))
+@renderer_classes((StreamingJSONRenderer, StreamingXMLRenderer))
+def api_newsletters(request):
+    """Lists a reader's newsletters page by page, or creates one.
+
+    Takes the same ``client_id``, paging and ``view``/``fields`` options
+    as ``api_articles``, see :func:`~news.serializers.newsletter_listing`.
+    """
+    if request.method == 'GET':
+        client_id = request.query_params.get('client_id')
+        if client_id:
+            client = get_object_or_404(CustomUser,
+                                       id=client_id, role='reader')
+        elif request.user.role == 'reader':
+            client = request.user
+        else:
+            return Response({"error": "Invalid client"}, status=403)
+        etag, last_modified = validators(request,
+                                         feed_state(client, request))
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        try:
+            subscriptions = get_subscriptions(client, request)
+            newsletters, serializer = newsletter_listing(
+                reader_newsletters(client, subscriptions),
+                request.query_params)
+            page = paginate(newsletters, request.query_params)
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=400)
+        except CursorError as e:
+            return Response({"error": str(e)}, status=400)
+        items = (serializer.to_representation(newsletter)
+                 for newsletter in page.items)
+        response = streaming_response(request, {'next': page.next_cursor},
+                                      items)
+        return add_validators(response, etag, last_modified)
+    if request.user.role != 'journalist':
+        return Response({"error": "Only journalists can create newsletters"},
+                        status=403)
+    serializer = NewsletterSerializer(data=request.data,
+                                      context={'request': request})
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data, status=201)
+    return Response(serializer.errors, status=400)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(api_authentication('api_newsletter_detail'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
+def api_newsletter_detail(request, pk):
+    """Returns one newsletter with ETag and Last-Modified headers.
+
+    Drafts are only shown to editors and their journalist. ``view`` and
+    ``fields`` trim the result as for the listings.
+    """
+    etag, last_modified = validators(request,
+                                     content_state('newsletter', pk))
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    try:
+        fields = selected_fields(request.query_params,
+                                 NewsletterListSerializer)
+    except serializers.ValidationError as e:
+        return Response(e.detail, status=400)
+    newsletters = Newsletter.objects.select_related('publisher',
+                                                    'journalist')
+    if fields is not None and 'excerpt' in fields:
+        newsletters = with_excerpt(newsletters)
+    newsletter = get_object_or_404(newsletters, pk=pk)
+    user = request.user
+    if not (newsletter.approved or user.role == 'editor'
+            or newsletter.journalist_id == user.id):
+        return Response({"error": "Not found"}, status=404)
+    if fields is None:
+        serializer = NewsletterSerializer(newsletter)
+    else:
+        serializer = NewsletterListSerializer(newsletter, fields=fields)
+    return add_validators(Response(serializer.data), etag, last_modified)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(
+    api_authentication('api_list_publisher_newsletters'))
+@renderer_classes((StreamingJSONRenderer, StreamingXMLRenderer))
+def api_list_publisher_newsletters(request, pk):
+    """Pages through a publisher's newsletters, drafts included.
+
+    Takes the paging and ``view``/``fields`` options of
+    ``api_newsletters``.
+    """
+    if request.user.role not in ['editor', 'journalist']:
+        return Response({"error": "Only editors and journalists"},
+                        status=403)
+    etag, last_modified = validators(request, publisher_state(pk))
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    try:
+        newsletters, serializer = newsletter_listing(
+            Newsletter.objects.filter(publisher_id=pk), request.query_params)
+        page = paginate(newsletters, request.query_params)
+    except serializers.ValidationError as e:
+        return Response(e.detail, status=400)
+    except CursorError as e:
+        return Response({"error": str(e)}, status=400)
+    items = (serializer.to_representation(newsletter)
+             for newsletter in page.items)
+    response = streaming_response(request, {'next': page.next_cursor},
+                                  items)
+    return add_validators(response, etag, last_modified)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(api_authentication('api_approve_newsletter'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
+def api_approve_newsletter(request, pk):
+    if request.user.role != 'editor':
+        return Response({"error": "Only editors can approve newsletters"},
+                        status=403)
+    newsletter = get_object_or_404(
+        Newsletter.objects.select_related('publisher', 'journalist'), pk=pk)
+    newsletter.approve()
+    return Response(NewsletterSerializer(newsletter).data, status=200)
+
+
+SUBSCRIPTIONS_FORBIDDEN = "Readers can only change their own subscriptions"
+
+
+def _manages_subscriptions(user, client_ids):
+    """Editors may change anyone's subscriptions, readers only their own."""
+    return user.role == 'editor' or set(client_ids) <= {user.id}
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-@authentication_classes([BasicAuthentication])
-@renderer_classes((JSONRenderer, XMLRenderer))
+@authentication_classes(api_authentication('api_subscribe'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
 def api_subscribe(request):
     client_id = request.data.get('client_id')
     publisher_id = request.data.get('publisher_id')
@@ -350,6 +627,8 @@ def api_subscribe(request):
     if not client_id:
         return Response({"error": "client_id required"}, status=400)
     client = get_object_or_404(CustomUser, id=client_id, role='reader')
+    if not _manages_subscriptions(request.user, {client.id}):
+        return Response({"error": SUBSCRIPTIONS_FORBIDDEN}, status=403)
     if publisher_id:
         publisher = get_object_or_404(Publisher, id=publisher_id)
         client.subscribed_publishers.add(publisher)
@@ -358,3 +637,96 @@ def api_subscribe(request):
                                        role='journalist')
         client.subscribed_journalists.add(journalist)
     return Response({"success": "Subscribed"}, status=200)
+
+
+@api_view(['PUT', 'POST'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(api_authentication('api_bulk_subscribe'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
+def api_bulk_subscribe(request):
+    """Sets the subscriptions of one or more readers in a single request.
+
+    Accepts ``{"subscriptions": [...]}`` or a single item. Each item's
+    ``publisher_ids``/``journalist_ids`` replace that reader's current
+    subscriptions; an omitted list is left unchanged. Readers may only
+    send their own id; editors may update anyone.
+    """
+    data = request.data
+    many = isinstance(data, dict) and 'subscriptions' in data
+    serializer = SubscriptionSyncSerializer(
+        data=data['subscriptions'] if many else data, many=many)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    items = serializer.validated_data if many \
+        else [serializer.validated_data]
+    if not _manages_subscriptions(request.user,
+                                  {item['client_id'] for item in items}):
+        return Response({"error": SUBSCRIPTIONS_FORBIDDEN}, status=403)
+    return Response({"results": sync_subscriptions(items)}, status=200)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(api_authentication('api_tokens'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
+def api_tokens(request):
+    """Lists the caller's API tokens, or issues a new one.
+
+    The key of a new token is only returned in the POST response.
+    """
+    if request.method == 'POST':
+        serializer = ApiTokenSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        token, key = ApiToken.issue(request.user,
+                                    serializer.validated_data.get('name', ''))
+        return Response(dict(ApiTokenSerializer(token).data, key=key),
+                        status=201)
+    tokens = ApiToken.objects.filter(user=request.user).order_by('id')
+    return Response(ApiTokenSerializer(tokens, many=True).data)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(api_authentication('api_revoke_token'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
+def api_revoke_token(request, pk):
+    token = get_object_or_404(ApiToken, pk=pk, user=request.user)
+    token.delete()
+    return Response(status=204)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@authentication_classes(api_authentication('api_search'))
+@renderer_classes((FastJSONRenderer, FastXMLRenderer))
+def api_search(request):
+    """Ranked search; takes ``q``, ``type``, ``page`` and ``page_size``.
+
+    Returns ``{"page", "next_page", "results": [...]}``, best match first.
+    """
+    try:
+        results = _search_page(request, get_page_size(request.query_params))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    serializer = RowSerializer(SearchResultSerializer())
+    return Response({
+        'page': results['page'],
+        'next_page': results['next_page'],
+        'results': [serializer.to_representation(item)
+                    for item in results['items']],
+    })
+
+
+def metrics_view(request):
+    """Serves the app's counters in the Prometheus text format.
+
+    Open to staff users and to ``NEWS_METRICS_ALLOWED_IPS``.
+    """
+    allowed = getattr(settings, 'NEWS_METRICS_ALLOWED_IPS',
+                      ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed \
+            and not request.user.is_staff:
+        return HttpResponse("Unauthorized", status=403)
+    return HttpResponse(metrics.render_prometheus(),
+                        content_type=metrics.CONTENT_TYPE)
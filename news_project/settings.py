@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'news.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -141,12 +142,113 @@ DEFAULT_FROM_EMAIL = 'rahulvenkateswaran12@gmail.com'
 
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
+# Subscriber delivery outbox, drained by `manage.py process_deliveries`
+NEWS_DELIVERY_BATCH_SIZE = 100
+NEWS_DELIVERY_MAX_ATTEMPTS = 5
+NEWS_DELIVERY_RETRY_DELAY = 60  # seconds, doubled on every attempt
+NEWS_DELIVERY_LEASE = 300  # seconds before a stuck job is reclaimed
+
+# Fan approved content out into per-reader FeedEntry rows (see news/feed.py).
+# Run `manage.py backfill_feed` after enabling it.
+NEWS_MATERIALIZED_FEED = False
+
+# Reader feed cache (see news/feed_cache.py). It must be shared by every
+# web and delivery worker process so invalidation reaches all of them. The
+# file cache only suits development on one host: it holds a version key per
+# reader, publisher, journalist, article and newsletter plus cached pages
+# and tokens, and culls a third of them whenever MAX_ENTRIES is reached.
+# Use Redis or Memcached in production.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 200000},
+    }
+}
+NEWS_FEED_CACHE_ALIAS = 'default'
+NEWS_FEED_CACHE_TIMEOUT = 300  # seconds
+NEWS_FEED_VERSION_TIMEOUT = 86400  # seconds
+
+# Pooled notification mail dispatcher (see news/mail.py)
+NEWS_MAIL_DISPATCHER = 'news.mail.MailDispatcher'
+NEWS_MAIL_POOL_SIZE = 2
+NEWS_MAIL_BATCH_SIZE = 100
+NEWS_MAIL_RATE_LIMIT = None  # messages per second, None for unlimited
+NEWS_MAIL_MAX_RETRIES = 3
+NEWS_MAIL_RETRY_BACKOFF = 1.0  # seconds, doubled on every retry
+
+# Shared Twitter (X) client (see news/twitter_api.py)
+TWITTER_API_URL = 'https://api.twitter.com'
+TWITTER_UPLOAD_URL = 'https://upload.twitter.com'
+TWITTER_TOKEN_FILE = 'twitter_tokens.json'
+TWITTER_POOL_SIZE = 4
+TWITTER_TIMEOUT = 10  # seconds per HTTP call
+
+# Background tweet dispatcher (see news/tweet_dispatcher.py)
+NEWS_TWEET_BUCKET_SIZE = 50
+NEWS_TWEET_REFILL_RATE = 50 / 900  # tokens per second
+NEWS_TWEET_MAX_RETRIES = 5
+NEWS_TWEET_RETRY_BACKOFF = 2.0  # seconds, doubled on every retry
+# Seconds approvals wait to share one digest tweet; 0 tweets each separately
+NEWS_TWEET_COALESCE_WINDOW = 0
+NEWS_TWEET_DRAIN_TIMEOUT = 30  # seconds to flush the queue at exit
+
+# Cursor pagination for API feeds (see news/pagination.py)
+NEWS_API_PAGE_SIZE = 50
+NEWS_API_MAX_PAGE_SIZE = 200
+
+# API authentication classes, by default and per view name
+# (see news/authentication.py)
+NEWS_API_AUTHENTICATION = [
+    'news.authentication.TokenAuthentication',
+    'rest_framework.authentication.BasicAuthentication',
+]
+NEWS_API_VIEW_AUTHENTICATION = {}
+# Token lookups are cached in a shared cache so revoking a token or
+# deactivating a user takes effect in every worker at once.
+NEWS_API_TOKEN_CACHE_ALIAS = 'default'
+NEWS_API_TOKEN_CACHE_TIMEOUT = 300
+
+# Characters of body text in ?view=summary listings
+NEWS_EXCERPT_LENGTH = 200
+
+# Results per search page (see news/search.py)
+NEWS_SEARCH_PAGE_SIZE = 20
+
+# Items per editor dashboard section page
+NEWS_DASHBOARD_PAGE_SIZE = 25
+
+# Request instrumentation (see news/instrumentation.py): share of requests
+# traced and logged in detail, and who may read /metrics/ besides staff
+NEWS_REQUEST_SAMPLE_RATE = 0.01
+NEWS_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'news': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'news.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework_xml.renderers.XMLRenderer',
+        'news.renderers.FastJSONRenderer',
+        'news.renderers.FastXMLRenderer',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'news.authentication.TokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (